@@ -0,0 +1,3 @@
+"""
+性能基准测试模块：模拟设备与基准测试运行器，无需真实模拟器
+"""
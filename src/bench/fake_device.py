@@ -0,0 +1,546 @@
+import re
+import shlex
+import base64
+import struct
+import time
+import random
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+from xml.sax.saxutils import quoteattr
+import numpy as np
+import cv2
+from PIL import Image
+from uiautomator2 import ShellResponse
+
+WECHAT_PACKAGE = "com.tencent.mm"
+LAUNCHER_PACKAGE = "com.android.launcher3"
+
+
+@dataclass
+class FakeNode:
+    """模拟界面上的一个节点，bounds为相对屏幕尺寸的比例 (x1, y1, x2, y2)"""
+    text: str
+    bounds: Tuple[float, float, float, float]
+    class_name: str = "android.widget.TextView"
+    target: Optional[str] = None  # 点击后跳转到的页面
+    resource_id: str = ""
+    clickable: bool = True
+    focused: bool = False
+
+
+@dataclass
+class FakeScreen:
+    """模拟的一个页面"""
+    name: str
+    activity: str
+    nodes: List[FakeNode]
+    package: str = WECHAT_PACKAGE
+    back: Optional[str] = None  # 按返回键后跳转到的页面
+    enter: Optional[str] = None  # 按回车（输入法的搜索键）后跳转到的页面
+    color: Tuple[int, int, int] = (240, 240, 240)  # 截图底色 (B, G, R)
+
+
+def _tabs() -> List[FakeNode]:
+    """微信底部导航栏"""
+    return [
+        FakeNode("微信", (0.00, 0.93, 0.25, 1.0), target="wechat_main"),
+        FakeNode("通讯录", (0.25, 0.93, 0.50, 1.0)),
+        FakeNode("发现", (0.50, 0.93, 0.75, 1.0), target="discover"),
+        FakeNode("我", (0.75, 0.93, 1.00, 1.0)),
+    ]
+
+
+def default_screens() -> Dict[str, FakeScreen]:
+    """按真实微信和小程序流程搭建的页面集合"""
+    launcher = ".plugin.appbrand.ui.AppBrandLauncherUI"
+    return {
+        "launcher": FakeScreen(
+            "launcher", "com.android.launcher3.Launcher",
+            [FakeNode("微信", (0.05, 0.70, 0.25, 0.80), target="wechat_main")],
+            package=LAUNCHER_PACKAGE, color=(90, 60, 30)
+        ),
+        "wechat_main": FakeScreen(
+            "wechat_main", ".ui.LauncherUI",
+            [FakeNode("会话", (0.0, 0.10, 1.0, 0.20), clickable=False)] + _tabs(),
+            color=(250, 250, 250)
+        ),
+        "discover": FakeScreen(
+            "discover", ".ui.LauncherUI",
+            [FakeNode("朋友圈", (0.0, 0.10, 1.0, 0.17)),
+             FakeNode("小程序", (0.0, 0.40, 1.0, 0.47), target="miniprogram_list")] + _tabs(),
+            back="wechat_main", color=(235, 235, 235)
+        ),
+        "miniprogram_list": FakeScreen(
+            "miniprogram_list", launcher,
+            [FakeNode("最近使用", (0.0, 0.10, 1.0, 0.15), clickable=False),
+             FakeNode("胖东来", (0.10, 0.33, 0.40, 0.47), target="store_home"),
+             FakeNode("我的小程序", (0.0, 0.55, 1.0, 0.60), clickable=False)],
+            back="discover", color=(225, 230, 235)
+        ),
+        "store_home": FakeScreen(
+            "store_home", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("", (0.10, 0.10, 0.90, 0.16), class_name="android.view.View", target="search_page"),
+             FakeNode("首页", (0.00, 0.93, 0.25, 1.0)),
+             FakeNode("分类", (0.25, 0.93, 0.50, 1.0)),
+             FakeNode("购物车", (0.50, 0.93, 0.75, 1.0)),
+             FakeNode("我的", (0.75, 0.93, 1.00, 1.0))],
+            back="miniprogram_list", color=(60, 80, 200)
+        ),
+        "search_page": FakeScreen(
+            "search_page", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("", (0.10, 0.10, 0.90, 0.16), class_name="android.widget.EditText", focused=True),
+             FakeNode("历史搜索", (0.0, 0.20, 0.5, 0.24), clickable=False)],
+            back="store_home", enter="search_results", color=(245, 245, 245)
+        ),
+        "search_results": FakeScreen(
+            "search_results", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("", (0.10, 0.10, 0.90, 0.16), class_name="android.widget.EditText"),
+             FakeNode("商品", (0.05, 0.20, 0.95, 0.40), clickable=False),
+             FakeNode("加入购物车", (0.60, 0.34, 0.95, 0.39), target="search_results_added"),
+             FakeNode("购物车", (0.00, 0.93, 0.30, 1.0), target="cart")],
+            back="search_page", color=(250, 245, 240)
+        ),
+        # 加购后仍在结果页，出现加购成功的提示
+        "search_results_added": FakeScreen(
+            "search_results_added", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("", (0.10, 0.10, 0.90, 0.16), class_name="android.widget.EditText"),
+             FakeNode("商品", (0.05, 0.20, 0.95, 0.40), clickable=False),
+             FakeNode("加入购物车", (0.60, 0.34, 0.95, 0.39)),
+             FakeNode("购物车", (0.00, 0.93, 0.30, 1.0), target="cart"),
+             FakeNode("已加入购物车", (0.30, 0.60, 0.70, 0.65), clickable=False)],
+            back="search_page", color=(250, 245, 240)
+        ),
+        "cart": FakeScreen(
+            "cart", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("商品", (0.05, 0.10, 0.95, 0.30), clickable=False),
+             FakeNode("去结算", (0.65, 0.93, 1.00, 1.0), target="checkout")],
+            back="search_results", color=(240, 240, 250)
+        ),
+        "checkout": FakeScreen(
+            "checkout", ".plugin.appbrand.ui.AppBrandUI",
+            [FakeNode("收货地址", (0.05, 0.10, 0.95, 0.20), clickable=False),
+             FakeNode("提交订单", (0.65, 0.93, 1.00, 1.0), target="payment")],
+            back="cart", color=(235, 245, 235)
+        ),
+        "payment": FakeScreen(
+            "payment", ".plugin.wallet_core.ui.WalletPayUI",
+            [FakeNode("请输入支付密码", (0.10, 0.50, 0.90, 0.56), clickable=False)],
+            back="checkout", color=(200, 200, 200)
+        ),
+    }
+
+
+class _Exists:
+    """与u2的exists一致：既可以当布尔值，也可以带timeout调用"""
+
+    def __init__(self, selector: "FakeSelector"):
+        self.selector = selector
+
+    def __bool__(self) -> bool:
+        return self.selector._node() is not None
+
+    def __call__(self, timeout: float = 0) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.selector._node() is not None:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+class FakeSelector:
+    """device(text=...) 和 device.xpath(...) 返回的选择器"""
+
+    def __init__(self, device: "FakeDevice", **selector: Any):
+        self.device = device
+        self.selector = selector
+
+    def _node(self) -> Optional[FakeNode]:
+        return self.device._find_node(**self.selector)
+
+    @property
+    def exists(self) -> _Exists:
+        return _Exists(self)
+
+    def wait(self, timeout: float = 0) -> bool:
+        return _Exists(self)(timeout)
+
+    def click(self, timeout: Optional[float] = None) -> None:
+        if timeout and not self.wait(timeout):
+            raise RuntimeError(f"元素不存在: {self.selector}")
+        node = self._node()
+        if node is None:
+            raise RuntimeError(f"元素不存在: {self.selector}")
+        self.device.click(*self.device._center(node))
+
+    def get_text(self) -> Optional[str]:
+        node = self._node()
+        return None if node is None else node.text
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        node = self._node()
+        if node is None:
+            raise RuntimeError(f"元素不存在: {self.selector}")
+        x1, y1, x2, y2 = self.device._pixel_bounds(node)
+        return {
+            "text": node.text, "className": node.class_name, "resourceName": node.resource_id,
+            "bounds": {"left": x1, "top": y1, "right": x2, "bottom": y2},
+        }
+
+
+class _Service:
+    def __init__(self, name: str):
+        self.name = name
+        self._running = True
+
+    def start(self) -> None:
+        self._running = True
+
+    def stop(self) -> None:
+        self._running = False
+
+    def running(self) -> bool:
+        return self._running
+
+
+class _JsonRpc:
+    """uiautomator2服务的JSON-RPC，只支持takeScreenshot"""
+
+    def __init__(self, device: "FakeDevice"):
+        self.device = device
+
+    def takeScreenshot(self, scale: float = 1.0, quality: int = 80) -> str:
+        image = self.device._render(self.device.screen)
+        if scale != 1.0:
+            height, width = image.shape[:2]
+            image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        data = base64.b64encode(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        self.device._transfer("takeScreenshot", len(data))
+        return data.decode("ascii")
+
+
+_DD_RE = re.compile(r"\bdd\b.*\bskip=(\d+).*\bcount=(\d+)")
+
+
+class _AdbDevice:
+    """adbutils.AdbDevice，只支持 screencap 以及 screencap | dd skip=.. count=..（按字节）"""
+
+    def __init__(self, device: "FakeDevice"):
+        self.device = device
+
+    def shell(self, cmdargs: Union[str, List[str]], encoding: Optional[str] = "utf-8", **_: Any) -> Any:
+        command = cmdargs if isinstance(cmdargs, str) else " ".join(cmdargs)
+        if not command.startswith("screencap") or "-p" in command.split():
+            raise NotImplementedError(f"模拟设备不支持的命令: {command}")
+        image = self.device._render(self.device.screen)
+        height, width = image.shape[:2]
+        # Android 9及以上的帧头: 宽、高、像素格式（RGBA_8888）、色彩空间
+        data = struct.pack("<IIII", width, height, 1, 0) + cv2.cvtColor(image, cv2.COLOR_BGR2RGBA).tobytes()
+        match = _DD_RE.search(command)
+        if match:
+            skip, count = int(match.group(1)), int(match.group(2))
+            data = data[skip:skip + count]
+        self.device._transfer("screencap", len(data))
+        return data if encoding is None else data.decode(encoding, errors="replace")
+
+
+_XPATH_ATTR_RE = re.compile(r"@(text|resource-id|class)\s*=\s*['\"]([^'\"]*)['\"]")
+_XPATH_ATTRS = {"text": "text", "resource-id": "resource_id", "class": "class_name"}
+
+
+class FakeDevice:
+    """模拟的u2.Device
+
+    实现MiniProgram、DeviceManager等用到的接口。每次RPC按配置的延迟sleep（释放GIL，
+    与真实的HTTP往返一致），页面按点击、按键、deep link和输入在预置页面之间跳转，
+    截图和层级XML按页面生成并缓存。用于在没有模拟器的机器上测量流程延迟和扩展性。
+    """
+
+    def __init__(self, serial: str = "fake-0",
+                 window_size: Tuple[int, int] = (540, 960),
+                 screenshot_size: Optional[Tuple[int, int]] = None,
+                 rpc_latency: float = 0.02,
+                 screenshot_latency: float = 0.06,
+                 hierarchy_latency: float = 0.04,
+                 jitter: float = 0.2,
+                 hierarchy_padding: int = 50,
+                 transfer_rate: float = 20e6,
+                 screens: Optional[Dict[str, FakeScreen]] = None,
+                 initial_screen: str = "launcher",
+                 seed: Optional[int] = None):
+        """初始化模拟设备
+
+        Args:
+            serial: 设备序列号
+            window_size: 屏幕尺寸 (宽, 高)
+            screenshot_size: 截图尺寸 (宽, 高)，None与屏幕尺寸相同
+            rpc_latency: 普通RPC的延迟（秒）
+            screenshot_latency: 截图的延迟（秒）
+            hierarchy_latency: dump_hierarchy的延迟（秒）
+            jitter: 延迟的随机波动比例，0表示固定延迟
+            hierarchy_padding: 每个页面额外填充的无关节点数，模拟真实层级的规模
+            transfer_rate: takeScreenshot和screencap的传输速率（字节/秒），延迟为rpc_latency加传输时间
+            screens: 页面集合，None使用default_screens()
+            initial_screen: 初始页面
+            seed: 随机种子
+        """
+        self.serial = serial
+        self._window_size = window_size
+        self.screenshot_size = screenshot_size or window_size
+        self.rpc_latency = rpc_latency
+        self.screenshot_latency = screenshot_latency
+        self.hierarchy_latency = hierarchy_latency
+        self.jitter = jitter
+        self.hierarchy_padding = hierarchy_padding
+        self.transfer_rate = transfer_rate
+        self.screens = screens or default_screens()
+        self.screen = self.screens[initial_screen]
+        self.typed_text = ""
+        self.calls: Counter = Counter()  # 各RPC的调用次数
+        self._random = random.Random(seed if seed is not None else serial)
+        self._lock = threading.Lock()
+        self._images: Dict[str, np.ndarray] = {}
+        self._xml: Dict[Tuple[str, str], str] = {}
+        self._services: Dict[str, _Service] = {}
+        self.jsonrpc = _JsonRpc(self)
+        self.adb_device = _AdbDevice(self)
+
+    # ---- 内部工具 ----
+
+    def _rpc(self, name: str, latency: Optional[float] = None) -> None:
+        """记录一次调用并模拟往返延迟"""
+        latency = self.rpc_latency if latency is None else latency
+        with self._lock:
+            self.calls[name] += 1
+            if self.jitter:
+                latency *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _transfer(self, name: str, nbytes: int) -> None:
+        """模拟传输nbytes字节数据的一次调用"""
+        self._rpc(name, self.rpc_latency + nbytes / self.transfer_rate)
+
+    def _pixel_bounds(self, node: FakeNode) -> Tuple[int, int, int, int]:
+        width, height = self._window_size
+        x1, y1, x2, y2 = node.bounds
+        return int(x1 * width), int(y1 * height), int(x2 * width), int(y2 * height)
+
+    def _center(self, node: FakeNode) -> Tuple[int, int]:
+        x1, y1, x2, y2 = self._pixel_bounds(node)
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    def _node_text(self, node: FakeNode) -> str:
+        if node.class_name == "android.widget.EditText" and node.focused:
+            return self.typed_text
+        return node.text
+
+    def _find_node(self, text: Optional[str] = None, resource_id: Optional[str] = None,
+                   class_name: Optional[str] = None, resourceId: Optional[str] = None,
+                   className: Optional[str] = None, **_: Any) -> Optional[FakeNode]:
+        resource_id = resource_id or resourceId
+        class_name = class_name or className
+        for node in self.screen.nodes:
+            if text is not None and self._node_text(node) != text:
+                continue
+            if resource_id is not None and node.resource_id != resource_id:
+                continue
+            if class_name is not None and node.class_name != class_name:
+                continue
+            return node
+        return None
+
+    def _goto(self, screen: str) -> None:
+        with self._lock:
+            if screen != self.screen.name:
+                self.screen = self.screens[screen]
+                self.typed_text = ""
+
+    def _tap(self, x: float, y: float) -> None:
+        # 后出现的节点在上层，优先响应
+        for node in reversed(self.screen.nodes):
+            x1, y1, x2, y2 = self._pixel_bounds(node)
+            if node.clickable and x1 <= x < x2 and y1 <= y < y2:
+                if node.target:
+                    self._goto(node.target)
+                return
+
+    def _key(self, key: str) -> None:
+        key = key.lower().replace("keycode_", "")
+        if key in ("back", "4"):
+            if self.screen.back:
+                self._goto(self.screen.back)
+        elif key in ("home", "3"):
+            self._goto("launcher")
+        elif key in ("enter", "66", "search", "84"):
+            if self.screen.enter:
+                self._goto(self.screen.enter)
+
+    def _render(self, screen: FakeScreen) -> np.ndarray:
+        """生成页面截图（BGR），每个页面只生成一次"""
+        image = self._images.get(screen.name)
+        if image is None:
+            width, height = self.screenshot_size
+            image = np.empty((height, width, 3), dtype=np.uint8)
+            image[:] = screen.color
+            sx = width / self._window_size[0]
+            sy = height / self._window_size[1]
+            for i, node in enumerate(screen.nodes):
+                x1, y1, x2, y2 = self._pixel_bounds(node)
+                shade = (37 * (i + 1)) % 200
+                cv2.rectangle(image, (int(x1 * sx), int(y1 * sy)), (int(x2 * sx) - 1, int(y2 * sy) - 1),
+                              (shade, 255 - shade, 128), thickness=-1 if node.clickable else 2)
+            self._images[screen.name] = image
+        return image
+
+    def _hierarchy_xml(self) -> str:
+        """生成当前页面的层级XML，按 (页面, 输入文本) 缓存"""
+        key = (self.screen.name, self.typed_text)
+        xml = self._xml.get(key)
+        if xml is None:
+            screen = self.screen
+            width, height = self._window_size
+            lines = [
+                "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>",
+                "<hierarchy rotation=\"0\">",
+                f"<node index=\"0\" text=\"\" class=\"android.widget.FrameLayout\" package=\"{screen.package}\" "
+                f"clickable=\"false\" focused=\"false\" enabled=\"true\" bounds=\"[0,0][{width},{height}]\">",
+            ]
+            for i in range(self.hierarchy_padding):
+                lines.append(
+                    f"<node index=\"{i}\" text=\"\" resource-id=\"\" class=\"android.view.View\" "
+                    f"package=\"{screen.package}\" clickable=\"false\" focused=\"false\" enabled=\"true\" "
+                    f"bounds=\"[0,0][{width},{height}]\" />"
+                )
+            for i, node in enumerate(screen.nodes):
+                x1, y1, x2, y2 = self._pixel_bounds(node)
+                lines.append(
+                    f"<node index=\"{i}\" text={quoteattr(self._node_text(node))} "
+                    f"resource-id={quoteattr(node.resource_id)} class=\"{node.class_name}\" "
+                    f"package=\"{screen.package}\" clickable=\"{str(node.clickable).lower()}\" "
+                    f"focused=\"{str(node.focused).lower()}\" enabled=\"true\" "
+                    f"bounds=\"[{x1},{y1}][{x2},{y2}]\" />"
+                )
+            lines.append("</node>")
+            lines.append("</hierarchy>")
+            xml = self._xml[key] = "\n".join(lines)
+        return xml
+
+    # ---- u2.Device 接口 ----
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        self._rpc("info")
+        width, height = self._window_size
+        return {
+            "currentPackageName": self.screen.package, "displayWidth": width, "displayHeight": height,
+            "displayRotation": 0, "naturalOrientation": True, "screenOn": True, "sdkInt": 28,
+        }
+
+    def window_size(self) -> Tuple[int, int]:
+        self._rpc("window_size")
+        return self._window_size
+
+    def app_current(self) -> Dict[str, Any]:
+        self._rpc("app_current")
+        screen = self.screen
+        return {"package": screen.package, "activity": screen.activity, "pid": 1000}
+
+    def app_start(self, package_name: str, activity: Optional[str] = None, wait: bool = False,
+                  stop: bool = False, use_monkey: bool = False) -> None:
+        self._rpc("app_start")
+        if package_name == WECHAT_PACKAGE and self.screen.package != WECHAT_PACKAGE:
+            self._goto("wechat_main")
+
+    def click(self, x: float, y: float) -> None:
+        self._rpc("click")
+        self._tap(x, y)
+
+    def swipe(self, fx: float, fy: float, tx: float, ty: float,
+              duration: Optional[float] = None, steps: Optional[int] = None) -> None:
+        self._rpc("swipe")
+
+    def press(self, key: Union[str, int], meta: Any = None) -> None:
+        self._rpc("press")
+        self._key(str(key))
+
+    def clear_text(self) -> None:
+        self._rpc("clear_text")
+        with self._lock:
+            self.typed_text = ""
+
+    def send_keys(self, text: str, clear: bool = False) -> None:
+        self._rpc("send_keys")
+        if self._find_node(class_name="android.widget.EditText") is not None:
+            with self._lock:
+                self.typed_text = text if clear else self.typed_text + text
+
+    def screenshot(self, filename: Optional[str] = None, format: str = "pillow") -> Any:
+        self._rpc("screenshot", self.screenshot_latency)
+        # 每次返回新的数组，与真实截图解码后的内存占用一致
+        image = self._render(self.screen).copy()
+        if filename:
+            cv2.imwrite(filename, image)
+            return filename
+        if format == "opencv":
+            return image
+        if format == "raw":
+            return cv2.imencode(".jpg", image)[1].tobytes()
+        return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+    def dump_hierarchy(self, compressed: bool = False, pretty: bool = False, max_depth: Optional[int] = None) -> str:
+        self._rpc("dump_hierarchy", self.hierarchy_latency)
+        return self._hierarchy_xml()
+
+    def shell(self, cmdargs: Union[str, List[str]], timeout: float = 60) -> ShellResponse:
+        """支持 am start -d（deep link）以及 input tap/keyevent/text 与 sleep 组成的脚本"""
+        self._rpc("shell")
+        if isinstance(cmdargs, str):
+            statements = [shlex.split(part) for part in cmdargs.split(";")]
+        else:
+            statements = [list(cmdargs)]
+        for args in statements:
+            if not args:
+                continue
+            if args[:2] == ["am", "start"] and "-d" in args:
+                if WECHAT_PACKAGE in args:
+                    self._goto("store_home")
+            elif args[:2] == ["input", "tap"]:
+                self._tap(float(args[2]), float(args[3]))
+            elif args[:2] == ["input", "keyevent"]:
+                for key in args[2:]:
+                    self._key(key)
+            elif args[:2] == ["input", "text"]:
+                with self._lock:
+                    self.typed_text += args[2].replace("%s", " ")
+            elif args[0] == "sleep":
+                time.sleep(float(args[1]))
+        return ShellResponse("", 0)
+
+    def service(self, name: str) -> _Service:
+        return self._services.setdefault(name, _Service(name))
+
+    def xpath(self, xpath: str) -> FakeSelector:
+        """只支持 //*[@text="..."] 这类按属性相等匹配的XPath"""
+        selector = {_XPATH_ATTRS[attr]: value for attr, value in _XPATH_ATTR_RE.findall(xpath)}
+        return FakeSelector(self, **selector)
+
+    def __call__(self, **selector: Any) -> FakeSelector:
+        return FakeSelector(self, **selector)
+
+
+def make_fake_devices(count: int, **kwargs: Any) -> Dict[str, FakeDevice]:
+    """创建多个模拟设备，名称为 fake1 ... fakeN
+
+    Args:
+        count: 设备数量
+        **kwargs: 传给FakeDevice的参数
+    Returns:
+        Dict[str, FakeDevice]: 设备名称到模拟设备的映射
+    """
+    return {f"fake{i + 1}": FakeDevice(serial=f"fake-{i + 1}", **kwargs) for i in range(count)}
@@ -0,0 +1,322 @@
+"""
+基准测试运行器
+
+使用模拟设备测量 MiniProgram.launch、search_in_miniprogram、分阶段的购买流程以及
+DeviceManager.execute_on_all_devices 在不同设备数量下的吞吐量、尾延迟和内存占用。
+
+用法（在src目录下）:
+    python -m bench.run_benchmarks --devices 1,8,32,64 --output bench_results.json
+    python -m bench.run_benchmarks --baseline bench_results.json  # 与基线比较，退化时返回非0
+    python -m bench.run_benchmarks --processes 4  # 设备分片到4个工作进程执行
+    python -m bench.run_benchmarks --capture  # 比较各截图模式的传输字节数和解码耗时
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import functools
+import operator
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from core.config_manager import ConfigManager
+from core.config_model import BotConfig
+from core.device_manager import DeviceManager
+from core.miniprogram import MiniProgram
+from core.purchase_pipeline import run_purchase_pipeline
+from core.retry import retry_stats
+from core.capture import CaptureBackend, CaptureStats, JpegCaptureBackend, RawCaptureBackend, U2CaptureBackend
+from utils.metrics import Histogram, metrics
+from bench.fake_device import FakeDevice, make_fake_devices
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class NullLogger:
+    """不输出任何内容的日志记录器，避免日志I/O干扰测量"""
+
+    def debug(self, message: str) -> None:
+        pass
+
+    info = warning = error = critical = debug
+
+
+class TimedStep:
+    """记录每台设备耗时的步骤，可以pickle后发送到工作进程执行
+
+    耗时记录在执行进程的指标注册表中，多进程时由主进程通过collect_metrics收集。
+    """
+
+    def __init__(self, name: str, step: Callable[[MiniProgram], bool]):
+        self.name = name
+        self.step = step
+
+    def __call__(self, mp: MiniProgram) -> bool:
+        with metrics.span(mp.device_name, self.name):
+            return self.step(mp)
+
+
+def goto_store_home(mp: MiniProgram) -> bool:
+    """将模拟设备切换到小程序首页"""
+    mp.device._goto("store_home")
+    return True
+
+
+def build_manager(devices: Dict[str, FakeDevice], settings: BotConfig,
+                  max_concurrency: int, device_overrides: Optional[Dict[str, Any]] = None,
+                  click_point_cache: Optional[str] = None) -> DeviceManager:
+    """创建使用模拟设备的DeviceManager
+
+    跳过ADB发现和连接，直接按connect_devices的方式创建各设备的MiniProgram。
+    click_point_cache指定点击坐标缓存文件，避免写入项目的配置目录。
+    """
+    logger = NullLogger()
+    options = replace(settings.options, auto_discovery=False, screenshot_on_error=False,
+                      max_concurrency=max_concurrency, track_devices=False)
+    # 工作进程使用配置中的日志设置，只保留错误输出
+    logging = replace(settings.logging, level="ERROR", per_device_files=False)
+    miniprogram = settings.miniprogram
+    if click_point_cache is not None:
+        miniprogram = replace(miniprogram, click_point_cache=click_point_cache)
+    manager = DeviceManager(replace(settings, options=options, logging=logging, miniprogram=miniprogram,
+                                    devices=(), by_name={}, by_serial={}), logger)
+    for name, device in devices.items():
+        device_config = replace(manager.create_device_config(device.serial, name), **(device_overrides or {}))
+        manager.device_configs[name] = device_config
+        manager.devices[name] = device
+        manager.miniprograms[name] = MiniProgram(device, device_config, logger)
+    return manager
+
+
+# 报告中的步骤，pipeline为购买流程（搜索结果页之后的加购、结算、支付）
+STEPS = ("launch", "search", "pipeline")
+
+
+def run_step(manager: DeviceManager, name: str, step: Callable[[MiniProgram], bool]) -> Dict[str, Any]:
+    """在所有设备上并行执行一个步骤并统计结果
+
+    步骤内部以 <步骤名>.<子步骤> 记录的耗时（如 pipeline.checkout）按子步骤汇总到stages中。
+    """
+    metrics.reset()
+    start = time.perf_counter()
+    results = manager.execute_on_all_devices(TimedStep(name, step), parallel=True)
+    wall = time.perf_counter() - start
+    succeeded = sum(1 for ok in results.values() if ok)
+
+    # 每台设备每个步骤只执行一次，各设备的最大值即为该设备的耗时
+    per_device = manager.shards.collect_metrics() if manager.shards is not None else metrics.summary()
+    histogram = Histogram()
+    stages: Dict[str, Histogram] = {}
+    prefix = name + "."
+    for steps in per_device.values():
+        if name in steps:
+            histogram.record(int(steps[name]["max_ms"] * 1000))
+        for step_name, step_summary in steps.items():
+            if step_name.startswith(prefix):
+                stage = stages.setdefault(step_name[len(prefix):], Histogram())
+                stage.record(int(step_summary["max_ms"] * 1000))
+    summary = histogram.summary()
+    return {
+        "devices": len(results),
+        "succeeded": succeeded,
+        "wall_s": wall,
+        "throughput_per_s": succeeded / wall if wall > 0 else 0.0,
+        "latency": summary,
+        # 总耗时中不属于最慢设备本身的部分：排队与编排开销
+        "overhead_ms": wall * 1000 - summary["max_ms"],
+        "stages": {stage: stage_histogram.summary() for stage, stage_histogram in stages.items()},
+    }
+
+
+def run_scenario(count: int, settings: BotConfig, device_kwargs: Dict[str, Any],
+                 max_concurrency: int, processes: int = 0,
+                 device_overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """测量指定设备数量下的launch、search和购买流程
+
+    processes大于0时设备分片到多个工作进程，工作进程按相同参数创建自己的模拟设备，
+    RPC次数和内存只统计主进程，工作进程中的RPC次数报告为0。
+    """
+    keyword = settings.search.keywords[0]
+    cache_dir = tempfile.TemporaryDirectory(prefix="bench_")
+    retry_stats.reset()
+    tracemalloc.start()
+    try:
+        devices = make_fake_devices(count, **device_kwargs)
+        # 每个场景从未校准的状态开始
+        manager = build_manager(devices, settings, max_concurrency, device_overrides,
+                                os.path.join(cache_dir.name, "click_points.json"))
+        try:
+            if processes > 0:
+                manager.start_process_shards(processes, functools.partial(FakeDevice, **device_kwargs))
+            launch = run_step(manager, "launch", operator.methodcaller("launch"))
+            # launch已经搜索过一次，回到小程序首页后单独测量搜索
+            manager.execute_on_all_devices(goto_store_home, parallel=True)
+            search = run_step(manager, "search", operator.methodcaller("search_in_miniprogram", keyword))
+            # 搜索后停留在结果页，购买流程跳过搜索阶段，测量结果页到支付页
+            pipeline = run_step(manager, "pipeline", run_purchase_pipeline)
+            retries = sum(counters["retries"] for operations in manager.retry_report().values()
+                          for counters in operations.values())
+        finally:
+            manager.disconnect_devices()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        cache_dir.cleanup()
+
+    calls = 0 if processes > 0 else sum(sum(device.calls.values()) for device in devices.values())
+    return {
+        "devices": count,
+        "launch": launch,
+        "search": search,
+        "pipeline": pipeline,
+        "rpc_calls_per_device": calls / count,
+        "retries_per_device": retries / count,
+        "peak_traced_mb": peak / 2 ** 20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_capture_benchmark(device_kwargs: Dict[str, Any], frames: int = 20) -> List[Dict[str, Any]]:
+    """比较各截图模式整屏和按钮区域截图的传输字节数、传输和解码耗时"""
+    device = FakeDevice(**device_kwargs)
+    device._goto("store_home")
+    width, height = device.window_size()
+    # 底部按钮所在的一条区域，约为屏幕的8%
+    button_area = (0, int(height * 0.86), width, int(height * 0.94))
+    modes: List[Tuple[str, CaptureBackend, Optional[Tuple[int, int, int, int]]]] = [
+        ("u2", U2CaptureBackend(device), None),
+        ("jpeg q80", JpegCaptureBackend(device), None),
+        ("jpeg x0.5 q80", JpegCaptureBackend(device, scale=0.5), None),
+        ("jpeg x0.5 q60", JpegCaptureBackend(device, scale=0.5, quality=60), None),
+        ("raw", RawCaptureBackend(device), None),
+        ("jpeg x0.5 按钮区域", JpegCaptureBackend(device, scale=0.5), button_area),
+        ("raw 按钮区域", RawCaptureBackend(device), button_area),
+    ]
+    results = []
+    for label, backend, region in modes:
+        backend.capture()  # 预热：查询屏幕尺寸、确定screencap帧头
+        backend.stats = CaptureStats()
+        for _ in range(frames):
+            backend.capture(region)
+        results.append({"mode": label, **backend.stats.summary()})
+    return results
+
+
+def print_capture_report(results: List[Dict[str, Any]]) -> None:
+    print(f"{'截图模式':<20} {'KB/帧':>9} {'传输ms':>8} {'解码ms':>8}")
+    for item in results:
+        print(f"{item['mode']:<20} {item['bytes_per_frame'] / 1024:>9.1f} "
+              f"{item['transfer_ms']:>8.1f} {item['decode_ms']:>8.2f}")
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """与基线比较，返回退化项的描述"""
+    regressions = []
+    previous = {item["devices"]: item for item in baseline}
+    for item in results:
+        base = previous.get(item["devices"])
+        if base is None:
+            continue
+        for step in STEPS:
+            if step not in item or step not in base:
+                continue
+            current_p95 = item[step]["latency"]["p95_ms"]
+            base_p95 = base[step]["latency"]["p95_ms"]
+            if base_p95 and current_p95 > base_p95 * (1 + tolerance):
+                regressions.append(f"{item['devices']}台设备 {step} p95 {base_p95:.1f}ms -> {current_p95:.1f}ms")
+            current_tp = item[step]["throughput_per_s"]
+            base_tp = base[step]["throughput_per_s"]
+            if base_tp and current_tp < base_tp * (1 - tolerance):
+                regressions.append(f"{item['devices']}台设备 {step} 吞吐量 {base_tp:.2f}/s -> {current_tp:.2f}/s")
+    return regressions
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    header = f"{'设备数':>6} {'步骤':<8} {'成功':>7} {'总耗时s':>8} {'吞吐/s':>8} " \
+             f"{'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'开销ms':>8} {'RPC/台':>7} {'重试/台':>7} {'峰值MB':>8}"
+    print(header)
+    for item in results:
+        for step in STEPS:
+            stats = item[step]
+            latency = stats["latency"]
+            print(
+                f"{item['devices']:>6} {step:<8} {stats['succeeded']:>3}/{stats['devices']:<3} "
+                f"{stats['wall_s']:>8.2f} {stats['throughput_per_s']:>8.2f} "
+                f"{latency['p50_ms']:>8.1f} {latency['p95_ms']:>8.1f} {latency['p99_ms']:>8.1f} "
+                f"{stats['overhead_ms']:>8.1f} {item['rpc_calls_per_device']:>7.0f} "
+                f"{item.get('retries_per_device', 0):>7.1f} {item['peak_traced_mb']:>8.1f}"
+            )
+            for stage, latency in stats["stages"].items():
+                print(f"{'':>6} {'  ' + stage:<16} {'':>17} "
+                      f"{latency['p50_ms']:>8.1f} {latency['p95_ms']:>8.1f} {latency['p99_ms']:>8.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="使用模拟设备的流程基准测试")
+    parser.add_argument("--devices", default="1,8,32,64", help="逗号分隔的设备数量")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="编排器最大并发数")
+    parser.add_argument("--processes", type=int, default=0, help="工作进程数，0表示只用主进程的线程池")
+    parser.add_argument("--capture-mode", choices=("u2", "jpeg", "raw"), default="jpeg", help="流程中使用的截图模式")
+    parser.add_argument("--capture-scale", type=float, default=1.0, help="jpeg截图模式下设备端的缩小比例")
+    parser.add_argument("--transfer-rate", type=float, default=20e6, help="截图传输速率（字节/秒）")
+    parser.add_argument("--capture", action="store_true", help="只比较各截图模式，不运行流程")
+    parser.add_argument("--rpc-latency", type=float, default=0.02, help="普通RPC延迟（秒）")
+    parser.add_argument("--screenshot-latency", type=float, default=0.06, help="截图延迟（秒）")
+    parser.add_argument("--hierarchy-latency", type=float, default=0.04, help="dump_hierarchy延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机波动比例")
+    parser.add_argument("--screen-size", default="540x960", help="屏幕和截图尺寸，宽x高")
+    parser.add_argument("--hierarchy-padding", type=int, default=50, help="每个页面额外的层级节点数")
+    parser.add_argument("--config-dir", default=os.path.join(PROJECT_DIR, "config"), help="配置目录")
+    parser.add_argument("--output", help="结果JSON文件路径")
+    parser.add_argument("--baseline", help="基线结果JSON文件，退化时返回非0")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="与基线比较时允许的退化比例")
+    args = parser.parse_args(argv)
+
+    settings = ConfigManager(args.config_dir).settings
+    width, height = (int(v) for v in args.screen_size.lower().split("x"))
+    device_kwargs = {
+        "window_size": (width, height),
+        "rpc_latency": args.rpc_latency,
+        "screenshot_latency": args.screenshot_latency,
+        "hierarchy_latency": args.hierarchy_latency,
+        "jitter": args.jitter,
+        "hierarchy_padding": args.hierarchy_padding,
+        "transfer_rate": args.transfer_rate,
+    }
+
+    if args.capture:
+        capture_results = run_capture_benchmark(device_kwargs)
+        print_capture_report(capture_results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({"args": vars(args), "capture": capture_results}, f, ensure_ascii=False, indent=2)
+        return 0
+
+    device_overrides = {"capture_mode": args.capture_mode, "capture_scale": args.capture_scale}
+
+    results = []
+    for count in (int(v) for v in args.devices.split(",")):
+        results.append(run_scenario(count, settings, device_kwargs, args.max_concurrency, args.processes,
+                                    device_overrides))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"性能退化: {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import time
+import base64
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+import uiautomator2 as u2
+from utils.logger import Logger
+from utils.metrics import metrics
+from core.config_model import DeviceConfig
+
+# 屏幕区域 (x1, y1, x2, y2)，屏幕坐标
+Region = Tuple[int, int, int, int]
+
+# screencap原始输出的像素格式：RGBA_8888 / RGBX_8888，每像素4字节
+_RAW_FORMATS = (1, 2)
+
+
+@dataclass
+class Capture:
+    """一次截图的结果"""
+    image: np.ndarray  # BGR格式图像
+    nbytes: int  # 从设备传输的字节数，0表示无法得知
+    transfer_ms: float  # 设备端截图和传输的耗时（毫秒）
+    decode_ms: float  # 主机端解码的耗时（毫秒）
+    scale: float = 1.0  # 图像像素与屏幕像素之比，设备端缩小时小于1
+    region: Optional[Region] = None  # 截取的屏幕区域，None表示整个屏幕
+    screen_size: Optional[Tuple[int, int]] = None  # 整个屏幕的尺寸 (宽, 高)
+
+
+class CaptureStats:
+    """截图后端的累计统计：帧数、传输字节数、传输和解码耗时"""
+
+    def __init__(self):
+        self.frames = 0
+        self.nbytes = 0
+        self.transfer_ms = 0.0
+        self.decode_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, capture: Capture) -> None:
+        with self._lock:
+            self.frames += 1
+            self.nbytes += capture.nbytes
+            self.transfer_ms += capture.transfer_ms
+            self.decode_ms += capture.decode_ms
+
+    def summary(self) -> Dict[str, float]:
+        """平均每帧的传输字节数、传输耗时和解码耗时"""
+        with self._lock:
+            frames = max(self.frames, 1)
+            return {
+                "frames": self.frames,
+                "bytes_per_frame": self.nbytes / frames,
+                "transfer_ms": self.transfer_ms / frames,
+                "decode_ms": self.decode_ms / frames,
+            }
+
+
+def _clip(region: Region, width: int, height: int) -> Region:
+    x1, y1, x2, y2 = (int(v) for v in region)
+    x1, y1 = min(max(0, x1), width), min(max(0, y1), height)
+    return x1, y1, max(x1, min(width, x2)), max(y1, min(height, y2))
+
+
+class CaptureBackend:
+    """截图后端基类
+
+    capture按需只截取屏幕的一个区域：supports_roi为True的后端只传输区域内的数据，
+    其他后端截取整屏后在主机端裁剪。每次截图的字节数和耗时累计在stats中，
+    解码耗时同时按 capture.<后端名称>.decode 步骤记入延迟统计。
+    """
+    name = "base"
+    supports_roi = False  # 是否只传输区域内的数据
+
+    def __init__(self, device: u2.Device, device_name: str = ""):
+        self.device = device
+        self.device_name = device_name or getattr(device, 'serial', None) or 'device'
+        self.stats = CaptureStats()
+        self._screen_size: Optional[Tuple[int, int]] = None
+
+    @property
+    def screen_size(self) -> Tuple[int, int]:
+        """屏幕尺寸 (宽, 高)，首次使用时查询并缓存"""
+        if self._screen_size is None:
+            self._screen_size = tuple(self.device.window_size())
+        return self._screen_size
+
+    def capture(self, region: Optional[Region] = None) -> Capture:
+        """截取整个屏幕或屏幕的一个区域
+
+        Args:
+            region: 屏幕区域 (x1, y1, x2, y2)，None表示整个屏幕
+        Returns:
+            Capture: 截图结果，image只包含region内的画面
+        """
+        capture = self._capture(region)
+        self.stats.add(capture)
+        metrics.record(self.device_name, f"capture.{self.name}.decode", int(capture.decode_ms * 1000))
+        return capture
+
+    def _capture(self, region: Optional[Region]) -> Capture:
+        raise NotImplementedError
+
+    def _crop(self, capture: Capture, region: Optional[Region]) -> Capture:
+        """在主机端从整屏截图中裁剪区域"""
+        if region is None:
+            return capture
+        width, height = self.screen_size
+        x1, y1, x2, y2 = _clip(region, width, height)
+        s = capture.scale
+        capture.image = capture.image[int(y1 * s):int(y2 * s), int(x1 * s):int(x2 * s)]
+        capture.region = (x1, y1, x2, y2)
+        return capture
+
+    def close(self) -> None:
+        """释放后端占用的资源"""
+
+
+class U2CaptureBackend(CaptureBackend):
+    """通过u2的device.screenshot截图（兼容模式）
+
+    u2内部取得全分辨率JPEG后先解码为PIL图像再转为BGR数组，传输字节数无法得知。
+    """
+    name = "u2"
+
+    def _capture(self, region: Optional[Region]) -> Capture:
+        start = time.perf_counter()
+        image = self.device.screenshot(format='opencv')
+        elapsed = (time.perf_counter() - start) * 1000
+        capture = Capture(image, 0, elapsed, 0.0, screen_size=(image.shape[1], image.shape[0]))
+        return self._crop(capture, region)
+
+
+class JpegCaptureBackend(CaptureBackend):
+    """通过uiautomator2服务的takeScreenshot在设备端缩小并编码为JPEG
+
+    scale为1、quality为80时与u2默认截图取得的数据相同，但直接用OpenCV解码，
+    省去PIL解码和颜色转换；scale小于1时在设备端缩小，传输和解码的数据量按面积减少。
+    区域截图在主机端裁剪。
+    """
+    name = "jpeg"
+
+    def __init__(self, device: u2.Device, device_name: str = "", scale: float = 1.0, quality: int = 80):
+        super().__init__(device, device_name)
+        self.scale = scale
+        self.quality = quality
+
+    def _capture(self, region: Optional[Region]) -> Capture:
+        start = time.perf_counter()
+        data = self.device.jsonrpc.takeScreenshot(self.scale, self.quality)
+        transfer_ms = (time.perf_counter() - start) * 1000
+        if not data:
+            # 与u2相同：服务截图失败时退回adb screencap
+            start = time.perf_counter()
+            image = self.device.screenshot(format='opencv')
+            capture = Capture(image, 0, (time.perf_counter() - start) * 1000, 0.0,
+                              screen_size=self.screen_size)
+            return self._crop(capture, region)
+
+        start = time.perf_counter()
+        jpeg = base64.b64decode(data)
+        image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        decode_ms = (time.perf_counter() - start) * 1000
+        if image is None:
+            raise ValueError("无法解码设备返回的JPEG截图")
+        width = self.screen_size[0]
+        capture = Capture(image, len(data), transfer_ms, decode_ms,
+                          scale=image.shape[1] / width, screen_size=self.screen_size)
+        return self._crop(capture, region)
+
+
+class RawCaptureBackend(CaptureBackend):
+    """通过adb screencap读取未编码的帧缓冲
+
+    设备端不做PNG/JPEG编码，主机端只需转换颜色通道。区域截图通过dd只读取区域所在的行，
+    按钮区域的检查只传输几十KB而不是整帧的几MB（列方向在主机端裁剪）。
+    首次截图读取整帧以确定帧头长度和屏幕宽度；设备的dd不支持按字节跳过时退回整帧截图后裁剪。
+    """
+    name = "raw"
+    supports_roi = True
+
+    def __init__(self, device: u2.Device, device_name: str = "", logger: Optional[Logger] = None):
+        super().__init__(device, device_name)
+        self.logger = logger
+        self.adb_device = device.adb_device
+        self._layout: Optional[Tuple[int, int, int]] = None  # (帧头长度, 宽, 高)
+
+    def _shell(self, command: str) -> Tuple[bytes, float]:
+        start = time.perf_counter()
+        data = self.adb_device.shell(command, encoding=None)
+        return data, (time.perf_counter() - start) * 1000
+
+    def _capture(self, region: Optional[Region]) -> Capture:
+        if region is not None and self._layout is not None and self.supports_roi:
+            capture = self._capture_rows(region)
+            if capture is not None:
+                return capture
+        return self._crop(self._capture_full(), region)
+
+    def _capture_full(self) -> Capture:
+        data, transfer_ms = self._shell("screencap")
+        start = time.perf_counter()
+        width, height, pixel_format = struct.unpack_from("<III", data)
+        if pixel_format not in _RAW_FORMATS:
+            raise ValueError(f"不支持的screencap像素格式: {pixel_format}")
+        header = len(data) - width * height * 4
+        if header not in (12, 16):
+            raise ValueError(f"screencap输出长度异常: {len(data)} 字节，{width}x{height}")
+        self._layout = (header, width, height)
+        self._screen_size = (width, height)
+        pixels = np.frombuffer(data, dtype=np.uint8, offset=header).reshape(height, width, 4)
+        image = cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR)
+        decode_ms = (time.perf_counter() - start) * 1000
+        return Capture(image, len(data), transfer_ms, decode_ms, screen_size=(width, height))
+
+    def _capture_rows(self, region: Region) -> Optional[Capture]:
+        header, width, height = self._layout
+        x1, y1, x2, y2 = _clip(region, width, height)
+        stride = width * 4
+        expected = (y2 - y1) * stride
+        data, transfer_ms = self._shell(
+            f"screencap | dd bs={stride} iflag=skip_bytes,count_bytes "
+            f"skip={header + y1 * stride} count={expected} 2>/dev/null"
+        )
+        if len(data) != expected:
+            self.supports_roi = False
+            if self.logger is not None:
+                self.logger.warning(f"设备不支持按行读取screencap（收到 {len(data)}/{expected} 字节），改为整帧截图后裁剪")
+            return None
+        start = time.perf_counter()
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(y2 - y1, width, 4)
+        image = cv2.cvtColor(rows[:, x1:x2], cv2.COLOR_RGBA2BGR)
+        decode_ms = (time.perf_counter() - start) * 1000
+        return Capture(image, len(data), transfer_ms, decode_ms,
+                       region=(x1, y1, x2, y2), screen_size=(width, height))
+
+
+def create_capture_backend(device: u2.Device, config: DeviceConfig, logger: Logger,
+                           device_name: str = "") -> CaptureBackend:
+    """根据设备配置创建截图后端
+
+    配置项（devices.yaml中每个设备）:
+        capture_mode: u2 / jpeg / raw，默认jpeg
+        capture_scale: jpeg模式下设备端的缩小比例，默认1
+        capture_quality: jpeg模式下的JPEG质量，默认80
+
+    Args:
+        device: 设备实例
+        config: 设备配置
+        logger: 日志记录器
+        device_name: 设备名称，用于延迟统计
+    Returns:
+        CaptureBackend: 截图后端
+    """
+    if config.capture_mode == 'raw':
+        return RawCaptureBackend(device, device_name, logger)
+    if config.capture_mode == 'jpeg':
+        return JpegCaptureBackend(device, device_name, config.capture_scale, config.capture_quality)
+    return U2CaptureBackend(device, device_name)
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# 屏幕坐标 (x, y)
+Point = Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class ClickTarget:
+    """一个命名的点击目标及其校准方式"""
+    name: str
+    selectors: Tuple[Dict[str, Any], ...] = ()  # 层级选择器，依次尝试，命中节点的中心即为坐标
+    fallback: Optional[Tuple[float, float]] = None  # 无法定位且未配置时使用的屏幕比例坐标
+
+
+def default_click_targets(miniprogram_name: str) -> Dict[str, ClickTarget]:
+    """流程中用到的点击目标
+
+    模板库中有同名模板时也会用模板匹配校准。兜底坐标按540x960屏幕上验证过的位置换算为比例。
+    """
+    targets = [
+        ClickTarget("miniprogram_entry", ({"text": miniprogram_name},), fallback=(0.25, 0.4)),
+        ClickTarget("search_box", ({"class_name": "android.widget.EditText"}, {"text": "搜索"}),
+                    fallback=(0.5, 0.13)),
+        ClickTarget("search_input", ({"class_name": "android.widget.EditText"},), fallback=(0.5, 130 / 960)),
+        ClickTarget("history_tag", (), fallback=(50 / 540, 230 / 960)),
+        ClickTarget("add_to_cart", ({"text": "加入购物车"},)),
+        ClickTarget("cart_button", ({"text": "购物车"},)),
+        ClickTarget("checkout_button", ({"text": "去结算"}, {"text": "结算"})),
+        ClickTarget("pay_button", ({"text": "提交订单"}, {"text": "立即支付"})),
+    ]
+    return {target.name: target for target in targets}
+
+
+def resolution_key(screen_size: Tuple[int, int]) -> str:
+    return f"{screen_size[0]}x{screen_size[1]}"
+
+
+class ClickPointCache:
+    """校准结果的持久化缓存
+
+    所有设备共用一个JSON文件，结构为 {设备: {分辨率: {目标: {"point": [x, y], "source": ..., "calibrated_at": ...}}}}。
+    保存时重新读取文件，只覆盖当前设备的条目，多个进程分别校准不同设备时互不覆盖。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = self._read()
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def points(self, device: str, screen_size: Tuple[int, int]) -> Dict[str, Point]:
+        """设备在指定分辨率下已校准的坐标"""
+        with self._lock:
+            entries = self._data.get(device, {}).get(resolution_key(screen_size), {})
+            return {name: tuple(entry["point"]) for name, entry in entries.items()}
+
+    def update(self, device: str, screen_size: Tuple[int, int], name: str, point: Point, source: str) -> None:
+        """记录一个校准结果并写盘"""
+        with self._lock:
+            entries = self._data.setdefault(device, {}).setdefault(resolution_key(screen_size), {})
+            entries[name] = {"point": [int(point[0]), int(point[1])], "source": source,
+                             "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self._save(device)
+
+    def remove(self, device: str, screen_size: Tuple[int, int], name: str) -> None:
+        """删除一个校准结果并写盘"""
+        with self._lock:
+            entries = self._data.get(device, {}).get(resolution_key(screen_size), {})
+            if entries.pop(name, None) is not None:
+                self._save(device)
+
+    def _save(self, device: str) -> None:
+        data = self._read()
+        data[device] = self._data.get(device, {})
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ClickPointMap:
+    """单个设备在当前分辨率下的点击坐标表
+
+    只有校准结果（在页面上定位到，或点击后校验通过）会被直接使用，查找是一次字典访问；
+    校准结果写入缓存，同一设备同一分辨率只需校准一次。devices.yaml的click_points（按分辨率换算）
+    未经校验，单独保存，只在页面上定位不到、目标也没有兜底坐标时由调用方使用。
+    """
+
+    def __init__(self, cache: ClickPointCache, device: str, screen_size: Tuple[int, int],
+                 configured: Optional[Dict[str, Point]] = None):
+        """初始化点击坐标表
+
+        Args:
+            cache: 持久化缓存
+            device: 设备标识（序列号）
+            screen_size: 当前屏幕尺寸 (宽, 高)
+            configured: 已换算到当前分辨率的配置坐标，超出屏幕的坐标被丢弃
+        """
+        self.cache = cache
+        self.device = device
+        self.screen_size = tuple(screen_size)
+        width, height = self.screen_size
+        self._configured: Dict[str, Point] = {
+            name: point for name, point in (configured or {}).items()
+            if 0 <= point[0] < width and 0 <= point[1] < height
+        }
+        self._points: Dict[str, Point] = dict(cache.points(device, self.screen_size))
+
+    def get(self, name: str) -> Optional[Point]:
+        """目标已校准的坐标，未校准时为None"""
+        return self._points.get(name)
+
+    def configured(self, name: str) -> Optional[Point]:
+        """目标在devices.yaml中配置的坐标（未经校验），没有配置时为None"""
+        return self._configured.get(name)
+
+    def source(self, name: str) -> Optional[str]:
+        """坐标来源: calibrated（在页面上定位到，或点击后校验通过）/ config，未知时为None"""
+        if name in self._points:
+            return "calibrated"
+        if name in self._configured:
+            return "config"
+        return None
+
+    def set(self, name: str, point: Point, source: str) -> None:
+        """记录校准得到的坐标并持久化
+
+        Args:
+            name: 目标名称
+            point: 屏幕坐标
+            source: 校准方式（hierarchy / template / verified），写入缓存便于排查
+        """
+        point = (int(point[0]), int(point[1]))
+        self._points[name] = point
+        self.cache.update(self.device, self.screen_size, name, point, source)
+
+    def forget(self, name: str) -> None:
+        """丢弃校准结果（校验失败时）"""
+        if self._points.pop(name, None) is not None:
+            self.cache.remove(self.device, self.screen_size, name)
+
+
+_caches: Dict[str, ClickPointCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_click_point_cache(path: str) -> ClickPointCache:
+    """获取进程内共享的点击坐标缓存"""
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ClickPointCache(key)
+        return cache
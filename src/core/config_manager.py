@@ -1,13 +1,19 @@
 import os
+import json
 import yaml
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from core.config_model import BotConfig, DeviceConfig, compile_config
 
 class ConfigManager:
     def __init__(self, config_dir: str = "config"):
         self.config_dir = config_dir
         self.config: Dict[str, Any] = {}
         self.devices: List[Dict[str, Any]] = []
+        self.multi_device_config: Dict[str, Any] = {}
         self._load_configs()
+        # 加载时一次性合并、校验所有配置，运行时只读取属性
+        self.settings: BotConfig = compile_config(self.config, self.devices, self.multi_device_config)
+        self._devices_by_name: Dict[str, Dict[str, Any]] = {device['name']: device for device in self.devices}
 
     def _load_configs(self) -> None:
         """加载所有配置文件"""
@@ -22,10 +28,20 @@ class ConfigManager:
             devices_config = yaml.safe_load(f)
             self.devices = devices_config.get('devices', [])
 
+        # 加载多设备配置文件（可选）
+        multi_device_path = os.path.join(self.config_dir, "multi_device_config.json")
+        if os.path.exists(multi_device_path):
+            with open(multi_device_path, 'r', encoding='utf-8') as f:
+                self.multi_device_config = json.load(f)
+
     def get_time_windows(self) -> List[Dict[str, Any]]:
         """获取时间窗口配置"""
         return self.config.get('time_windows', [])
 
+    def get_scheduler_config(self) -> Dict[str, Any]:
+        """获取调度器配置"""
+        return self.config.get('scheduler', {})
+
     def get_search_config(self) -> Dict[str, Any]:
         """获取搜索配置"""
         return self.config.get('search', {})
@@ -44,7 +60,15 @@ class ConfigManager:
 
     def get_device_by_name(self, name: str) -> Dict[str, Any]:
         """根据名称获取设备配置"""
-        for device in self.devices:
-            if device['name'] == name:
-                return device
-        raise ValueError(f"Device {name} not found in configuration")
+        try:
+            return self._devices_by_name[name]
+        except KeyError:
+            raise ValueError(f"Device {name} not found in configuration") from None
+
+    def get_device_config(self, name: str) -> DeviceConfig:
+        """根据名称获取编译后的设备配置"""
+        return self.settings.device(name)
+
+    def get_device_by_serial(self, serial: str) -> Optional[DeviceConfig]:
+        """根据序列号（连接信息）获取编译后的设备配置，不存在时为None"""
+        return self.settings.device_by_serial(serial)
@@ -0,0 +1,453 @@
+import datetime
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+WECHAT_PACKAGE = "com.tencent.mm"
+
+
+class ConfigError(ValueError):
+    """配置校验错误，消息以出错字段的路径开头"""
+
+
+def parse_time_of_day(value: str) -> datetime.time:
+    """解析 HH:MM:SS 格式的时间"""
+    return datetime.datetime.strptime(value, "%H:%M:%S").time()
+
+
+# ---- 字段校验 ----
+
+Validator = Callable[[Any, str], Any]
+
+
+def _mapping(value: Any, path: str) -> Dict[str, Any]:
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ConfigError(f"{path}: 应为键值对，实际为 {value!r}")
+    return value
+
+
+def _number(minimum: float = 0.0, strict: bool = False, integer: bool = False,
+            optional: bool = False) -> Validator:
+    def check(value: Any, path: str) -> Any:
+        if value is None and optional:
+            return None
+        kind = int if integer else (int, float)
+        if isinstance(value, bool) or not isinstance(value, kind):
+            raise ConfigError(f"{path}: 应为{'整数' if integer else '数字'}，实际为 {value!r}")
+        if value < minimum or (strict and value == minimum):
+            raise ConfigError(f"{path}: 应{'大于' if strict else '不小于'} {minimum}，实际为 {value!r}")
+        return value if integer else float(value)
+    return check
+
+
+_positive = _number(strict=True)
+_non_negative = _number()
+_positive_int = _number(minimum=1, integer=True)
+_non_negative_int = _number(integer=True)
+
+
+def _bool(value: Any, path: str) -> bool:
+    if not isinstance(value, bool):
+        raise ConfigError(f"{path}: 应为 true 或 false，实际为 {value!r}")
+    return value
+
+
+def _str(value: Any, path: str) -> str:
+    if value is None:
+        return ""
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        raise ConfigError(f"{path}: 应为字符串，实际为 {value!r}")
+    return str(value)
+
+
+def _optional_str(value: Any, path: str) -> Optional[str]:
+    return _str(value, path) or None
+
+
+def _choice(*choices: str) -> Validator:
+    def check(value: Any, path: str) -> str:
+        if value not in choices:
+            raise ConfigError(f"{path}: 应为 {' / '.join(choices)} 之一，实际为 {value!r}")
+        return value
+    return check
+
+
+def _pair(value: Any, path: str) -> Tuple[int, int]:
+    """两个正数组成的坐标或分辨率"""
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or any(isinstance(v, bool) or not isinstance(v, (int, float)) or v <= 0 for v in value)):
+        raise ConfigError(f"{path}: 应为两个正数组成的列表，如 [1080, 1920]，实际为 {value!r}")
+    return int(value[0]), int(value[1])
+
+
+def _optional_pair(value: Any, path: str) -> Optional[Tuple[int, int]]:
+    return None if value is None else _pair(value, path)
+
+
+def _point(value: Any, path: str) -> Tuple[int, int]:
+    """屏幕坐标，允许为0"""
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or any(isinstance(v, bool) or not isinstance(v, (int, float)) or v < 0 for v in value)):
+        raise ConfigError(f"{path}: 应为两个非负数组成的坐标，如 [100, 200]，实际为 {value!r}")
+    return int(value[0]), int(value[1])
+
+
+def _points(value: Any, path: str) -> Dict[str, Tuple[int, int]]:
+    return {str(name): _point(point, f"{path}.{name}") for name, point in _mapping(value, path).items()}
+
+
+def _keywords(value: Any, path: str) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not value:
+        raise ConfigError(f"{path}: 应为非空的关键词列表，实际为 {value!r}")
+    return tuple(_str(v, f"{path}[{i}]") for i, v in enumerate(value))
+
+
+def _build(cls, raw: Any, path: str, validators: Dict[str, Validator], base: Any = None):
+    """按字段从raw构建配置对象，raw中没有的字段取base的值或默认值"""
+    raw = _mapping(raw, path)
+    values = {}
+    for f in fields(cls):
+        if f.name in raw:
+            check = validators.get(f.name)
+            values[f.name] = check(raw[f.name], f"{path}.{f.name}") if check else raw[f.name]
+        elif base is not None:
+            values[f.name] = getattr(base, f.name)
+    return cls(**values)
+
+
+# ---- 配置对象 ----
+
+@dataclass(frozen=True, slots=True)
+class TimeWindow:
+    """抢购时间窗口"""
+    start: datetime.time
+    end: datetime.time
+    interval: float = 1.0
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "TimeWindow":
+        raw = _mapping(raw, path)
+        times = {}
+        for key in ("start_time", "end_time"):
+            value = raw.get(key)
+            try:
+                times[key] = parse_time_of_day(value)
+            except (TypeError, ValueError):
+                raise ConfigError(f"{path}.{key}: 时间格式应为 HH:MM:SS，实际为 {value!r}") from None
+        interval = _positive(raw.get('interval', 1), f"{path}.interval")
+        return cls(times['start_time'], times['end_time'], interval)
+
+
+@dataclass(frozen=True, slots=True)
+class SchedulerConfig:
+    lead_time: float = 30.0  # 窗口开始前预热的提前量（秒）
+    spin_window: float = 0.02  # 触发前忙等的时长（秒）
+    metrics_dir: Optional[str] = None  # 延迟统计导出目录
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "SchedulerConfig":
+        return _build(cls, raw, path, {
+            'lead_time': _non_negative, 'spin_window': _non_negative, 'metrics_dir': _optional_str,
+        })
+
+
+@dataclass(frozen=True, slots=True)
+class SearchConfig:
+    keywords: Tuple[str, ...] = ("啤酒",)
+    timeout: float = 5.0
+    replication: int = 1  # 关键词分发时每个关键词由几台不同的设备完成
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "SearchConfig":
+        return _build(cls, raw, path, {'keywords': _keywords, 'timeout': _positive, 'replication': _positive_int})
+
+
+@dataclass(frozen=True, slots=True)
+class OperationConfig:
+    click_interval: float = 0.5
+    swipe_duration: float = 0.3
+    retry_times: int = 3
+    batch_input: bool = False  # fire的点击序列通过一次adb shell发送；每个input tap都要在设备上启动一次app_process
+    stage_timeout: float = 3.0  # 购买流程中加购、结算、支付每个阶段的时限（秒）
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "OperationConfig":
+        return _build(cls, raw, path, {
+            'click_interval': _non_negative, 'swipe_duration': _non_negative,
+            'retry_times': _non_negative_int, 'batch_input': _bool, 'stage_timeout': _positive,
+        })
+
+
+@dataclass(frozen=True, slots=True)
+class LoggingConfig:
+    level: str = "INFO"
+    rotation: str = "1 day"
+    retention: str = "7 days"
+    dir: str = "logs"
+    per_device_files: bool = True
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "LoggingConfig":
+        return _build(cls, raw, path, {
+            'level': _choice("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"),
+            'rotation': _str, 'retention': _str, 'dir': _str, 'per_device_files': _bool,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为Logger使用的字典"""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+@dataclass(frozen=True, slots=True)
+class OptionsConfig:
+    """多设备运行选项（multi_device_config.json 的 options）"""
+    parallel_execution: bool = True
+    auto_discovery: bool = True
+    retry_count: int = 3
+    retry_interval: float = 5.0
+    screenshot_on_error: Optional[bool] = None  # None表示使用小程序配置中的值
+    max_concurrency: int = 8
+    connect_timeout: float = 15.0
+    action_timeout: Optional[float] = None
+    track_devices: bool = True  # 连接后通过adb track-devices跟踪设备上下线
+    process_workers: int = 0  # 设备分片到多个工作进程执行，0表示在主进程的线程池中执行
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str) -> "OptionsConfig":
+        return _build(cls, raw, path, {
+            'parallel_execution': _bool, 'auto_discovery': _bool,
+            'retry_count': _non_negative_int, 'retry_interval': _non_negative,
+            'screenshot_on_error': _bool, 'max_concurrency': _positive_int,
+            'connect_timeout': _positive, 'action_timeout': _number(strict=True, optional=True),
+            'track_devices': _bool, 'process_workers': _non_negative_int,
+        })
+
+
+@dataclass(frozen=True, slots=True)
+class MiniProgramConfig:
+    name: str = "胖东来"  # 小程序名称
+    app_id: str = ""
+    deep_link: str = ""
+    path: str = ""
+    launch_mode: str = "auto"
+    package: str = WECHAT_PACKAGE
+    launch_timeout: float = 10.0
+    search_timeout: float = 5.0
+    search_keyword: str = ""  # 为空时使用search.keywords中的第一个
+    poll_interval: float = 0.2
+    hierarchy_ttl: float = 1.0
+    frame_buffer_size: int = 10
+    screenshot_on_error: bool = True
+    template_dir: str = "assets/images"
+    template_resolution: Tuple[int, int] = (1080, 1920)
+    screen_index: str = "config/screen_states.json"
+    click_point_cache: str = "config/click_point_cache.json"  # 各设备、各分辨率校准得到的点击坐标
+    frame_archive: str = "screenshots/archive"  # 帧存档目录，为空时出错截图保存为单独的PNG文件
+    frame_archive_max_mb: float = 256.0  # 每个设备帧存档的容量上限（MB）
+    frame_archive_all: bool = False  # 是否把采集的每一帧都写入帧存档，而不只是出错时缓冲区中的帧
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str, base: Optional["MiniProgramConfig"] = None) -> "MiniProgramConfig":
+        return _build(cls, raw, path, {
+            'name': _str, 'app_id': _str, 'deep_link': _str, 'path': _str,
+            'launch_mode': _choice("auto", "deep_link", "navigation"), 'package': _str,
+            'launch_timeout': _positive, 'search_timeout': _positive, 'search_keyword': _str,
+            'poll_interval': _positive, 'hierarchy_ttl': _non_negative, 'frame_buffer_size': _positive_int,
+            'screenshot_on_error': _bool, 'template_dir': _str, 'template_resolution': _pair,
+            'screen_index': _str, 'click_point_cache': _str, 'frame_archive': _str,
+            'frame_archive_max_mb': _positive, 'frame_archive_all': _bool,
+        }, base)
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceConfig:
+    """单个设备的完整配置，包含该设备运行时需要的所有全局配置"""
+    name: str = ""
+    connect_info: str = ""  # 序列号、IP地址或ADB设备ID
+    port: Optional[int] = None
+    resolution: Optional[Tuple[int, int]] = None  # click_points所对应的分辨率
+    touch_backend: str = "u2"
+    minitouch_path: str = "/data/local/tmp/minitouch"
+    capture_mode: str = "jpeg"  # 截图后端: u2 / jpeg / raw
+    capture_scale: float = 1.0  # jpeg模式下设备端的缩小比例
+    capture_quality: int = 80  # jpeg模式下的JPEG质量
+    click_points: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    miniprogram: MiniProgramConfig = field(default_factory=MiniProgramConfig)
+    search: SearchConfig = field(default_factory=SearchConfig)
+    operation: OperationConfig = field(default_factory=OperationConfig)
+    options: OptionsConfig = field(default_factory=OptionsConfig)
+
+    @property
+    def serial(self) -> str:
+        return self.connect_info
+
+    @classmethod
+    def from_dict(cls, raw: Any, path: str, miniprogram: MiniProgramConfig, search: SearchConfig,
+                  operation: OperationConfig, options: OptionsConfig) -> "DeviceConfig":
+        raw = _mapping(raw, path)
+        device = _build(cls, raw, path, {
+            'name': _str, 'connect_info': _str, 'port': _number(minimum=1, integer=True, optional=True),
+            'resolution': _optional_pair, 'touch_backend': _choice("u2", "minitouch"),
+            'minitouch_path': _str, 'click_points': _points,
+            'capture_mode': _choice("u2", "jpeg", "raw"), 'capture_scale': _positive,
+            'capture_quality': _positive_int,
+        })
+        miniprogram = MiniProgramConfig.from_dict(raw.get('miniprogram'), f"{path}.miniprogram", miniprogram)
+        if not miniprogram.search_keyword:
+            miniprogram = replace(miniprogram, search_keyword=search.keywords[0])
+        connect_info = device.connect_info or (f"emulator-{device.port}" if device.port else device.name)
+        return replace(device, connect_info=connect_info, miniprogram=miniprogram,
+                       search=search, operation=operation, options=options)
+
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    """合并 config.yaml、devices.yaml 和 multi_device_config.json 后的配置"""
+    time_windows: Tuple[TimeWindow, ...] = ()
+    scheduler: SchedulerConfig = field(default_factory=SchedulerConfig)
+    search: SearchConfig = field(default_factory=SearchConfig)
+    operation: OperationConfig = field(default_factory=OperationConfig)
+    miniprogram: MiniProgramConfig = field(default_factory=MiniProgramConfig)  # 设备未覆盖时的小程序配置
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    options: OptionsConfig = field(default_factory=OptionsConfig)
+    devices: Tuple[DeviceConfig, ...] = ()
+    by_name: Dict[str, DeviceConfig] = field(default_factory=dict)
+    by_serial: Dict[str, DeviceConfig] = field(default_factory=dict)
+
+    def device(self, name: str) -> DeviceConfig:
+        """根据名称获取设备配置"""
+        try:
+            return self.by_name[name]
+        except KeyError:
+            raise ValueError(f"Device {name} not found in configuration") from None
+
+    def device_by_serial(self, serial: str) -> Optional[DeviceConfig]:
+        """根据序列号（连接信息）获取设备配置，不存在时为None"""
+        return self.by_serial.get(serial)
+
+    def new_device(self, name: str, connect_info: str) -> DeviceConfig:
+        """为自动发现的设备创建使用默认配置的设备配置"""
+        return DeviceConfig.from_dict(
+            {'name': name, 'connect_info': connect_info}, f"devices.{name}",
+            self.miniprogram, self.search, self.operation, self.options
+        )
+
+
+def _raw_serial(raw: Dict[str, Any]) -> Optional[str]:
+    """原始设备配置的连接信息"""
+    if raw.get('connect_info'):
+        return str(raw['connect_info'])
+    if raw.get('port'):
+        return f"emulator-{raw['port']}"
+    return None
+
+
+def compile_device_config(raw: Dict[str, Any]) -> DeviceConfig:
+    """将单个字典（设备配置，或整份config.yaml）编译为设备配置
+
+    用于直接以字典创建MiniProgram的场景，字典中的miniprogram/search/operation/options节按相应配置解析。
+    """
+    raw = _mapping(raw, "config")
+    search = SearchConfig.from_dict(raw.get('search'), "config.search")
+    return DeviceConfig.from_dict(
+        raw, "config",
+        MiniProgramConfig(), search,
+        OperationConfig.from_dict(raw.get('operation'), "config.operation"),
+        OptionsConfig.from_dict(raw.get('options'), "config.options")
+    )
+
+
+def compile_config(config: Optional[Dict[str, Any]] = None,
+                   devices: Optional[List[Dict[str, Any]]] = None,
+                   multi_device: Optional[Dict[str, Any]] = None) -> BotConfig:
+    """合并并校验三份配置
+
+    Args:
+        config: config.yaml 的内容
+        devices: devices.yaml 中的设备列表
+        multi_device: multi_device_config.json 的内容；其中的设备与devices.yaml中同名设备合并，
+            default_miniprogram 覆盖config.yaml中的小程序配置
+    Returns:
+        BotConfig: 编译后的配置
+    Raises:
+        ConfigError: 配置不合法，消息中包含出错字段的路径
+    """
+    config = _mapping(config, "config.yaml")
+    multi_device = _mapping(multi_device, "multi_device_config.json")
+
+    windows = config.get('time_windows') or []
+    if not isinstance(windows, list):
+        raise ConfigError(f"config.yaml:time_windows: 应为列表，实际为 {windows!r}")
+    time_windows = tuple(
+        TimeWindow.from_dict(w, f"config.yaml:time_windows[{i}]") for i, w in enumerate(windows)
+    )
+    search = SearchConfig.from_dict(config.get('search'), "config.yaml:search")
+    operation = OperationConfig.from_dict(config.get('operation'), "config.yaml:operation")
+    miniprogram = MiniProgramConfig.from_dict(config.get('miniprogram'), "config.yaml:miniprogram")
+    if 'default_miniprogram' in multi_device:
+        miniprogram = MiniProgramConfig.from_dict(
+            multi_device['default_miniprogram'], "multi_device_config.json:default_miniprogram", miniprogram
+        )
+    options = OptionsConfig.from_dict(multi_device.get('options'), "multi_device_config.json:options")
+
+    # 按名称收集设备的原始配置，同名设备合并
+    raw_devices: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    if devices is not None and not isinstance(devices, list):
+        raise ConfigError(f"devices.yaml:devices: 应为列表，实际为 {devices!r}")
+    for i, raw in enumerate(devices or []):
+        path = f"devices.yaml:devices[{i}]"
+        raw = _mapping(raw, path)
+        name = raw.get('name')
+        if not name:
+            raise ConfigError(f"{path}.name: 缺少设备名称")
+        if name in raw_devices:
+            raise ConfigError(f"{path}.name: 设备名称 {name!r} 重复")
+        raw_devices[name] = (path, raw)
+    aliases: Dict[str, str] = {}  # multi_device_config.json中的名称 -> 合并到的设备名称
+    for name, raw in _mapping(multi_device.get('devices'), "multi_device_config.json:devices").items():
+        path = f"multi_device_config.json:devices.{name}"
+        raw = _mapping(raw, path)
+        # 同名，或连接信息相同的设备视为同一台设备
+        target = name if name in raw_devices else next(
+            (other for other, (_, existing) in raw_devices.items()
+             if _raw_serial(existing) and _raw_serial(existing) == _raw_serial(raw)), None
+        )
+        if target is None:
+            raw_devices[name] = (path, {**raw, 'name': name})
+            continue
+        existing_path, existing = raw_devices[target]
+        merged_miniprogram = {**_mapping(existing.get('miniprogram'), f"{existing_path}.miniprogram"),
+                              **_mapping(raw.get('miniprogram'), f"{path}.miniprogram")}
+        raw_devices[target] = (path, {**existing, **raw, 'name': target, 'miniprogram': merged_miniprogram})
+        if target != name:
+            aliases[name] = target
+
+    compiled: List[DeviceConfig] = []
+    by_name: Dict[str, DeviceConfig] = {}
+    by_serial: Dict[str, DeviceConfig] = {}
+    for name, (path, raw) in raw_devices.items():
+        device = DeviceConfig.from_dict(raw, path, miniprogram, search, operation, options)
+        other = by_serial.get(device.serial)
+        if other is not None:
+            raise ConfigError(f"{path}.connect_info: {device.serial!r} 与设备 {other.name!r} 重复")
+        compiled.append(device)
+        by_name[name] = device
+        by_serial[device.serial] = device
+    for alias, target in aliases.items():
+        by_name[alias] = by_name[target]
+
+    return BotConfig(
+        time_windows=time_windows,
+        scheduler=SchedulerConfig.from_dict(config.get('scheduler'), "config.yaml:scheduler"),
+        search=search,
+        operation=operation,
+        miniprogram=miniprogram,
+        logging=LoggingConfig.from_dict(config.get('logging'), "config.yaml:logging"),
+        options=options,
+        devices=tuple(compiled),
+        by_name=by_name,
+        by_serial=by_serial,
+    )
@@ -1,33 +1,55 @@
+import os
 import time
 import threading
-import subprocess
-import re
-from typing import Dict, List, Tuple, Optional, Callable
+import operator
+import functools
+from typing import Dict, List, Tuple, Optional, Callable, Union
+import adbutils
 import uiautomator2 as u2
 from utils.logger import Logger
-from core.miniprogram import MiniProgram
+from utils.metrics import Metrics, metrics
+from core.config_model import BotConfig, DeviceConfig, compile_config
+from core.miniprogram import MiniProgram, PurchasePlan
+from core.frame_buffer import FrameBuffer
+from core.orchestrator import AsyncOrchestrator, AsyncMiniProgram, CancelPolicy
+from core.device_pool import DevicePool
+from core.device_tracker import DeviceTracker
+from core.process_shards import ProcessShardExecutor, arm_in_worker, fire_in_worker, is_picklable
+from core.purchase_pipeline import run_purchase_pipeline
+from core.retry import RetryPolicy, WithDeadline, retry_stats
+from core.touch import U2TouchBackend, create_touch_backend
+from core.work_queue import KeywordWorkQueue
 
 class DeviceManager:
     """设备管理器，用于管理多个设备的连接和操作"""
     
-    def __init__(self, config: dict, logger: Logger):
+    def __init__(self, config: Union[BotConfig, dict], logger: Logger):
         """初始化设备管理器
         
         Args:
-            config: 配置信息，包含多个设备的配置
+            config: 编译后的配置（ConfigManager.settings），或multi_device_config.json格式的字典
             logger: 日志记录器
         """
+        if not isinstance(config, BotConfig):
+            config = compile_config(multi_device=config)
         self.config = config
         self.logger = logger
         self.devices: Dict[str, u2.Device] = {}  # 设备ID到设备实例的映射
         self.miniprograms: Dict[str, MiniProgram] = {}  # 设备ID到MiniProgram实例的映射
-        self.device_configs: Dict[str, dict] = config.get('devices', {})  # 设备ID到设备配置的映射
-        self.auto_discovery = config.get('options', {}).get('auto_discovery', True)  # 是否自动发现设备
-        self.default_miniprogram_config = config.get('default_miniprogram', {
-            "name": "胖东来",
-            "package": "com.tencent.mm",
-            "search_timeout": 5
-        })
+        self.purchase_plans: Dict[str, PurchasePlan] = {}  # 设备ID到arm阶段点击计划的映射
+        self.device_configs: Dict[str, DeviceConfig] = {device.name: device for device in config.devices}  # 设备ID到设备配置的映射
+        options = config.options
+        self.auto_discovery = options.auto_discovery  # 是否自动发现设备
+        self.action_timeout: Optional[float] = options.action_timeout  # 单个设备操作的超时时间
+        self.orchestrator = AsyncOrchestrator(logger, max_concurrency=options.max_concurrency)
+        self.pool = DevicePool(logger, connect_timeout=options.connect_timeout)
+        self.tracker: Optional[DeviceTracker] = None  # 设备热插拔跟踪，connect_devices后启动
+        self.shards: Optional[ProcessShardExecutor] = None  # 多进程分片执行器，process_workers大于0时启动
+        self.retry_policy = RetryPolicy.for_device(options)  # 关键词分发中失败项交给其他设备的次数和退回前的等待
+        # 返回当前时间窗口结束时刻（time.time()）的函数，如TimeWindowScheduler.current_deadline；重试不会越过该时刻
+        self.deadline_source: Optional[Callable[[], Optional[float]]] = None
+        self._listeners: List[Callable[[str, bool], None]] = []  # 设备加入/移除的回调
+        self._lock = threading.RLock()  # 保护devices、miniprograms、purchase_plans、device_configs，跟踪线程会修改它们
     
     def discover_devices(self) -> List[str]:
         """自动发现可连接的设备
@@ -38,24 +60,8 @@ class DeviceManager:
         self.logger.info("正在自动发现可连接设备...")
         
         try:
-            # 执行adb devices命令获取已连接设备列表
-            result = subprocess.run(
-                ["adb", "devices"], 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
-            
-            # 解析输出结果
-            device_list = []
-            lines = result.stdout.strip().split('\n')
-            # 跳过第一行（标题行）
-            for line in lines[1:]:
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == 'device':
-                        device_id = parts[0]
-                        device_list.append(device_id)
+            # 通过adb server获取处于device状态的设备
+            device_list = [info.serial for info in adbutils.adb.list() if info.state == 'device']
             
             self.logger.info(f"发现 {len(device_list)} 个设备: {device_list}")
             return device_list
@@ -64,19 +70,17 @@ class DeviceManager:
             self.logger.error(f"自动发现设备失败: {str(e)}")
             return []
     
-    def create_device_config(self, device_id: str) -> dict:
+    def create_device_config(self, device_id: str, device_name: Optional[str] = None) -> DeviceConfig:
         """为新发现的设备创建配置
         
         Args:
             device_id: 设备ID
+            device_name: 设备名称，默认使用设备ID
             
         Returns:
-            dict: 设备配置
+            DeviceConfig: 使用默认小程序配置的设备配置
         """
-        return {
-            "connect_info": device_id,
-            "miniprogram": self.default_miniprogram_config.copy()
-        }
+        return self.config.new_device(device_name or device_id, device_id)
         
     def connect_devices(self) -> bool:
         """连接所有可用设备
@@ -100,9 +104,13 @@ class DeviceManager:
             # 为发现的设备创建配置
             for i, device_id in enumerate(discovered_devices):
                 device_name = f"device{i+1}"
-                if device_name not in self.device_configs:
-                    self.device_configs[device_name] = self.create_device_config(device_id)
-                    self.logger.info(f"为设备 {device_id} 创建配置，命名为 {device_name}")
+                # 已按序列号配置过的设备直接使用已有配置
+                if self.config.device_by_serial(device_id) is not None:
+                    continue
+                with self._lock:
+                    if device_name not in self.device_configs:
+                        self.device_configs[device_name] = self.create_device_config(device_id, device_name)
+                        self.logger.info(f"为设备 {device_id} 创建配置，命名为 {device_name}")
         
         # 如果没有设备配置，则失败
         if not self.device_configs:
@@ -114,28 +122,31 @@ class DeviceManager:
         success_count = 0
         failed_devices = []
         
-        for device_name, device_config in self.device_configs.items():
+        # 并发连接所有设备，连接信息可以是序列号、IP地址或ADB设备ID
+        with self._lock:
+            targets = {
+                device_name: device_config.connect_info
+                for device_name, device_config in self.device_configs.items()
+            }
+        self.logger.info(f"正在并发连接 {len(targets)} 个设备: {list(targets)}")
+        with metrics.span("manager", "connect_all"):
+            connected, failed = self.pool.connect_all(targets)
+        
+        for device_name, error in failed.items():
+            self.logger.error(f"连接设备 {device_name} 失败: {error}")
+            failed_devices.append(device_name)
+        
+        for device_name, device in connected.items():
             try:
-                self.logger.info(f"正在连接设备: {device_name}")
-                # 设备连接信息，可以是序列号、IP地址或ADB设备ID
-                connect_info = device_config.get('connect_info', device_name)
-                device = u2.connect(connect_info)
+                self.logger.info(f"设备 {device_name} 连接成功")
                 
-                # 验证连接
-                info = device.info
-                self.logger.info(f"设备 {device_name} 连接成功，信息: {info}")
-                
-                # 存储设备实例
-                self.devices[device_name] = device
-                
-                # 创建对应的MiniProgram实例
-                device_logger = Logger(f"device_{device_name}")
-                self.miniprograms[device_name] = MiniProgram(device, device_config, device_logger)
+                # 存储设备实例并创建对应的MiniProgram实例
+                self._attach(device_name, device)
                 
                 success_count += 1
                 
             except Exception as e:
-                self.logger.error(f"连接设备 {device_name} 失败: {str(e)}")
+                self.logger.error(f"初始化设备 {device_name} 失败: {str(e)}")
                 failed_devices.append(device_name)
         
         # 计算连接成功率
@@ -143,26 +154,261 @@ class DeviceManager:
             success_rate = (success_count / expected_count) * 100
             self.logger.info(f"设备连接成功率: {success_rate:.1f}% ({success_count}/{expected_count})")
         
-        # 自动发现模式下，必须所有设备都连接成功
-        if self.auto_discovery:
-            if success_count < expected_count:
-                self.logger.error(f"部分设备连接失败: {failed_devices}")
-                return False
-            return True
+        if failed_devices:
+            # 连接失败的设备在下一次arm前重试，或在重新上线时由设备跟踪自动加入
+            self.logger.warning(f"部分设备连接失败，稍后自动重试: {failed_devices}")
         
-        # 配置模式下，至少要有一个设备连接成功
+        if self.config.options.track_devices:
+            self.start_tracking()
+        
+        if success_count > 0 and self.config.options.process_workers > 0:
+            self.start_process_shards()
+        
+        # 至少要有一个设备连接成功
         return success_count > 0
     
+    def add_device_listener(self, callback: Callable[[str, bool], None]) -> None:
+        """注册设备加入/移除的回调
+        
+        Args:
+            callback: 参数为 (设备ID, 是否加入)，在连接线程或设备跟踪线程中调用
+        """
+        self._listeners.append(callback)
+    
+    def _notify(self, device_name: str, added: bool) -> None:
+        for callback in self._listeners:
+            try:
+                callback(device_name, added)
+            except Exception as e:
+                self.logger.error(f"设备状态回调出错: {str(e)}")
+    
+    def _attach(self, device_name: str, device: u2.Device) -> None:
+        """创建设备的MiniProgram并加入运行中的设备集合，之后的批量操作会包含该设备"""
+        with self._lock:
+            device_config = self.device_configs[device_name]
+        miniprogram = MiniProgram(device, device_config, self.logger.for_device(device_name))
+        with self._lock:
+            # 跟踪线程和refresh_devices可能同时连接同一台设备，只保留先加入的
+            attached = device_name in self.miniprograms
+            if not attached:
+                self.devices[device_name] = device
+                self.miniprograms[device_name] = miniprogram
+        if attached:
+            miniprogram.touch.close()
+            return
+        self._notify(device_name, True)
+    
+    def _detach(self, device_name: str) -> None:
+        """将设备移出运行中的设备集合，保留其配置以便重新上线时加入"""
+        with self._lock:
+            device = self.devices.pop(device_name, None)
+            miniprogram = self.miniprograms.pop(device_name, None)
+            self.purchase_plans.pop(device_name, None)
+            connect_info = self.device_configs[device_name].connect_info
+        if miniprogram is not None:
+            try:
+                miniprogram.touch.close()
+            except Exception:
+                pass
+            # 关闭帧存档的当前段，写入其索引
+            miniprogram.frames.close()
+        self.pool.discard(connect_info)
+        if device is not None:
+            self.logger.warning(f"设备 {device_name} 已移出设备集合")
+            self._notify(device_name, False)
+    
+    def _device_name_for_serial(self, serial: str) -> Optional[str]:
+        """根据序列号查找设备名称，未配置且处于自动发现模式时为其创建配置"""
+        with self._lock:
+            for device_name, device_config in self.device_configs.items():
+                if device_config.connect_info == serial:
+                    return device_name
+            if not self.auto_discovery:
+                return None
+            index = len(self.device_configs) + 1
+            while f"device{index}" in self.device_configs:
+                index += 1
+            device_name = f"device{index}"
+            self.device_configs[device_name] = self.create_device_config(serial, device_name)
+        self.logger.info(f"为设备 {serial} 创建配置，命名为 {device_name}")
+        return device_name
+    
+    def _connect_and_attach(self, device_name: str) -> None:
+        try:
+            with self._lock:
+                connect_info = self.device_configs[device_name].connect_info
+            device = self.pool.get(connect_info)
+            self._attach(device_name, device)
+            self.logger.info(f"设备 {device_name} 已加入设备集合")
+        except Exception as e:
+            self.logger.error(f"连接设备 {device_name} 失败: {str(e)}")
+    
+    def _on_device_online(self, serial: str) -> None:
+        """设备跟踪回调：设备上线时在连接线程池中连接并加入设备集合"""
+        with self._lock:
+            device_name = self._device_name_for_serial(serial)
+            attached = device_name in self.miniprograms
+        if device_name is None:
+            self.logger.info(f"设备 {serial} 不在配置中，忽略")
+            return
+        if not attached:
+            self.pool.executor.submit(self._connect_and_attach, device_name)
+    
+    def _on_device_offline(self, serial: str) -> None:
+        """设备跟踪回调：设备下线时移出设备集合"""
+        with self._lock:
+            names = [device_name for device_name, device_config in self.device_configs.items()
+                     if device_config.connect_info == serial]
+        if names:
+            self._detach(names[0])
+    
+    def start_tracking(self) -> None:
+        """启动基于adb track-devices的设备热插拔跟踪
+        
+        新启动的模拟器会自动连接并加入设备集合，断开的设备会被移出；
+        崩溃后重新上线的模拟器会重新加入，参与之后的时间窗口。
+        """
+        if self.tracker is None:
+            self.tracker = DeviceTracker(self.logger, self._on_device_online, self._on_device_offline)
+        self.tracker.start()
+    
+    def refresh_devices(self) -> List[str]:
+        """重新连接已上线但不在设备集合中的设备（如首次连接失败的设备）
+        
+        Returns:
+            List[str]: 新加入的设备ID列表
+        """
+        with self._lock:
+            attached = set(self.miniprograms)
+        online = self.tracker.online if self.tracker is not None else None
+        with self._lock:
+            targets = {
+                device_name: device_config.connect_info
+                for device_name, device_config in self.device_configs.items()
+                if device_name not in attached and (online is None or device_config.connect_info in online)
+            }
+        if not targets:
+            return []
+        connected, failed = self.pool.connect_all(targets)
+        for device_name, device in connected.items():
+            try:
+                self._attach(device_name, device)
+            except Exception as e:
+                self.logger.error(f"初始化设备 {device_name} 失败: {str(e)}")
+                connected.pop(device_name, None)
+        if connected:
+            self.logger.info(f"重新加入设备: {list(connected)}")
+        return list(connected)
+    
+    def start_process_shards(self, workers: Optional[int] = None,
+                             device_factory: Callable[[str], u2.Device] = u2.connect) -> bool:
+        """将当前已连接的设备分片到多个工作进程执行
+        
+        启动后并行的execute_on_all_devices、launch、arm、fire都在工作进程中执行。
+        分片在启动时固定，之后热插拔的设备需要重新启动分片才会加入。
+        工作进程启动前先释放主进程中这些设备的minitouch和帧存档，避免两个进程争用同一个minitouch；
+        没有在工作进程中连接成功的设备恢复原来的触控后端。
+        
+        Args:
+            workers: 工作进程数，None使用配置中的process_workers
+            device_factory: 在工作进程中根据连接信息创建设备的函数，必须可以pickle
+            
+        Returns:
+            bool: 是否有设备在工作进程中连接成功
+        """
+        self.stop_process_shards()
+        with self._lock:
+            devices = [self.device_configs[device_id] for device_id in self.miniprograms]
+        if not devices:
+            self.logger.error("没有已连接的设备，无法启动多进程分片")
+            return False
+        
+        miniprogram = self.config.miniprogram
+        project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        template_dir = os.path.join(project_dir, miniprogram.template_dir)
+        shards = ProcessShardExecutor(
+            devices, self.logger,
+            workers=workers or self.config.options.process_workers or None,
+            logging_config=self.config.logging.to_dict(),
+            template_dir=template_dir if os.path.isdir(template_dir) else None,
+            template_resolution=miniprogram.template_resolution,
+            device_factory=device_factory
+        )
+        device_ids = [device_config.name for device_config in devices]
+        self._release_touch(device_ids)
+        with metrics.span("manager", "start_shards"):
+            connected, failed = shards.start()
+        for device_name, error in failed.items():
+            self.logger.error(f"工作进程中连接设备 {device_name} 失败: {error}")
+        if not connected:
+            shards.stop()
+            self._restore_touch(device_ids)
+            return False
+        self._restore_touch([device_id for device_id in device_ids if device_id not in connected])
+        self.shards = shards
+        return True
+    
+    def stop_process_shards(self, restore_touch: bool = True) -> None:
+        """停止多进程分片，之后的操作回到主进程的线程池中执行
+        
+        Args:
+            restore_touch: 是否为分片中的设备恢复主进程的触控后端，断开设备时不需要
+        """
+        if self.shards is not None:
+            device_ids = [device_id for shard in self.shards.shards for device_id in shard]
+            self.shards.stop()
+            self.shards = None
+            if restore_touch:
+                self._restore_touch(device_ids)
+    
+    def _release_touch(self, device_ids: List[str]) -> None:
+        """释放主进程中设备的minitouch和帧存档，点击和截图改由工作进程负责，主进程只保留u2点击"""
+        with self._lock:
+            miniprograms = [self.miniprograms[device_id] for device_id in device_ids if device_id in self.miniprograms]
+        for miniprogram in miniprograms:
+            try:
+                miniprogram.touch.close()
+                miniprogram.frames.close()
+            except Exception as e:
+                self.logger.warning(f"释放设备 {miniprogram.device_name} 的触控后端出错: {str(e)}")
+            miniprogram.touch = U2TouchBackend(miniprogram.device)
+            miniprogram.hierarchy.invalidate()
+    
+    def _restore_touch(self, device_ids: List[str]) -> None:
+        """按设备配置重新创建主进程中设备的触控后端"""
+        with self._lock:
+            miniprograms = [self.miniprograms[device_id] for device_id in device_ids if device_id in self.miniprograms]
+        for miniprogram in miniprograms:
+            miniprogram.touch.close()
+            miniprogram.touch = create_touch_backend(miniprogram.device, miniprogram.config, miniprogram.logger)
+    
+    def device_ids(self) -> List[str]:
+        """当前设备集合中的设备ID（快照）"""
+        with self._lock:
+            return list(self.miniprograms.keys())
+    
     def disconnect_devices(self):
         """断开所有设备连接"""
-        for device_id, device in self.devices.items():
+        if self.tracker is not None:
+            self.tracker.stop()
+        self.stop_process_shards(restore_touch=False)
+        with self._lock:
+            devices = list(self.devices.items())
+        for device_id, device in devices:
             try:
                 self.logger.info(f"断开设备 {device_id} 连接")
                 # UIAutomator2没有显式的断开方法，这里可以执行一些清理操作
                 # 例如停止uiautomator服务
+                if device_id in self.miniprograms:
+                    self.miniprograms[device_id].touch.close()
+                    self.miniprograms[device_id].frames.close()
                 device.service("uiautomator").stop()
             except Exception as e:
                 self.logger.error(f"断开设备 {device_id} 连接时出错: {str(e)}")
+        # 等待出错截图写入帧存档或PNG文件
+        FrameBuffer.flush()
+        self.pool.close()
+        self.orchestrator.shutdown()
     
     def execute_on_device(self, device_id: str, action: Callable[[MiniProgram], bool]) -> bool:
         """在指定设备上执行操作
@@ -174,53 +420,86 @@ class DeviceManager:
         Returns:
             bool: 操作是否成功
         """
-        if device_id not in self.miniprograms:
+        miniprogram = self.miniprograms.get(device_id)
+        if miniprogram is None:
             self.logger.error(f"设备 {device_id} 未连接")
             return False
             
         try:
-            miniprogram = self.miniprograms[device_id]
-            return action(miniprogram)
+            with metrics.span(device_id, "execute"):
+                return action(miniprogram)
         except Exception as e:
             self.logger.error(f"在设备 {device_id} 上执行操作时出错: {str(e)}")
             return False
     
-    def execute_on_all_devices(self, action: Callable[[MiniProgram], bool], parallel: bool = False) -> Dict[str, bool]:
+    def execute_on_all_devices(self, action: Callable[[MiniProgram], bool], parallel: bool = False,
+                               timeout: Optional[float] = None,
+                               cancel_policy: str = CancelPolicy.NONE) -> Dict[str, bool]:
         """在所有设备上执行操作
         
         Args:
             action: 要执行的操作函数，接受MiniProgram实例作为参数
             parallel: 是否并行执行
+            timeout: 并行执行时单个设备操作的超时时间（秒），None使用配置中的action_timeout
+            cancel_policy: 并行执行时的取消策略，见CancelPolicy
             
         Returns:
             Dict[str, bool]: 设备ID到操作结果的映射
         """
         results = {}
         
+        if parallel and self.shards is not None:
+            if cancel_policy == CancelPolicy.NONE and is_picklable(action):
+                # 多进程执行：操作发送到各工作进程，在工作进程中的设备上执行
+                return self.shards.run(action, timeout if timeout is not None else self.action_timeout)
+            self.logger.warning("操作无法发送到工作进程（不可pickle或指定了取消策略），改为在主进程中执行")
+        
         if parallel:
-            # 并行执行
-            threads = []
-            results_lock = threading.Lock()
-            
-            def thread_action(device_id: str):
-                result = self.execute_on_device(device_id, action)
-                with results_lock:
-                    results[device_id] = result
-            
-            for device_id in self.miniprograms.keys():
-                thread = threading.Thread(target=thread_action, args=(device_id,))
-                threads.append(thread)
-                thread.start()
-                
-            for thread in threads:
-                thread.join()
+            # 并行执行：使用常驻线程池并限制并发数
+            results = self.orchestrator.run(
+                self.device_ids(),
+                lambda device_id: self.execute_on_device(device_id, action),
+                timeout if timeout is not None else self.action_timeout,
+                cancel_policy
+            )
         else:
             # 串行执行
-            for device_id in self.miniprograms.keys():
+            for device_id in self.device_ids():
                 results[device_id] = self.execute_on_device(device_id, action)
                 
         return results
     
+    async def execute_on_all_devices_async(self, action: Callable[[MiniProgram], bool],
+                                           timeout: Optional[float] = None,
+                                           cancel_policy: str = CancelPolicy.NONE) -> Dict[str, bool]:
+        """在所有设备上并发执行操作（协程版本）
+        
+        Args:
+            action: 要执行的操作函数，接受MiniProgram实例作为参数
+            timeout: 单个设备操作的超时时间（秒），None使用配置中的action_timeout
+            cancel_policy: 取消策略，见CancelPolicy
+            
+        Returns:
+            Dict[str, bool]: 设备ID到操作结果的映射
+        """
+        return await self.orchestrator.run_all(
+            self.device_ids(),
+            lambda device_id: self.execute_on_device(device_id, action),
+            timeout if timeout is not None else self.action_timeout,
+            cancel_policy
+        )
+    
+    def get_async_miniprogram(self, device_id: str) -> AsyncMiniProgram:
+        """获取指定设备的协程版MiniProgram
+        
+        Args:
+            device_id: 设备ID
+            
+        Returns:
+            AsyncMiniProgram: 操作在编排器线程池中执行的MiniProgram包装
+        """
+        return AsyncMiniProgram(self.miniprograms[device_id], self.orchestrator)
+    
     def launch_miniprogram_on_device(self, device_id: str) -> bool:
         """在指定设备上启动小程序
         
@@ -230,7 +509,7 @@ class DeviceManager:
         Returns:
             bool: 是否成功启动
         """
-        return self.execute_on_device(device_id, lambda mp: mp.launch())
+        return self.execute_on_device(device_id, self.with_deadline(operator.methodcaller("launch")))
     
     def launch_miniprogram_on_all_devices(self, parallel: bool = False) -> Dict[str, bool]:
         """在所有设备上启动小程序
@@ -241,7 +520,194 @@ class DeviceManager:
         Returns:
             Dict[str, bool]: 设备ID到启动结果的映射
         """
-        return self.execute_on_all_devices(lambda mp: mp.launch(), parallel)
+        return self.execute_on_all_devices(self.with_deadline(operator.methodcaller("launch")), parallel)
+        
+    def arm_all_devices(self, parallel: bool = True) -> Dict[str, bool]:
+        """在所有设备上执行购买流程的准备阶段，保存各设备的点击计划
+        
+        执行前先重新连接已上线但不在设备集合中的设备，使重新上线的模拟器参与本次时间窗口。
+        
+        Args:
+            parallel: 是否并行执行
+            
+        Returns:
+            Dict[str, bool]: 设备ID到准备结果的映射
+        """
+        self.refresh_devices()
+        with self._lock:
+            self.purchase_plans.clear()
+        
+        if parallel and self.shards is not None:
+            # 点击计划保存在各工作进程中，由fire_all_devices在同一进程中执行
+            return self.shards.run(self.with_deadline(arm_in_worker), self.action_timeout)
+        
+        def arm(device_id: str) -> Callable[[MiniProgram], bool]:
+            def action(mp: MiniProgram) -> bool:
+                plan = mp.arm()
+                if plan is None:
+                    return False
+                with self._lock:
+                    self.purchase_plans[device_id] = plan
+                return True
+            return self.with_deadline(action)
+        
+        return self.execute_on_all_devices_by_id(arm, parallel)
+    
+    def fire_all_devices(self) -> Dict[str, bool]:
+        """在所有已准备好的设备上并行执行点击计划
+        
+        点击不是幂等的，失败后不重试，由调度器在窗口内按间隔重新触发。
+        
+        Returns:
+            Dict[str, bool]: 设备ID到执行结果的映射
+        """
+        if self.shards is not None:
+            return self.shards.run(fire_in_worker)
+        with self._lock:
+            plans = dict(self.purchase_plans)
+        return self.orchestrator.run(
+            list(plans.keys()),
+            lambda device_id: self.execute_on_device(
+                device_id, lambda mp: mp.fire(plans[device_id])
+            )
+        )
+    
+    def purchase_on_all_devices(self, keyword: Optional[str] = None, parallel: bool = True) -> Dict[str, bool]:
+        """在所有设备上执行分阶段的购买流程（搜索 -> 加购 -> 结算 -> 支付）
+        
+        每个阶段校验页面跳转，各阶段耗时记入延迟统计（pipeline.<阶段>）。
+        
+        Args:
+            keyword: 搜索关键词，None使用配置中的关键词
+            parallel: 是否并行执行
+            
+        Returns:
+            Dict[str, bool]: 设备ID到流程是否完成的映射
+        """
+        action = run_purchase_pipeline
+        if keyword is not None:
+            action = functools.partial(run_purchase_pipeline, keyword=keyword)
+        return self.execute_on_all_devices(action, parallel)
+    
+    def distribute_keywords(self, keywords: Optional[List[str]] = None,
+                            action: Optional[Callable[[MiniProgram, str], bool]] = None,
+                            replication: Optional[int] = None,
+                            speculative: bool = True,
+                            timeout: Optional[float] = None) -> Dict[str, List[str]]:
+        """把关键词放入共享的工作队列，由所有设备分工完成
+        
+        每台设备执行完一项就取下一项，自己的份额做完后从其他设备窃取，队列空了以后为慢设备手上的项做备份执行，
+        关键词多、设备少时覆盖时间取决于最慢的设备，而不是关键词数乘以单台设备的耗时。
+        失败的项等待retry_interval（按次数退避）后交给其他设备，最多尝试retry_count+1次；不会越过当前时间窗口的结束时刻。
+        工作队列在主进程中，各项在主进程的线程池中执行，不经过多进程分片。
+        
+        Args:
+            keywords: 关键词，None使用配置中的search.keywords
+            action: 接受MiniProgram和关键词、返回是否成功的操作，None为接着上一次搜索再搜索该关键词（不在小程序中时先启动）
+            replication: 每个关键词由几台不同的设备完成，None使用配置中的search.replication
+            speculative: 是否为其他设备正在执行的项做备份执行
+            timeout: 整个分发的时限（秒），None使用配置中的action_timeout；到时后不再取新的项，卡住的设备不会拖住返回
+            
+        Returns:
+            Dict[str, List[str]]: 关键词到完成它的设备ID的映射
+        """
+        keywords = list(keywords or self.config.search.keywords)
+        action = action or MiniProgram.search_next
+        device_ids = self.device_ids()
+        queue = KeywordWorkQueue(keywords, device_ids, replication or self.config.search.replication,
+                                 max_attempts=self.retry_policy.retries + 1, speculative=speculative,
+                                 retry_delay=self.retry_policy.delay)
+        deadline = self.current_deadline()
+        timeout = timeout if timeout is not None else self.action_timeout
+        if timeout is not None:
+            deadline = min(deadline, time.time() + timeout) if deadline is not None else time.time() + timeout
+        self.logger.info(f"分发 {len(keywords)} 个关键词（每个 {queue.replication} 份）到 {len(device_ids)} 台设备")
+        
+        def work(device_id: str) -> bool:
+            while True:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return True
+                item = queue.take(device_id, remaining)
+                if item is None:
+                    return True
+                with metrics.span(device_id, "keyword"):
+                    ok = self.execute_on_device(device_id, lambda mp: action(mp, item.keyword))
+                if not ok:
+                    self.logger.warning(f"设备 {device_id} 完成关键词 {item.keyword} 失败")
+                queue.complete(item, device_id, ok)
+        
+        self.orchestrator.run(device_ids, work, timeout)
+        coverage = queue.coverage()
+        missing = [keyword for keyword, done_by in coverage.items() if len(done_by) < queue.replication]
+        elapsed = f"{queue.elapsed:.2f}秒" if queue.elapsed is not None else "未完成"
+        self.logger.info(f"关键词分发结束，覆盖耗时 {elapsed}，窃取 {queue.stolen} 次，备份执行 {queue.speculated} 次")
+        if missing:
+            self.logger.error(f"未完成的关键词: {missing}")
+        return coverage
+    
+    def current_deadline(self) -> Optional[float]:
+        """当前时间窗口的结束时刻（time.time()），没有设置deadline_source或不在窗口中时为None"""
+        if self.deadline_source is None:
+            return None
+        return self.deadline_source()
+    
+    def with_deadline(self, action: Callable[[MiniProgram], bool]) -> Callable[[MiniProgram], bool]:
+        """让设备操作内部的步骤级重试不越过当前时间窗口的结束时刻
+        
+        launch、arm只在MiniProgram的步骤中按operation.retry_times重试，这里不再整体重试，
+        避免两层重试叠加成retry_count*retry_times次尝试。返回的包装在操作可以pickle时同样可以pickle。
+        
+        Args:
+            action: 接受MiniProgram、返回是否成功的操作
+            
+        Returns:
+            Callable[[MiniProgram], bool]: 执行期间设置了截止时刻的操作
+        """
+        return WithDeadline(action, self.current_deadline())
+    
+    def collect_metrics(self) -> Metrics:
+        """本进程与所有工作进程合并后的延迟统计"""
+        merged = Metrics()
+        merged.merge(metrics.snapshot())
+        if self.shards is not None:
+            merged.merge(self.shards.collect_histograms())
+        return merged
+    
+    def retry_report(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """各设备的重试统计: {设备: {操作: {calls, attempts, retries, gave_up, wasted_s}}}，包括工作进程中的设备"""
+        report = retry_stats.summary()
+        if self.shards is not None:
+            report.update(self.shards.collect_retry_stats())
+        return report
+    
+    def log_retry_report(self) -> None:
+        """按设备输出重试次数和浪费的时间"""
+        for device_id, operations in sorted(self.retry_report().items()):
+            retries = sum(int(counters["retries"]) for counters in operations.values())
+            gave_up = sum(int(counters["gave_up"]) for counters in operations.values())
+            wasted = sum(counters["wasted_s"] for counters in operations.values())
+            detail = ", ".join(f"{name} {int(counters['retries'])}次" for name, counters in operations.items()
+                               if counters["retries"])
+            self.logger.info(f"设备 {device_id} 重试 {retries} 次，放弃 {gave_up} 次，浪费 {wasted:.2f}秒"
+                             + (f"（{detail}）" if detail else ""))
+    
+    def execute_on_all_devices_by_id(self, make_action: Callable[[str], Callable[[MiniProgram], bool]],
+                                     parallel: bool = False) -> Dict[str, bool]:
+        """在所有设备上执行与设备ID相关的操作
+        
+        Args:
+            make_action: 接受设备ID、返回操作函数的工厂
+            parallel: 是否并行执行
+            
+        Returns:
+            Dict[str, bool]: 设备ID到操作结果的映射
+        """
+        device_ids = self.device_ids()
+        run = lambda device_id: self.execute_on_device(device_id, make_action(device_id))
+        if parallel:
+            return self.orchestrator.run(device_ids, run, self.action_timeout)
+        return {device_id: run(device_id) for device_id in device_ids}
         
     def get_connected_device_count(self) -> int:
         """获取已连接的设备数量
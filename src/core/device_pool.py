@@ -0,0 +1,122 @@
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Tuple
+import uiautomator2 as u2
+from utils.logger import Logger
+from utils.metrics import metrics
+
+
+class DevicePool:
+    """可复用的设备连接池
+
+    已建立的u2.Device句柄按连接信息缓存，复用前先做健康检查；
+    批量连接并发执行，每台设备从开始连接起单独计算超时，超时未完成的设备不阻塞其余设备。
+    """
+
+    def __init__(self, logger: Logger, connect_timeout: float = 15.0, max_workers: int = 32):
+        """初始化连接池
+
+        Args:
+            logger: 日志记录器
+            connect_timeout: 单台设备连接的默认超时时间（秒）
+            max_workers: 连接线程池大小
+        """
+        self.logger = logger
+        self.connect_timeout = connect_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="connect")
+        self._devices: Dict[str, u2.Device] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_healthy(device: u2.Device) -> bool:
+        """检查设备句柄是否仍然可用"""
+        try:
+            device.info
+            return True
+        except Exception:
+            return False
+
+    def get(self, connect_info: str) -> u2.Device:
+        """获取设备连接，优先复用池中健康的句柄
+
+        Args:
+            connect_info: 连接信息，可以是序列号、IP地址或ADB设备ID
+        Returns:
+            u2.Device: 已验证可用的设备实例
+        """
+        with self._lock:
+            device = self._devices.get(connect_info)
+
+        if device is not None:
+            if self.is_healthy(device):
+                return device
+            self.logger.warning(f"设备 {connect_info} 的连接已失效，重新连接")
+            self.discard(connect_info)
+
+        device = u2.connect(connect_info)
+        # 验证连接
+        device.info
+        with self._lock:
+            self._devices[connect_info] = device
+        return device
+
+    def _timed_get(self, name: str, connect_info: str, started: Dict[str, float]) -> u2.Device:
+        started[name] = time.monotonic()
+        with metrics.span(name, "connect"):
+            return self.get(connect_info)
+
+    def connect_all(self, targets: Dict[str, str],
+                    timeout: Optional[float] = None) -> Tuple[Dict[str, u2.Device], Dict[str, str]]:
+        """并发连接多个设备
+
+        超时按设备计算：从该设备的连接任务开始执行时计时，在线程池中排队的时间不计入，
+        设备多于连接线程时排在后面的设备不会因为前面的设备慢而被判为超时。
+
+        Args:
+            targets: 设备名称到连接信息的映射
+            timeout: 每台设备的连接超时时间（秒），None使用默认值
+        Returns:
+            Tuple[Dict[str, u2.Device], Dict[str, str]]: (连接成功的设备, 失败设备名称到原因的映射)
+        """
+        timeout = self.connect_timeout if timeout is None else timeout
+        started: Dict[str, float] = {}  # 设备名称到连接开始时刻（time.monotonic()）的映射
+        futures = {
+            self.executor.submit(self._timed_get, name, connect_info, started): name
+            for name, connect_info in targets.items()
+        }
+
+        connected: Dict[str, u2.Device] = {}
+        failed: Dict[str, str] = {}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            expiries = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+            wait_for = max(0.0, min(expiries) - now) if expiries else timeout
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                name = futures[future]
+                try:
+                    connected[name] = future.result()
+                except Exception as e:
+                    failed[name] = str(e)
+            now = time.monotonic()
+            for future in list(pending):
+                name = futures[future]
+                if name in started and now - started[name] >= timeout:
+                    # 不等待超时的设备；若之后连接成功，句柄会留在池中供下次复用
+                    pending.discard(future)
+                    failed[name] = f"连接超时（{timeout}秒）"
+        return connected, failed
+
+    def discard(self, connect_info: str) -> None:
+        """从池中移除设备句柄"""
+        with self._lock:
+            self._devices.pop(connect_info, None)
+
+    def close(self) -> None:
+        """清空连接池并关闭线程池"""
+        with self._lock:
+            self._devices.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import threading
+from typing import Callable, Optional, Set
+import adbutils
+from utils.logger import Logger
+
+
+class DeviceTracker:
+    """基于adb server track-devices推送的设备热插拔跟踪
+
+    在后台线程中读取adb server推送的设备状态变化：设备进入device状态时调用on_added，
+    离线、未授权或被移除时调用on_removed。与adb server的连接中断时，重连前按adb devices的结果校正：
+    只有确实不在列表中的设备才调用on_removed，短暂的连接中断不会让仍在线的设备下线；
+    adb devices也失败时保持原有状态。
+    回调在跟踪线程中执行，应尽快返回，耗时操作（如连接设备）应交给其他线程。
+    """
+
+    def __init__(self, logger: Logger,
+                 on_added: Callable[[str], None],
+                 on_removed: Callable[[str], None],
+                 reconnect_interval: float = 2.0,
+                 client: Optional[adbutils.AdbClient] = None):
+        """初始化设备跟踪器
+
+        Args:
+            logger: 日志记录器
+            on_added: 设备上线回调，参数为序列号
+            on_removed: 设备下线回调，参数为序列号
+            reconnect_interval: 与adb server的连接中断后重连的间隔（秒）
+            client: adb客户端，默认使用adbutils.adb
+        """
+        self.logger = logger
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.reconnect_interval = reconnect_interval
+        self.client = client or adbutils.adb
+        self._online: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def online(self) -> Set[str]:
+        """当前处于device状态的设备序列号"""
+        with self._lock:
+            return set(self._online)
+
+    def start(self) -> None:
+        """启动后台跟踪线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止跟踪
+
+        track-devices是阻塞读取，线程会在收到下一次推送或连接断开后退出（守护线程，不阻塞进程退出）。
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                for event in self.client.track_devices():
+                    if self._stop.is_set():
+                        return
+                    if event.present and event.status == "device":
+                        self._set_online(event.serial, True)
+                    else:
+                        self._set_online(event.serial, False)
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                self.logger.warning(f"设备跟踪连接中断，{self.reconnect_interval}秒后重连: {str(e)}")
+            self._stop.wait(self.reconnect_interval)
+            if not self._stop.is_set():
+                self._reconcile()
+
+    def _reconcile(self) -> None:
+        """按adb devices的当前结果校正在线集合，补上连接中断期间错过的上下线"""
+        try:
+            current = {info.serial for info in self.client.list() if info.state == "device"}
+        except Exception as e:
+            self.logger.warning(f"获取设备列表失败，保持当前在线状态: {str(e)}")
+            return
+        for serial in self.online - current:
+            self._set_online(serial, False)
+        for serial in current - self.online:
+            self._set_online(serial, True)
+
+    def _set_online(self, serial: str, online: bool) -> None:
+        with self._lock:
+            if (serial in self._online) == online:
+                return
+            if online:
+                self._online.add(serial)
+            else:
+                self._online.discard(serial)
+        self.logger.info(f"设备 {serial} {'上线' if online else '下线'}")
+        callback = self.on_added if online else self.on_removed
+        try:
+            callback(serial)
+        except Exception as e:
+            self.logger.error(f"处理设备 {serial} 状态变化时出错: {str(e)}")
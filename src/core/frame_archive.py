@@ -0,0 +1,381 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import IO, Callable, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from utils.logger import Logger
+from core.capture import Region
+from core.frame_buffer import Frame, _FrameWriter
+
+
+class FrameKind:
+    """存档中记录的类型"""
+    KEY = "key"  # 关键帧：完整画面，PNG编码
+    DELTA = "delta"  # 差分帧：与所属关键帧按位异或后zlib压缩
+    MARK = "mark"  # 标记：没有画面，只记录时刻和原因（如出错）
+
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    """存档索引中的一条记录"""
+    segment: str  # 段文件路径
+    position: int  # 在段中的序号
+    timestamp: float  # 采集时间（time.time()）
+    label: str  # 采集时的步骤标签，持久化原因附在后面
+    kind: str  # FrameKind
+    offset: int  # 在段文件中的偏移
+    length: int  # 编码后的字节数
+    key: int  # 差分帧所属关键帧在段文件中的偏移，关键帧为自身偏移
+    key_length: int  # 所属关键帧编码后的字节数
+    shape: Tuple[int, ...] = ()
+    state: Optional[str] = None  # 页面状态（有页面状态索引时在写盘线程中识别）
+    scale: float = 1.0
+    region: Optional[Region] = None
+    screen_size: Optional[Tuple[int, int]] = None
+
+
+def _device_dir(device_name: str) -> str:
+    """设备名称转为目录名（IP:端口等名称中的特殊字符替换为下划线）"""
+    return re.sub(r"[^\w.-]", "_", device_name) or "device"
+
+
+class FrameArchive:
+    """单个设备的追加式帧存档
+
+    帧按时间顺序追加到设备目录下的段文件（.seg）中，每段配一个逐行JSON索引（.idx），
+    记录时间、标签、页面状态和在段文件中的位置。每段以关键帧开始，之后的帧与本段最近的关键帧
+    按位异或后压缩，画面大部分相同时差分帧只有几KB；画面尺寸或区域变化、差分超过关键帧一半大小（换了页面）时
+    重新写关键帧。任意一帧最多解码一个关键帧加一个差分即可还原。
+    段达到segment_frames帧或segment_bytes字节后滚动到新段，设备目录超过max_bytes时删除最旧的段。
+    编码和写盘都在共享的后台写盘线程中进行，append只把帧放入队列，不阻塞调用方。
+    """
+
+    def __init__(self, directory: str, device_name: str, logger: Logger,
+                 max_bytes: int = 256 * 2 ** 20,
+                 segment_frames: int = 240,
+                 segment_bytes: int = 16 * 2 ** 20,
+                 compression: int = 6,
+                 classify: Optional[Callable[[np.ndarray], Optional[str]]] = None):
+        """初始化存档（首次写入时才创建目录和段文件）
+
+        Args:
+            directory: 存档根目录，各设备写入其下的子目录
+            device_name: 设备名称
+            logger: 日志记录器
+            max_bytes: 设备目录的容量上限（字节），超出时删除最旧的段
+            segment_frames: 每段最多的帧数
+            segment_bytes: 每段最多的字节数
+            compression: 关键帧PNG和差分帧zlib的压缩级别（0-9）
+            classify: 识别画面页面状态的函数，None表示不记录页面状态
+        """
+        self.directory = os.path.join(directory, _device_dir(device_name))
+        self.device_name = device_name
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.segment_frames = max(1, segment_frames)
+        self.segment_bytes = segment_bytes
+        self.compression = compression
+        self.classify = classify
+        self.frames_written = 0  # 已写入的帧数
+        self.bytes_written = 0  # 已写入的字节数（含索引）
+        # 以下状态只在写盘线程中访问
+        self._segment: Optional[str] = None
+        self._data: Optional[IO[bytes]] = None
+        self._index: Optional[IO[str]] = None
+        self._count = 0  # 当前段的记录数
+        self._size = 0  # 当前段的字节数
+        self._key_image: Optional[np.ndarray] = None
+        self._key_offset = 0
+        self._key_length = 0
+        self._key_region: Optional[Region] = None
+
+    def append(self, frame: Frame, reason: str = "") -> bool:
+        """把一帧交给后台线程写入存档
+
+        Args:
+            frame: 要写入的帧（写入前不应再修改其图像）
+            reason: 持久化原因，附在标签后面
+        Returns:
+            bool: 是否放入了写盘队列，队列已满时丢弃该帧并返回False
+        """
+        return _FrameWriter.instance().submit_task(lambda: self._write(frame, reason), logger=self.logger)
+
+    def mark(self, reason: str) -> bool:
+        """记录一个没有画面的标记，如持续记录所有帧时的出错时刻"""
+        return _FrameWriter.instance().submit_task(lambda: self._write_mark(time.time(), reason),
+                                                 logger=self.logger)
+
+    def close(self) -> None:
+        """写完队列中已有的帧后关闭当前段"""
+        _FrameWriter.instance().submit_task(self._close_segment, block=True, logger=self.logger)
+
+    # ---- 以下在写盘线程中执行 ----
+
+    def _write(self, frame: Frame, reason: str) -> None:
+        image = np.ascontiguousarray(frame.image)
+        state = None
+        if self.classify is not None:
+            try:
+                state = self.classify(image)
+            except Exception:
+                state = None
+        label = "_".join(part for part in (frame.label, reason) if part)
+        if self._data is None or self._count >= self.segment_frames or self._size >= self.segment_bytes:
+            self._open_segment()
+
+        key = (self._key_image is None or self._key_image.shape != image.shape
+               or self._key_region != frame.region)
+        payload = b""
+        if not key:
+            delta = np.bitwise_xor(image, self._key_image)
+            payload = zlib.compress(delta.tobytes(), self.compression)
+            # 画面变化太大时差分不比关键帧小多少，改写关键帧
+            key = len(payload) * 2 > self._key_length
+        if key:
+            ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, self.compression])
+            if not ok:
+                raise ValueError("PNG编码失败")
+            payload = encoded.tobytes()
+            self._key_image = image
+            self._key_offset = self._size
+            self._key_length = len(payload)
+            self._key_region = frame.region
+
+        record = {
+            "t": frame.timestamp, "label": label, "kind": FrameKind.KEY if key else FrameKind.DELTA,
+            "off": self._size, "len": len(payload), "key": self._key_offset, "key_len": self._key_length,
+            "shape": list(image.shape), "state": state, "scale": frame.scale,
+            "region": list(frame.region) if frame.region is not None else None,
+            "screen": list(frame.screen_size) if frame.screen_size is not None else None,
+        }
+        self._data.write(payload)
+        self._data.flush()
+        self._size += len(payload)
+        self.frames_written += 1
+        self._write_record(record, len(payload))
+
+    def _write_mark(self, timestamp: float, reason: str) -> None:
+        if self._data is None:
+            self._open_segment()
+        self._write_record({"t": timestamp, "label": reason, "kind": FrameKind.MARK,
+                            "off": self._size, "len": 0, "key": self._size, "key_len": 0}, 0)
+
+    def _write_record(self, record: Dict, payload_size: int) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._index.write(line)
+        self._index.flush()
+        self._count += 1
+        self.bytes_written += payload_size + len(line.encode("utf-8"))
+
+    def _open_segment(self) -> None:
+        """关闭当前段，创建新段（以关键帧开始），然后按容量上限淘汰旧段"""
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        name = f"{stamp}-{int((now % 1) * 1000):03d}-{os.getpid()}"
+        self._segment = os.path.join(self.directory, name + ".seg")
+        self._data = open(self._segment, "ab")
+        self._index = open(os.path.join(self.directory, name + ".idx"), "a", encoding="utf-8")
+        self._count = 0
+        self._size = 0
+        self._key_image = None
+        self._evict()
+
+    def _close_segment(self) -> None:
+        for handle in (self._data, self._index):
+            if handle is not None:
+                handle.close()
+        self._data = None
+        self._index = None
+        self._key_image = None
+
+    def _evict(self) -> None:
+        """设备目录超过容量上限时删除最旧的段，当前段不删除"""
+        segments = _list_segments(self.directory)
+        sizes = [_segment_size(path) for path in segments]
+        total = sum(sizes)
+        for path, size in zip(segments, sizes):
+            if total <= self.max_bytes or path == self._segment:
+                break
+            for file in (path, path[:-len(".seg")] + ".idx"):
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.logger.info(f"帧存档超过容量上限，已删除最旧的段: {os.path.basename(path)}")
+
+
+def _list_segments(directory: str) -> List[str]:
+    """目录中的段文件，按创建时间从旧到新"""
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".seg")]
+
+
+def _segment_size(path: str) -> int:
+    """段文件及其索引的字节数"""
+    size = 0
+    for file in (path, path[:-len(".seg")] + ".idx"):
+        try:
+            size += os.path.getsize(file)
+        except OSError:
+            pass
+    return size
+
+
+class FrameArchiveReader:
+    """帧存档的随机访问读取器，用于事后排查
+
+    只读取索引即可按时间、标签、页面状态筛选；读取一帧时定位到段文件中的偏移，
+    最多解码一个关键帧（最近用过的关键帧会缓存）和一个差分帧。
+    """
+
+    def __init__(self, directory: str, key_cache: int = 8):
+        """初始化读取器
+
+        Args:
+            directory: 存档根目录
+            key_cache: 缓存的已解码关键帧数量
+        """
+        self.directory = directory
+        self.key_cache = key_cache
+        self._keys: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+
+    def devices(self) -> List[str]:
+        """存档中的设备目录"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def entries(self, device: str, start: Optional[float] = None, end: Optional[float] = None,
+                label: Optional[str] = None, state: Optional[str] = None) -> List[ArchiveEntry]:
+        """设备的存档记录（从旧到新）
+
+        Args:
+            device: 设备名称或设备目录名
+            start: 只返回此时刻（time.time()）之后的记录
+            end: 只返回此时刻之前的记录
+            label: 只返回标签中包含该文本的记录
+            state: 只返回该页面状态的记录
+        Returns:
+            List[ArchiveEntry]: 符合条件的记录
+        """
+        result = []
+        for segment in _list_segments(os.path.join(self.directory, _device_dir(device))):
+            for entry in self._load_index(segment):
+                if start is not None and entry.timestamp < start:
+                    continue
+                if end is not None and entry.timestamp > end:
+                    continue
+                if label is not None and label not in entry.label:
+                    continue
+                if state is not None and entry.state != state:
+                    continue
+                result.append(entry)
+        return result
+
+    def read(self, entry: ArchiveEntry) -> Frame:
+        """还原一条记录的画面
+
+        Raises:
+            ValueError: 记录是没有画面的标记，或段文件已损坏
+        """
+        if entry.kind == FrameKind.MARK:
+            raise ValueError(f"标记记录没有画面: {entry.label}")
+        with open(entry.segment, "rb") as f:
+            key = self._key_image(f, entry)
+            if entry.kind == FrameKind.KEY:
+                image = key
+            else:
+                f.seek(entry.offset)
+                delta = np.frombuffer(zlib.decompress(f.read(entry.length)), dtype=np.uint8)
+                image = np.bitwise_xor(delta.reshape(entry.shape), key)
+        return Frame(entry.timestamp, image, entry.label, entry.scale, entry.region, entry.screen_size)
+
+    def export(self, entry: ArchiveEntry, path: str) -> str:
+        """把一条记录的画面导出为图片文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cv2.imwrite(path, self.read(entry).image)
+        return path
+
+    def _key_image(self, f: IO[bytes], entry: ArchiveEntry) -> np.ndarray:
+        cache_key = (entry.segment, entry.key)
+        image = self._keys.get(cache_key)
+        if image is not None:
+            self._keys.move_to_end(cache_key)
+            return image
+        f.seek(entry.key)
+        image = cv2.imdecode(np.frombuffer(f.read(entry.key_length), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"关键帧解码失败: {entry.segment}@{entry.key}")
+        if len(entry.shape) == 3 and image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        self._keys[cache_key] = image
+        while len(self._keys) > self.key_cache:
+            self._keys.popitem(last=False)
+        return image
+
+    @staticmethod
+    def _load_index(segment: str) -> List[ArchiveEntry]:
+        """读取段的索引，跳过写入中断的最后一行和超出段文件长度的记录"""
+        index_path = segment[:-len(".seg")] + ".idx"
+        try:
+            data_size = os.path.getsize(segment)
+            with open(index_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        entries = []
+        for position, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["off"] + record["len"] > data_size:
+                continue
+            entries.append(ArchiveEntry(
+                segment, position, record["t"], record.get("label", ""), record["kind"],
+                record["off"], record["len"], record["key"], record["key_len"],
+                tuple(record.get("shape") or ()), record.get("state"), record.get("scale", 1.0),
+                tuple(record["region"]) if record.get("region") else None,
+                tuple(record["screen"]) if record.get("screen") else None,
+            ))
+        return entries
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="查看和导出帧存档")
+    parser.add_argument("directory", help="存档根目录")
+    parser.add_argument("device", nargs="?", help="设备名称，不指定时列出所有设备")
+    parser.add_argument("--label", help="只列出标签中包含该文本的记录")
+    parser.add_argument("--state", help="只列出该页面状态的记录")
+    parser.add_argument("--export", help="把列出的画面导出为PNG的目录")
+    args = parser.parse_args(argv)
+
+    reader = FrameArchiveReader(args.directory)
+    if args.device is None:
+        for device in reader.devices():
+            print(f"{device}: {len(reader.entries(device))} 条记录")
+        return 0
+    for entry in reader.entries(args.device, label=args.label, state=args.state):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.timestamp))
+        print(f"{stamp}.{int((entry.timestamp % 1) * 1000):03d} {entry.kind:5} {entry.state or '-':14} "
+              f"{entry.length:>8} {entry.label}")
+        if args.export and entry.kind != FrameKind.MARK:
+            name = f"{os.path.basename(entry.segment)[:-len('.seg')]}_{entry.position:04d}_{entry.label}.png"
+            reader.export(entry, os.path.join(args.export, name))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import os
+import time
+import functools
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Deque, List, Optional, Tuple, Union
+import cv2
+import numpy as np
+import uiautomator2 as u2
+from utils.logger import Logger
+from core.capture import CaptureBackend, Region
+
+if TYPE_CHECKING:
+    from core.frame_archive import FrameArchive
+
+
+@dataclass
+class Frame:
+    """一帧已解码的屏幕画面"""
+    timestamp: float  # 采集时间（time.time()）
+    image: np.ndarray  # BGR格式图像
+    label: str = ""  # 采集时的步骤标签
+    scale: float = 1.0  # 图像像素与屏幕像素之比
+    region: Optional[Region] = None  # 图像对应的屏幕区域，None表示整个屏幕
+    screen_size: Optional[Tuple[int, int]] = None  # 整个屏幕的尺寸 (宽, 高)
+
+    @property
+    def full_size(self) -> Tuple[int, int]:
+        """整帧画面在图像像素下的尺寸 (宽, 高)，用于换算模板大小"""
+        if self.region is None or self.screen_size is None:
+            return self.image.shape[1], self.image.shape[0]
+        return round(self.screen_size[0] * self.scale), round(self.screen_size[1] * self.scale)
+
+    def to_screen(self, x: float, y: float) -> Tuple[int, int]:
+        """将图像坐标换算为屏幕坐标"""
+        left, top = (self.region[0], self.region[1]) if self.region is not None else (0, 0)
+        return int(left + x / self.scale), int(top + y / self.scale)
+
+
+def _write_image(path: str, image: np.ndarray) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, image)
+
+
+class _FrameWriter:
+    """后台写盘线程，所有设备共享一个；任务按提交顺序执行
+
+    写盘线程没有自己的记录器，任务出错时记入errors，并通过提交任务时传入的设备记录器输出。
+    """
+
+    _instance: Optional["_FrameWriter"] = None
+    _instance_lock = threading.Lock()
+    # 最多积压的任务数，每个任务持有一帧画面，写盘跟不上时丢弃新的帧而不是阻塞调用方或占满内存
+    _MAX_PENDING = 64
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[Callable[[], None], Optional[Logger]]]" = queue.Queue(maxsize=self._MAX_PENDING)
+        self.dropped = 0  # 因队列已满而丢弃的任务数
+        self.errors = 0  # 执行出错的任务数
+        self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def instance(cls) -> "_FrameWriter":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, path: str, image: np.ndarray, logger: Optional[Logger] = None) -> bool:
+        return self.submit_task(functools.partial(_write_image, path, image), logger=logger)
+
+    def submit_task(self, task: Callable[[], None], block: bool = False, logger: Optional[Logger] = None) -> bool:
+        """放入后台任务，队列已满时丢弃并返回False；block为True时等待队列空位
+
+        Args:
+            task: 在写盘线程中执行的任务
+            block: 队列已满时是否等待
+            logger: 任务出错时使用的记录器
+        """
+        try:
+            self._queue.put((task, logger), block=block)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self) -> None:
+        """阻塞直到所有已提交的任务完成"""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            task, logger = self._queue.get()
+            try:
+                task()
+            except Exception as e:
+                self.errors += 1
+                if logger is not None:
+                    logger.error(f"后台写盘任务出错（累计 {self.errors} 次）: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+
+class FrameBuffer:
+    """每个设备一个的内存帧环形缓冲区
+
+    截图以NumPy数组保存在内存中，容量固定，超出后丢弃最旧的帧；
+    只有在调用persist时才由后台线程写盘。配置了帧存档时写入存档，否则每帧保存为一个PNG文件；
+    record_all为True时每一帧采集后都写入存档，persist只记录一个标记。
+    """
+
+    def __init__(self, logger: Logger, save_dir: str, capacity: int = 10,
+                 archive: Optional["FrameArchive"] = None, record_all: bool = False):
+        """初始化帧缓冲区
+
+        Args:
+            logger: 日志记录器
+            save_dir: 持久化截图的目录（没有配置帧存档时使用）
+            capacity: 缓冲区最多保留的帧数
+            archive: 设备的帧存档，None表示保存为PNG文件
+            record_all: 是否把采集的每一帧都写入帧存档
+        """
+        self.logger = logger
+        self.save_dir = save_dir
+        self.capacity = capacity
+        self.archive = archive
+        self.record_all = record_all and archive is not None
+        self._frames: Deque[Frame] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._persisted_at = 0.0  # 已交给写盘线程的最新一帧的采集时间，persist不重复写入
+
+    def capture(self, source: Union[CaptureBackend, u2.Device], label: str = "",
+                region: Optional[Region] = None) -> Frame:
+        """采集一帧屏幕画面并放入缓冲区
+
+        Args:
+            source: 截图后端，或直接调用screenshot的设备实例
+            label: 步骤标签
+            region: 只采集的屏幕区域，None表示整个屏幕
+        Returns:
+            Frame: 采集到的帧
+        """
+        if isinstance(source, CaptureBackend):
+            capture = source.capture(region)
+            frame = Frame(time.time(), capture.image, label, capture.scale, capture.region, capture.screen_size)
+        else:
+            image = source.screenshot(format='opencv')
+            screen_size = (image.shape[1], image.shape[0])
+            if region is not None:
+                x1, y1, x2, y2 = region
+                image = image[y1:y2, x1:x2]
+            frame = Frame(time.time(), image, label, region=region, screen_size=screen_size)
+        self.append(frame)
+        return frame
+
+    def append(self, frame: Frame) -> None:
+        """放入一帧画面"""
+        with self._lock:
+            self._frames.append(frame)
+        if self.record_all:
+            self.archive.append(frame)
+
+    def latest(self) -> Optional[Frame]:
+        """获取最新的一帧"""
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def frames(self) -> List[Frame]:
+        """获取缓冲区中所有帧（从旧到新）"""
+        with self._lock:
+            return list(self._frames)
+
+    def clear(self) -> None:
+        """清空缓冲区"""
+        with self._lock:
+            self._frames.clear()
+
+    def persist(self, reason: str = "", last: Optional[int] = None) -> List[str]:
+        """将缓冲区中的帧交给后台线程写盘，不阻塞调用方
+
+        连续失败时每次都会调用persist，之前已经写入过的帧不再重复写入，只写入之后新采集的帧。
+
+        Args:
+            reason: 持久化原因，会写入文件名或存档记录的标签
+            last: 只保存最近的若干帧，None表示全部未写入过的帧
+        Returns:
+            List[str]: 将要写入的PNG文件路径，写入帧存档时为空
+        """
+        if self.archive is not None:
+            self._persist_to_archive(reason, last)
+            return []
+
+        frames = self._unpersisted(last)
+        writer = _FrameWriter.instance()
+        paths = []
+        for frame in frames:
+            stamp = time.strftime("%H%M%S", time.localtime(frame.timestamp))
+            millis = int((frame.timestamp % 1) * 1000)
+            parts = [f"screen_{stamp}_{millis:03d}"]
+            if frame.label:
+                parts.append(frame.label)
+            if reason:
+                parts.append(reason)
+            path = os.path.join(self.save_dir, "_".join(parts) + ".png")
+            if writer.submit(path, frame.image, self.logger):
+                paths.append(path)
+                self._mark_persisted(frame)
+
+        if paths:
+            self.logger.info(f"已提交 {len(paths)} 帧截图后台保存至: {self.save_dir}")
+        return paths
+
+    def _persist_to_archive(self, reason: str, last: Optional[int]) -> None:
+        if self.record_all:
+            # 帧已在采集时写入存档，只记录出错的时刻和原因
+            self.archive.mark(reason)
+            self.logger.info(f"已在帧存档中标记: {reason}")
+            return
+        frames = self._unpersisted(last)
+        if not frames:
+            # 出错前的帧已经写入过，只记录这次出错
+            self.archive.mark(reason)
+            return
+        submitted = 0
+        for frame in frames:
+            if self.archive.append(frame, reason):
+                submitted += 1
+                self._mark_persisted(frame)
+        if submitted:
+            self.logger.info(f"已提交 {submitted} 帧截图后台写入帧存档: {self.archive.directory}")
+        if submitted < len(frames):
+            self.logger.warning(f"写盘队列已满，丢弃 {len(frames) - submitted} 帧截图")
+
+    def _unpersisted(self, last: Optional[int]) -> List[Frame]:
+        """缓冲区中还没有写入过的帧（从旧到新），last限制最多取最近的几帧"""
+        with self._lock:
+            frames = [frame for frame in self._frames if frame.timestamp > self._persisted_at]
+        return frames if last is None else frames[-last:]
+
+    def _mark_persisted(self, frame: Frame) -> None:
+        with self._lock:
+            self._persisted_at = max(self._persisted_at, frame.timestamp)
+
+    def close(self) -> None:
+        """关闭帧存档的当前段"""
+        if self.archive is not None:
+            self.archive.close()
+
+    @staticmethod
+    def flush() -> None:
+        """等待所有后台写盘任务完成"""
+        _FrameWriter.instance().flush()
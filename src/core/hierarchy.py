@@ -0,0 +1,158 @@
+import re
+import time
+import threading
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import uiautomator2 as u2
+from utils.metrics import metrics
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+class UINode:
+    """界面层级中的一个节点"""
+    __slots__ = ("text", "resource_id", "class_name", "content_desc", "package",
+                 "clickable", "focused", "enabled", "bounds")
+
+    def __init__(self, attrib: Dict[str, str]):
+        self.text = attrib.get("text", "")
+        self.resource_id = attrib.get("resource-id", "")
+        self.class_name = attrib.get("class", "")
+        self.content_desc = attrib.get("content-desc", "")
+        self.package = attrib.get("package", "")
+        self.clickable = attrib.get("clickable") == "true"
+        self.focused = attrib.get("focused") == "true"
+        self.enabled = attrib.get("enabled", "true") == "true"
+        match = _BOUNDS_RE.match(attrib.get("bounds", ""))
+        self.bounds: Tuple[int, int, int, int] = tuple(map(int, match.groups())) if match else (0, 0, 0, 0)
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        """节点中心坐标"""
+        x1, y1, x2, y2 = self.bounds
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    def __repr__(self) -> str:
+        return f"UINode(text={self.text!r}, class={self.class_name!r}, bounds={self.bounds})"
+
+
+class HierarchySnapshot:
+    """一次界面层级dump的本地索引
+
+    按文本、resource-id和类名建立索引，所有选择器和存在性检查都在本地完成。
+    """
+
+    def __init__(self, xml: str):
+        """解析层级XML
+
+        Args:
+            xml: device.dump_hierarchy() 返回的XML文本
+        """
+        self.created_at = time.monotonic()
+        self.nodes: List[UINode] = []
+        self._by_text: Dict[str, List[UINode]] = {}
+        self._by_resource_id: Dict[str, List[UINode]] = {}
+        self._by_class: Dict[str, List[UINode]] = {}
+
+        root = ET.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+        for element in root.iter("node"):
+            node = UINode(element.attrib)
+            self.nodes.append(node)
+            if node.text:
+                self._by_text.setdefault(node.text, []).append(node)
+            if node.resource_id:
+                self._by_resource_id.setdefault(node.resource_id, []).append(node)
+            self._by_class.setdefault(node.class_name, []).append(node)
+
+    def find(self, text: Optional[str] = None, resource_id: Optional[str] = None,
+             class_name: Optional[str] = None, clickable: Optional[bool] = None,
+             focused: Optional[bool] = None) -> List[UINode]:
+        """查找满足所有条件的节点
+
+        Returns:
+            List[UINode]: 按文档顺序排列的匹配节点
+        """
+        # 先用索引缩小候选集，再逐个过滤剩余条件
+        if text is not None:
+            candidates = self._by_text.get(text, [])
+        elif resource_id is not None:
+            candidates = self._by_resource_id.get(resource_id, [])
+        elif class_name is not None:
+            candidates = self._by_class.get(class_name, [])
+        else:
+            candidates = self.nodes
+
+        return [
+            node for node in candidates
+            if (text is None or node.text == text)
+            and (resource_id is None or node.resource_id == resource_id)
+            and (class_name is None or node.class_name == class_name)
+            and (clickable is None or node.clickable == clickable)
+            and (focused is None or node.focused == focused)
+        ]
+
+    def first(self, **selector) -> Optional[UINode]:
+        """查找第一个匹配的节点"""
+        found = self.find(**selector)
+        return found[0] if found else None
+
+    def exists(self, **selector) -> bool:
+        """是否存在匹配的节点"""
+        return bool(self.find(**selector))
+
+    def has_any_text(self, texts: Iterable[str]) -> bool:
+        """是否存在任意一个文本"""
+        return any(text in self._by_text for text in texts)
+
+    def has_all_texts(self, texts: Iterable[str]) -> bool:
+        """是否所有文本都存在"""
+        return all(text in self._by_text for text in texts)
+
+
+class HierarchyCache:
+    """界面层级快照缓存
+
+    快照在超过ttl或被invalidate（执行了点击、按键等操作）后才会重新dump。
+    """
+
+    def __init__(self, device: u2.Device, ttl: float = 1.0, device_name: str = ""):
+        """初始化快照缓存
+
+        Args:
+            device: 设备实例
+            ttl: 快照有效期（秒）
+            device_name: 设备名称，用于指标统计
+        """
+        self.device = device
+        self.ttl = ttl
+        self.device_name = device_name
+        self._snapshot: Optional[HierarchySnapshot] = None
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> HierarchySnapshot:
+        """获取当前有效的快照，必要时重新dump"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - snapshot.created_at > self.ttl:
+                with metrics.span(self.device_name, "rpc.dump_hierarchy"):
+                    xml = self.device.dump_hierarchy()
+                snapshot = HierarchySnapshot(xml)
+                self._snapshot = snapshot
+            return snapshot
+
+    def refresh(self) -> HierarchySnapshot:
+        """强制重新dump并返回新快照"""
+        self.invalidate()
+        return self.snapshot()
+
+    def invalidate(self) -> None:
+        """使当前快照失效，下次访问时重新dump"""
+        with self._lock:
+            self._snapshot = None
+
+
+def hierarchy_text_exists(cache: HierarchyCache, *texts: str) -> Callable[[], bool]:
+    """等待条件：任意一个文本出现在快照中时成立"""
+    def condition() -> bool:
+        return cache.snapshot().has_any_text(texts)
+    return condition
@@ -0,0 +1,90 @@
+import shlex
+from typing import List, Union
+import uiautomator2 as u2
+
+# 常用按键名称到Android keycode的映射（与u2.Device.press的名称一致）
+KEYCODES = {
+    "home": "KEYCODE_HOME",
+    "back": "KEYCODE_BACK",
+    "enter": "KEYCODE_ENTER",
+    "delete": "KEYCODE_DEL",
+    "menu": "KEYCODE_MENU",
+    "search": "KEYCODE_SEARCH",
+    "recent": "KEYCODE_APP_SWITCH",
+}
+
+
+class InputBatch:
+    """批量输入序列
+
+    将点击、滑动、按键和延时排成一个shell脚本，通过一次adb shell调用发送到设备，
+    延时在设备端执行，整个序列只需一次往返。
+
+    示例:
+        InputBatch().tap(100, 200).delay(0.3).key("back").execute(device)
+    """
+
+    def __init__(self):
+        self._commands: List[str] = []
+        self._pending_keys: List[str] = []
+
+    def _flush_keys(self) -> None:
+        # 连续的按键合并为一条 input keyevent 命令
+        if self._pending_keys:
+            self._commands.append("input keyevent " + " ".join(self._pending_keys))
+            self._pending_keys = []
+
+    def tap(self, x: float, y: float) -> "InputBatch":
+        """点击屏幕坐标"""
+        self._flush_keys()
+        self._commands.append(f"input tap {int(x)} {int(y)}")
+        return self
+
+    def swipe(self, x1: float, y1: float, x2: float, y2: float, duration: float = 0.3) -> "InputBatch":
+        """滑动，duration单位为秒"""
+        self._flush_keys()
+        self._commands.append(f"input swipe {int(x1)} {int(y1)} {int(x2)} {int(y2)} {int(duration * 1000)}")
+        return self
+
+    def key(self, key: Union[str, int]) -> "InputBatch":
+        """按键，可以是按键名称（back/home等）、KEYCODE_*名称或数字keycode"""
+        if isinstance(key, str):
+            key = KEYCODES.get(key.lower(), key)
+        self._pending_keys.append(str(key))
+        return self
+
+    def text(self, value: str) -> "InputBatch":
+        """输入文本（input text只支持ASCII字符）"""
+        self._flush_keys()
+        self._commands.append("input text " + shlex.quote(value.replace(" ", "%s")))
+        return self
+
+    def delay(self, seconds: float) -> "InputBatch":
+        """在设备端等待"""
+        self._flush_keys()
+        if seconds > 0:
+            self._commands.append(f"sleep {seconds:g}")
+        return self
+
+    def script(self) -> str:
+        """生成设备端执行的shell脚本"""
+        self._flush_keys()
+        return "; ".join(self._commands)
+
+    def __len__(self) -> int:
+        return len(self._commands) + (1 if self._pending_keys else 0)
+
+    def execute(self, device: u2.Device, timeout: float = 60) -> str:
+        """通过一次shell调用在设备上执行整个序列
+
+        Args:
+            device: 设备实例
+            timeout: shell调用超时时间（秒）
+        Returns:
+            str: shell输出
+        """
+        script = self.script()
+        if not script:
+            return ""
+        output = device.shell(script, timeout=timeout)
+        return getattr(output, "output", output)
@@ -1,15 +1,23 @@
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
 import uiautomator2 as u2
 from pathlib import Path
 
-def capture_screenshot(device,save_path):
+def capture_screenshot(device, save_path, region=None):
     """
     捕获屏幕截图并保存到指定路径。
+
+    device可以是设备实例，也可以是截图后端（core.capture.CaptureBackend），
+    后者按配置的模式截图，并可以只截取区域 region=(x1, y1, x2, y2)。
     """
-    screenshot = device.screenshot()
-    screenshot.save(save_path)
+    if hasattr(device, "capture"):
+        image = device.capture(region).image
+    else:
+        image = device.screenshot(format='opencv')
+        if region is not None:
+            x1, y1, x2, y2 = region
+            image = image[y1:y2, x1:x2]
+    cv2.imwrite(str(save_path), image)
     return save_path
 
 def preprocess_image(image_path, target_size=(300, 300)):
@@ -35,10 +43,402 @@ def compare_images(image_path_a, image_path_b):
     img_a = preprocess_image(image_path_a)
     img_b = preprocess_image(image_path_b)
 
-    # 计算 SSIM
-    ssim_score, _ = ssim(img_a, img_b, full=True)
-    
-    # 计算 MSE
-    mse_score = calculate_mse(img_a, img_b)
+    ssim_matrix, mse_matrix = batch_compare(img_a[None], img_b[None])
+    return float(ssim_matrix[0, 0]), float(mse_matrix[0, 0])
+
+
+# SSIM常数（与skimage默认参数一致，data_range=255）
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+def prepare_frames(frames, target_size=(300, 300)):
+    """
+    将内存中的帧（BGR或灰度）批量预处理为 (N, H, W) 的float64灰度数组。
+    """
+    prepared = []
+    for frame in frames:
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if (gray.shape[1], gray.shape[0]) != tuple(target_size):
+            gray = cv2.resize(gray, target_size)
+        prepared.append(gray)
+    return np.stack(prepared).astype(np.float64)
+
+
+def _box_mean(stack, win):
+    """
+    计算最后两维上所有完整窗口的均值（valid模式）。
+
+    使用OpenCV的盒式滤波（滑动求和，与积分图等价，每像素O(1)），
+    结果裁掉边缘半个窗口，与skimage的SSIM裁剪方式一致。
+    """
+    height, width = stack.shape[-2:]
+    pad = (win - 1) // 2
+    flat = stack.reshape(-1, height, width)
+    out = np.empty((flat.shape[0], height - 2 * pad, width - 2 * pad), dtype=stack.dtype)
+    for i, img in enumerate(flat):
+        out[i] = cv2.blur(img, (win, win))[pad:height - pad, pad:width - pad]
+    return out.reshape(stack.shape[:-2] + out.shape[-2:])
+
+
+class ReferenceStack:
+    """
+    预加载的参考画面库，局部均值和方差只计算一次。
+    """
+
+    def __init__(self, images, names=None, target_size=(300, 300), win_size=7):
+        """
+        Args:
+            images: 参考图像列表（数组或图片路径）
+            names: 参考画面名称，默认为序号
+            target_size: 比较时统一缩放到的尺寸
+            win_size: SSIM窗口大小
+        """
+        loaded = [cv2.imread(str(img)) if isinstance(img, (str, Path)) else img for img in images]
+        for img, src in zip(loaded, images):
+            if img is None:
+                raise ValueError(f"无法读取图像: {src}")
+        self.names = list(names) if names is not None else [str(i) for i in range(len(loaded))]
+        self.target_size = tuple(target_size)
+        self.win_size = win_size
+        self.stack = prepare_frames(loaded, self.target_size)
+        self._flat = self.stack.reshape(len(self.stack), -1)
+        self._sq_sum = np.einsum("ij,ij->i", self._flat, self._flat)
+
+        # SSIM中只与参考画面有关的项，预先计算
+        n = win_size * win_size
+        cov_norm = n / (n - 1.0)
+        stack32 = self.stack.astype(np.float32)
+        mu = _box_mean(stack32, win_size)
+        self._stack32 = stack32
+        self._mu = mu
+        self._mu_sq_c1 = mu ** 2 + _SSIM_C1
+        self._var_c2 = (_box_mean(stack32 ** 2, win_size) - mu ** 2) * cov_norm + _SSIM_C2
+
+    @classmethod
+    def from_dir(cls, directory, **kwargs):
+        """
+        从目录加载所有图片作为参考画面，文件名（不含扩展名）作为名称。
+        """
+        paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+        return cls(paths, [p.stem for p in paths], **kwargs)
+
+    def __len__(self):
+        return len(self.stack)
+
+
+def batch_compare(frames, references, win_size=7, chunk=8):
+    """
+    一次性计算多帧与多张参考画面两两之间的SSIM和MSE。
+
+    SSIM采用均匀窗口（与skimage默认一致），局部统计量由盒式滤波得到。
+
+    Args:
+        frames: 帧列表/数组（BGR或灰度），或已预处理的 (N, H, W) 数组
+        references: ReferenceStack 或参考图像列表
+        win_size: SSIM窗口大小
+        chunk: 每次处理的帧数，用于限制中间数组的内存
+    Returns:
+        (ssim_matrix, mse_matrix): 形状均为 (帧数, 参考数)
+    """
+    if not isinstance(references, ReferenceStack):
+        references = ReferenceStack(references, win_size=win_size)
+    win = references.win_size
+    x = prepare_frames(frames, references.target_size)
+
+    # MSE: ||x||^2 + ||y||^2 - 2<x, y>，用矩阵乘法一次算完
+    flat = x.reshape(len(x), -1)
+    pixels = flat.shape[1]
+    sq_sum = np.einsum("ij,ij->i", flat, flat)
+    mse = (sq_sum[:, None] + references._sq_sum[None, :] - 2.0 * flat @ references._flat.T) / pixels
+    np.maximum(mse, 0.0, out=mse)
+
+    # SSIM：按帧分块，中间数组形状为 (块大小, 参考数, h, w)，全部原地计算
+    n = win * win
+    cov_norm = n / (n - 1.0)
+    x32 = x.astype(np.float32)
+    mu_x = _box_mean(x32, win)
+    var_x = (_box_mean(x32 ** 2, win) - mu_x ** 2) * cov_norm
+    mu_y = references._mu[None]
+    ssim_matrix = np.empty((len(x), len(references)))
+    for start in range(0, len(x), chunk):
+        stop = start + chunk
+        mx = mu_x[start:stop, None]
+        # 分子第二项: 2 * cov + C2
+        num = _box_mean(x32[start:stop, None] * references._stack32[None], win)
+        num -= mx * mu_y
+        num *= 2 * cov_norm
+        num += _SSIM_C2
+        # 分子第一项: 2 * mu_x * mu_y + C1
+        tmp = mx * mu_y
+        tmp *= 2
+        tmp += _SSIM_C1
+        num *= tmp
+        # 分母: (mu_x^2 + mu_y^2 + C1) * (var_x + var_y + C2)
+        np.add(mx ** 2, references._mu_sq_c1[None], out=tmp)
+        tmp *= var_x[start:stop, None] + references._var_c2[None]
+        num /= tmp
+        ssim_matrix[start:stop] = num.mean(axis=(-2, -1), dtype=np.float64)
+
+    return ssim_matrix, mse
+
+
+# 默认模板目录: 项目根目录下的 assets/images
+DEFAULT_TEMPLATE_DIR = Path(__file__).resolve().parents[2] / "assets" / "images"
+
+
+class MatchResult:
+    """
+    模板匹配结果，坐标均为整帧坐标。
+    """
+    __slots__ = ("name", "x", "y", "score", "scale", "rect")
+
+    def __init__(self, name, x, y, score, scale, rect):
+        self.name = name
+        self.x = x  # 匹配区域中心点x
+        self.y = y  # 匹配区域中心点y
+        self.score = score  # 置信度（归一化相关系数）
+        self.scale = scale  # 命中的模板缩放比例
+        self.rect = rect  # 匹配区域 (x1, y1, x2, y2)
+
+    @property
+    def center(self):
+        return self.x, self.y
+
+    def to_screen(self, to_screen):
+        """
+        用坐标换算函数（如 Frame.to_screen）将结果换算为屏幕坐标。
+        """
+        x, y = to_screen(self.x, self.y)
+        x1, y1 = to_screen(self.rect[0], self.rect[1])
+        x2, y2 = to_screen(self.rect[2], self.rect[3])
+        return MatchResult(self.name, x, y, self.score, self.scale, (x1, y1, x2, y2))
+
+    def __repr__(self):
+        return f"MatchResult({self.name!r}, x={self.x}, y={self.y}, score={self.score:.3f}, scale={self.scale})"
+
+
+def to_gray(image):
+    """
+    将BGR/BGRA图像转换为灰度图，已是灰度图时原样返回。
+    """
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def build_pyramid(gray, levels):
+    """
+    构建高斯金字塔，第0层为原图。
+    """
+    pyramid = [gray]
+    for _ in range(levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+class TemplateMatcher:
+    """
+    多尺度模板匹配引擎。
+
+    模板库只加载一次；每种目标分辨率的缩放模板及其金字塔在首次使用时计算并缓存。
+    匹配时先在金字塔顶层粗定位，再在原分辨率的小窗口内精确定位。
+    """
+
+    def __init__(self, template_dir=DEFAULT_TEMPLATE_DIR, reference_size=(1080, 1920),
+                 scales=(0.9, 1.0, 1.1), pyramid_levels=3, library=None):
+        """
+        Args:
+            template_dir: 模板图片目录，文件名（不含扩展名）即模板名称
+            reference_size: 模板截取时的屏幕分辨率 (宽, 高)
+            scales: 在分辨率换算基础上额外尝试的缩放比例
+            pyramid_levels: 粗匹配使用的金字塔层数
+            library: 已加载的灰度模板 {名称: 图像}（如共享内存中的只读视图），提供时不再读取目录
+        """
+        self.template_dir = Path(template_dir)
+        self.reference_size = tuple(reference_size)
+        self.scales = tuple(scales)
+        self.pyramid_levels = pyramid_levels
+        self._library = dict(library) if library is not None else {}
+        self._cache = {}
+        if library is None:
+            self._load_library()
+
+    def _load_library(self):
+        """
+        从模板目录加载所有模板（灰度）。
+        """
+        if not self.template_dir.is_dir():
+            return
+        for path in sorted(self.template_dir.iterdir()):
+            if path.suffix.lower() not in (".png", ".jpg", ".jpeg"):
+                continue
+            img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                raise ValueError(f"无法读取模板图像: {path}")
+            self._library[path.stem] = img
+
+    def add_template(self, name, image):
+        """
+        手动注册模板，会清空已缓存的缩放模板。
+        """
+        self._library[name] = to_gray(image)
+        self._cache.clear()
+
+    @property
+    def names(self):
+        return list(self._library)
+
+    @property
+    def library(self):
+        """
+        已加载的灰度模板 {名称: 图像}。
+        """
+        return dict(self._library)
+
+    def _templates_for(self, frame_size):
+        """
+        获取指定分辨率下的缩放模板金字塔，结果按分辨率缓存。
+
+        Returns:
+            dict: 模板名称 -> [(scale, 金字塔列表), ...]
+        """
+        cached = self._cache.get(frame_size)
+        if cached is not None:
+            return cached
+
+        ref_w, ref_h = self.reference_size
+        base = min(frame_size[0] / ref_w, frame_size[1] / ref_h)
+        templates = {}
+        for name, img in self._library.items():
+            variants = []
+            for extra in self.scales:
+                scale = base * extra
+                w = max(1, int(round(img.shape[1] * scale)))
+                h = max(1, int(round(img.shape[0] * scale)))
+                interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                resized = cv2.resize(img, (w, h), interpolation=interp)
+                variants.append((scale, build_pyramid(resized, self.pyramid_levels)))
+            templates[name] = variants
+        self._cache[frame_size] = templates
+        return templates
+
+    def match(self, frame, name, roi=None, threshold=0.8, frame_size=None):
+        """
+        在帧中查找单个模板。
+
+        Args:
+            frame: BGR或灰度图像
+            name: 模板名称
+            roi: 搜索区域 (x1, y1, x2, y2)，None表示整帧
+            threshold: 最低置信度
+            frame_size: 整帧尺寸 (宽, 高)，frame只是区域截图时用于换算模板大小
+        Returns:
+            MatchResult 或 None
+        """
+        return self.match_many(frame, [name], roi, threshold, frame_size).get(name)
+
+    def match_many(self, frame, names=None, roi=None, threshold=0.8, frame_size=None):
+        """
+        在同一帧中查找多个模板，帧金字塔只构建一次。
+
+        Returns:
+            dict: 模板名称 -> MatchResult，未达到阈值的模板不出现在结果中
+        """
+        gray = to_gray(frame)
+        height, width = gray.shape[:2]
+        templates = self._templates_for(tuple(frame_size) if frame_size else (width, height))
+
+        offset_x, offset_y = 0, 0
+        if roi is not None:
+            x1, y1, x2, y2 = roi
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(width, int(x2)), min(height, int(y2))
+            gray = gray[y1:y2, x1:x2]
+            offset_x, offset_y = x1, y1
+
+        frame_pyramid = build_pyramid(gray, self.pyramid_levels)
+        results = {}
+        for name in (names if names is not None else self._library):
+            if name not in templates:
+                raise KeyError(f"未知模板: {name}")
+            found = self._match_one(frame_pyramid, templates[name])
+            if found is None:
+                continue
+            score, scale, (x, y), (w, h) = found
+            if score < threshold:
+                continue
+            x += offset_x
+            y += offset_y
+            results[name] = MatchResult(name, x + w // 2, y + h // 2, score, scale, (x, y, x + w, y + h))
+        return results
+
+    def _match_one(self, frame_pyramid, variants):
+        """
+        粗到精匹配单个模板的所有缩放版本。
+
+        Returns:
+            (score, scale, (x, y), (w, h)) 或 None，坐标相对于搜索区域
+        """
+        best = None
+        for scale, tpl_pyramid in variants:
+            # 选择模板仍足够大的最高金字塔层做粗匹配
+            level = self.pyramid_levels
+            while level > 0 and min(tpl_pyramid[level].shape) < 8:
+                level -= 1
+
+            tpl = tpl_pyramid[level]
+            img = frame_pyramid[level]
+            if img.shape[0] < tpl.shape[0] or img.shape[1] < tpl.shape[1]:
+                continue
+            coarse = cv2.matchTemplate(img, tpl, cv2.TM_CCOEFF_NORMED)
+            _, coarse_score, _, (cx, cy) = cv2.minMaxLoc(coarse)
+
+            full = frame_pyramid[0]
+            tpl0 = tpl_pyramid[0]
+            th, tw = tpl0.shape
+            if level > 0:
+                # 在原分辨率下围绕粗定位结果的小窗口内精确匹配
+                factor = 2 ** level
+                margin = factor * 2
+                x0 = max(0, cx * factor - margin)
+                y0 = max(0, cy * factor - margin)
+                x1 = min(full.shape[1], cx * factor + tw + margin)
+                y1 = min(full.shape[0], cy * factor + th + margin)
+                window = full[y0:y1, x0:x1]
+                if window.shape[0] < th or window.shape[1] < tw:
+                    continue
+                fine = cv2.matchTemplate(window, tpl0, cv2.TM_CCOEFF_NORMED)
+                _, score, _, (fx, fy) = cv2.minMaxLoc(fine)
+                loc = (x0 + fx, y0 + fy)
+            else:
+                score, loc = coarse_score, (cx, cy)
+
+            if best is None or score > best[0]:
+                best = (float(score), scale, loc, (tw, th))
+        return best
+
+
+_matchers = {}
+
+
+def get_template_matcher(template_dir=DEFAULT_TEMPLATE_DIR, **kwargs):
+    """
+    获取进程内共享的模板匹配引擎，同一模板目录只加载一次。
+    """
+    key = str(Path(template_dir).resolve())
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = TemplateMatcher(template_dir, **kwargs)
+        _matchers[key] = matcher
+    return matcher
+
+
+def register_template_matcher(template_dir, matcher):
+    """
+    将已构建的模板匹配引擎注册为该模板目录在本进程内的共享实例。
+    """
+    _matchers[str(Path(template_dir).resolve())] = matcher
 
-    return ssim_score, mse_score
\ No newline at end of file
@@ -1,33 +1,119 @@
+import re
 import time
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import uiautomator2 as u2
 from utils.logger import Logger
+from utils.metrics import timed
+from core.config_model import DeviceConfig, compile_device_config
+from core.waiter import Condition, Waiter, WaitResult, activity_matches, package_is, region_settled, any_of
+from core.hierarchy import HierarchyCache, hierarchy_text_exists
+from core.frame_buffer import Frame, FrameBuffer
+from core.frame_archive import FrameArchive
+from core.match_pictures import MatchResult, get_template_matcher
+from core.screen_state import PageCheck, ScreenState, get_screen_index
+from core.input_batch import InputBatch
+from core.touch import TouchBackend, create_touch_backend
+from core.capture import CaptureBackend, Region, create_capture_backend
+from core.click_points import ClickPointMap, Point, default_click_targets, get_click_point_cache
+from core.retry import RetryPolicy, call_with_retry
 import numpy as np
 import cv2
 from PIL import Image
 import os
 import datetime
 
+# 购买流程依次点击的目标（click_points中的名称，也是模板名称）
+PURCHASE_TARGETS = ("add_to_cart", "cart_button", "checkout_button", "pay_button")
+
+# 提交搜索后应到达的搜索结果页
+SEARCH_RESULTS_PAGE = PageCheck((ScreenState.SEARCH_RESULTS,), ("加入购物车",))
+# 可以直接点击搜索框的小程序页面
+MINIPROGRAM_SEARCHABLE_PAGE = PageCheck((ScreenState.STORE_HOME, ScreenState.SEARCH_PAGE), ("分类", "购物车"))
+
+
+@dataclass
+class PurchasePlan:
+    """arm阶段预先计算好的点击序列"""
+    taps: List[Tuple[str, int, int]]  # (目标名称, x, y)
+    interval: float  # 相邻两次点击之间的间隔（秒）
+    screen_state: Optional[str] = None  # arm时识别到的页面状态
+    armed_at: float = field(default_factory=time.time)
+
+
 class MiniProgram:
-    def __init__(self, device: u2.Device, config: dict, logger: Logger):
+    def __init__(self, device: u2.Device, config: Union[DeviceConfig, dict], logger: Logger):
         self.device = device
-        self.config = config
+        # 字典配置在此编译校验一次，之后只读取属性
+        self.config: DeviceConfig = config if isinstance(config, DeviceConfig) else compile_device_config(config)
         self.logger = logger
-        self.miniprogram_config = config.get('miniprogram', {})
+        self.miniprogram_config = self.config.miniprogram
+        # 设备名称，用于指标统计
+        self.device_name = self.config.name or self.config.connect_info or getattr(device, 'serial', None) or 'device'
+        self.launch_timeout = self.miniprogram_config.launch_timeout
+        self.search_timeout = self.miniprogram_config.search_timeout
+        self.last_launch_path: Optional[str] = None  # 最近一次launch实际使用的路径: deep_link / navigation
+        # 步骤级重试：operation.retry_times次；deadline为当前时间窗口的结束时刻（time.time()），重试不会越过它
+        self.retry_policy = RetryPolicy.for_operation(self.config.operation)
+        self.deadline: Optional[float] = None
+        # 触控后端：默认u2，devices.yaml中可为每个设备选择minitouch
+        self.touch: TouchBackend = create_touch_backend(device, self.config, logger)
+        # 截图后端：默认JPEG，可配置设备端缩小或读取未编码帧缓冲的区域
+        self.capture: CaptureBackend = create_capture_backend(device, self.config, logger, self.device_name)
+        # 界面层级快照：一次dump，本地回答所有选择器查询；执行操作或轮询时失效
+        self.hierarchy = HierarchyCache(
+            device,
+            ttl=self.miniprogram_config.hierarchy_ttl,
+            device_name=self.device_name
+        )
+        self.waiter = Waiter(
+            logger,
+            poll_interval=self.miniprogram_config.poll_interval,
+            default_timeout=self.launch_timeout,
+            on_poll=self.hierarchy.invalidate
+        )
         
         # 在项目目录中创建screenshots文件夹
         current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.project_dir = current_dir
         self.screenshots_dir = os.path.join(current_dir, "screenshots")
         
         # 创建带有日期的子文件夹，以便更好地组织截图
         current_date = datetime.datetime.now().strftime("%Y-%m-%d")
         self.screenshots_dir = os.path.join(self.screenshots_dir, current_date)
         
-        # 确保目录存在
-        if not os.path.exists(self.screenshots_dir):
-            os.makedirs(self.screenshots_dir)
-            
-        self.logger.info(f"创建截图文件夹: {self.screenshots_dir}")
+        # 截图保存在内存环形缓冲区中，只在出错时由后台线程写入帧存档或上述目录
+        screenshot_on_error = self.config.options.screenshot_on_error
+        self.screenshot_on_error = (
+            self.miniprogram_config.screenshot_on_error if screenshot_on_error is None else screenshot_on_error
+        )
+        
+        # 页面状态索引（感知哈希），文件不存在时退回到基于文本的检测
+        self.screen_index = get_screen_index(
+            os.path.join(current_dir, self.miniprogram_config.screen_index), self.logger
+        )
+        
+        # 配置了帧存档时，截图按设备追加到分段存档中，代替单独的PNG文件
+        archive = None
+        if self.miniprogram_config.frame_archive:
+            archive = FrameArchive(
+                os.path.join(current_dir, self.miniprogram_config.frame_archive),
+                self.device_name,
+                logger,
+                max_bytes=int(self.miniprogram_config.frame_archive_max_mb * 2 ** 20),
+                classify=self._classify_image if self.screen_index is not None else None
+            )
+        self.frames = FrameBuffer(
+            logger,
+            self.screenshots_dir,
+            capacity=self.miniprogram_config.frame_buffer_size,
+            archive=archive,
+            record_all=self.miniprogram_config.frame_archive_all
+        )
+        
+        # 点击目标及其坐标表：坐标表在首次使用时按屏幕分辨率加载
+        self.click_targets = default_click_targets(self.miniprogram_config.name)
+        self._click_points: Optional[ClickPointMap] = None
 
     def _is_miniprogram_activity(self, activity: str) -> bool:
         """检查活动是否为小程序相关活动
@@ -52,39 +138,179 @@ class MiniProgram:
         # 检查活动名称是否在支持列表中
         return any(activity.endswith(act) for act in miniprogram_activities)
 
-    def _dump_hierarchy(self) -> str:
+    @timed("rpc.screenshot")
+    def _dump_hierarchy(self, label: str = "", region: Optional[Region] = None) -> Optional[Frame]:
         """获取当前界面的截图，用于分析界面元素
         
+        截图放入内存帧缓冲区，不在调用线程中写盘
+        
+        Args:
+            label: 步骤标签
+            region: 只截取的屏幕区域，None表示整个屏幕
         Returns:
-            str: 截图文件的完整路径
+            Optional[Frame]: 采集到的帧，失败时为None
         """
-        self.logger.info("正在获取屏幕截图...")
+        self.logger.debug("正在获取屏幕截图...")
         
         try:
-            # 生成截图文件名，包含时间戳
-            timestamp = int(time.time())
-            screenshot_filename = f"screen_{timestamp}.png"
-            screenshot_path = os.path.join(self.screenshots_dir, screenshot_filename)
-            
-            # 保存截图
-            self.device.screenshot(screenshot_path)
-            self.logger.info(f"已保存屏幕截图到: {screenshot_path}")
-            
-            return screenshot_path
+            return self.frames.capture(self.capture, label, region)
             
         except Exception as e:
             self.logger.error(f"截图过程中出错: {str(e)}")
-            return ""
+            return None
+
+    def _template_matcher(self):
+        """获取进程内共享的模板匹配引擎"""
+        return get_template_matcher(
+            os.path.join(self.project_dir, self.miniprogram_config.template_dir),
+            reference_size=self.miniprogram_config.template_resolution
+        )
+
+    def locate_element(self, name: str, roi: Optional[Tuple[int, int, int, int]] = None,
+                       threshold: float = 0.8) -> Optional[MatchResult]:
+        """通过模板匹配在当前画面中定位UI元素
+        
+        Args:
+            name: 模板名称（assets/images下的文件名，不含扩展名）
+            roi: 搜索区域 (x1, y1, x2, y2)，None表示整个屏幕
+            threshold: 最低置信度
+        Returns:
+            Optional[MatchResult]: 匹配结果（含屏幕中心坐标和置信度），未找到时为None
+        """
+        # 后端支持区域截图时只传输roi内的画面
+        frame = self._dump_hierarchy(name, roi if self.capture.supports_roi else None)
+        if frame is None:
+            return None
+        return self.match_in_frame(frame, name, roi, threshold)
+
+    def match_in_frame(self, frame: Frame, name: str, roi: Optional[Tuple[int, int, int, int]] = None,
+                       threshold: float = 0.8) -> Optional[MatchResult]:
+        """在已采集的帧中匹配UI元素，不再截图
+        
+        Args:
+            frame: 已采集的帧（整屏或区域）
+            name: 模板名称
+            roi: 搜索区域 (x1, y1, x2, y2)，屏幕坐标，None表示整个帧
+            threshold: 最低置信度
+        Returns:
+            Optional[MatchResult]: 匹配结果（屏幕坐标），未找到时为None
+        """
+        search = None
+        if roi is not None and frame.region is None:
+            search = tuple(int(v * frame.scale) for v in roi)
+        result = self._template_matcher().match(frame.image, name, search, threshold, frame.full_size)
+        if result is not None and (frame.region is not None or frame.scale != 1.0):
+            result = result.to_screen(frame.to_screen)
+        if result is None:
+            self.logger.info(f"未匹配到界面元素: {name}")
+        else:
+            self.logger.info(f"匹配到界面元素 {name}: ({result.x}, {result.y})，置信度 {result.score:.3f}")
+        return result
+
+    def detect_screen_state(self) -> Optional[str]:
+        """采集一帧画面并通过感知哈希识别当前页面状态
+        
+        Returns:
+            Optional[str]: 页面状态（ScreenState中的名称），无法识别或没有索引时为None
+        """
+        if self.screen_index is None:
+            return None
+        frame = self._dump_hierarchy("state")
+        if frame is None:
+            return None
+        state, distance = self.screen_index.classify(frame.image)
+        self.logger.debug(f"页面状态识别结果: {state}（汉明距离 {distance}）")
+        return state
+
+    def _classify_image(self, image: np.ndarray) -> Optional[str]:
+        """识别画面的页面状态，供帧存档在写盘线程中记录"""
+        return self.screen_index.classify(image)[0]
+
+    def _screen_state_in(self, *states: str) -> Optional[bool]:
+        """判断当前页面是否为指定状态之一
+        
+        Returns:
+            Optional[bool]: 索引能识别当前页面时返回判断结果，否则返回None由调用方退回其他检测方式
+        """
+        state = self.detect_screen_state()
+        if state is None:
+            return None
+        return state in states
+
+    def page_reached(self, check: PageCheck, label: str = "", capture: bool = False,
+                     on_reached: Optional[Callable[[Optional[Frame]], None]] = None) -> Condition:
+        """等待条件：当前页面满足check
+        
+        有页面状态索引时每次检查采集一帧并识别状态，无法识别时退回界面层级中的文本。
+        条件成立时以同一帧调用on_reached，调用方可以在这一帧上继续定位下一个目标而不必再截图。
+        
+        Args:
+            check: 页面判定条件
+            label: 帧标签
+            capture: 没有页面状态索引时是否也采集帧（供on_reached使用）
+            on_reached: 条件成立时的回调，参数为本次检查采集的帧（未采集时为None）
+        """
+        def condition() -> bool:
+            frame = None
+            if self.screen_index is not None or capture:
+                frame = self._dump_hierarchy(label)
+            ok = None
+            if frame is not None and self.screen_index is not None and check.states:
+                state, _ = self.screen_index.classify(frame.image)
+                if state is not None:
+                    ok = state in check.states
+            if ok is None:
+                ok = self.hierarchy.snapshot().has_any_text(check.texts)
+            if ok and on_reached is not None:
+                on_reached(frame)
+            return ok
+        return condition
+
+    def save_frames_on_error(self, reason: str) -> None:
+        """出错时采集当前画面并将缓冲区中的帧交给后台写盘
+        
+        Args:
+            reason: 出错原因标签
+        """
+        if not self.screenshot_on_error:
+            return
+        self._dump_hierarchy(reason)
+        self.frames.persist(reason)
+
+    @timed("rpc.click")
+    def tap(self, x: float, y: float) -> None:
+        """通过触控后端点击屏幕坐标，并使界面快照失效"""
+        self.touch.tap(x, y)
+        self.hierarchy.invalidate()
+
+    @timed("rpc.press")
+    def _press(self, key: str) -> None:
+        """按键，并使界面快照失效"""
+        self.device.press(key)
+        self.hierarchy.invalidate()
+
+    @timed("rpc.swipe")
+    def _swipe(self, fx: float, fy: float, tx: float, ty: float) -> None:
+        """滑动屏幕，并使界面快照失效"""
+        self.device.swipe(fx, fy, tx, ty)
+        self.hierarchy.invalidate()
+
+    @timed("rpc.input_batch")
+    def run_input_batch(self, batch: InputBatch) -> None:
+        """通过一次往返在设备上执行一组输入，并使界面快照失效"""
+        batch.execute(self.device)
+        self.hierarchy.invalidate()
 
     def _ensure_wechat_running(self) -> bool:
         """确保微信正在运行"""
-        package_name = self.miniprogram_config.get('package', 'com.tencent.mm')
+        package_name = self.miniprogram_config.package
         
         # 如果微信不在运行，启动它
         if self.device.app_current().get('package') != package_name:
             self.logger.info("启动微信...")
             self.device.app_start(package_name)
-            time.sleep(2)  # 等待启动
+            self.hierarchy.invalidate()
+            self.waiter.until(package_is(self.device, package_name), description="微信启动")
         
         # 确保回到主界面
         # self.logger.info("回到微信主界面1...")
@@ -100,35 +326,50 @@ class MiniProgram:
                 
         return True
 
+    @timed("main_interface")
     def ensure_wechat_main_interface(self):
         """确保在微信主界面"""
         self.logger.info("回到微信主界面2...")
         
-        # 多次按返回键，确保回到主界面
+        # 按返回键直到回到主界面，最多3次
         for _ in range(3):
-            self.device.press("back")
-            time.sleep(0.5)
+            if self._is_on_main_interface():
+                return True
+            self._press("back")
+            self.waiter.until(self._is_on_main_interface, timeout=0.5, description="返回主界面")
         
         # 检查是否在主界面
         if not self._is_on_main_interface():
             # 如果不在主界面，尝试点击"微信"tab
-            wechat_tab = self.device(text="微信", className="android.widget.TextView")
-            if wechat_tab.exists:
-                wechat_tab.click()
-                time.sleep(1)
+            wechat_tab = self.hierarchy.snapshot().first(text="微信", class_name="android.widget.TextView")
+            if wechat_tab is not None:
+                self.tap(*wechat_tab.center)
+                return bool(self.waiter.until(self._is_on_main_interface, timeout=1, description="微信主界面"))
         
         return self._is_on_main_interface()
 
+    def _wait_miniprogram_list(self) -> WaitResult:
+        """等待小程序列表页面加载完成"""
+        return self.waiter.until(
+            any_of(
+                activity_matches(self.device, self._is_miniprogram_activity),
+                hierarchy_text_exists(self.hierarchy, "最近使用", "我的小程序", "搜索小程序")
+            ),
+            timeout=self.launch_timeout,
+            description="小程序列表页面加载"
+        )
+
     def _is_on_main_interface(self):
         """检查是否在微信主界面"""
+        # 优先使用页面状态索引，一次截图即可判断
+        on_main = self._screen_state_in(ScreenState.WECHAT_MAIN)
+        if on_main is not None:
+            return on_main
         # 检查底部导航栏是否存在
-        tabs = ["微信", "通讯录", "发现", "我"]
-        for tab in tabs:
-            if not self.device(text=tab).exists:
-                return False
-        return True
+        return self.hierarchy.snapshot().has_all_texts(["微信", "通讯录", "发现", "我"])
 
 
+    @timed("entry_lookup")
     def _find_miniprogram_entry(self) -> bool:
         """找到并点击小程序入口
         Returns:
@@ -136,27 +377,23 @@ class MiniProgram:
         """
         try:
             # 尝试直接通过文本查找
-            miniprogram_btn = self.device(text="小程序")
-            if miniprogram_btn.exists:
+            miniprogram_btn = self.hierarchy.snapshot().first(text="小程序")
+            if miniprogram_btn is not None:
                 self.logger.info("找到小程序入口，点击进入...")
-                miniprogram_btn.click()
-                self.logger.info("等待小程序页面加载（10秒）...")
-                time.sleep(10)  # 等待页面完全加载
+                self.tap(*miniprogram_btn.center)
+                self._wait_miniprogram_list()
                 return True
             
             # 尝试通过滚动查找
             max_swipes = 3
             for _ in range(max_swipes):
                 # 向下滚动
-                self.device.swipe(0.5, 0.8, 0.5, 0.2)
-                time.sleep(0.5)
+                self._swipe(0.5, 0.8, 0.5, 0.2)
                 
-                miniprogram_btn = self.device(text="小程序")
-                if miniprogram_btn.exists:
+                if self.waiter.until(hierarchy_text_exists(self.hierarchy, "小程序"), timeout=0.5, description="滚动后出现小程序入口"):
                     self.logger.info("找到小程序入口，点击进入...")
-                    miniprogram_btn.click()
-                    self.logger.info("等待小程序页面加载（10秒）...")
-                    time.sleep(10)  # 等待页面完全加载
+                    self.tap(*self.hierarchy.snapshot().first(text="小程序").center)
+                    self._wait_miniprogram_list()
                     return True
                 
             self.logger.error("无法找到小程序入口")
@@ -166,6 +403,7 @@ class MiniProgram:
             self.logger.error(f"查找小程序入口时出错: {str(e)}")
             return False
 
+    @timed("grid_click")
     def _find_miniprogram_by_grid(self, name: str) -> bool:
         """通过网格位置尝试查找小程序
         
@@ -179,159 +417,228 @@ class MiniProgram:
         self.logger.info(f"通过网格位置尝试查找小程序: {name}")
         
         try:
-            # 获取屏幕尺寸
-            width, height = self.device.window_size()
-            self.logger.info(f"屏幕尺寸: {width}x{height}")
-            
-            # 网格位置 - 只保留第一个位置，即第二行第一列
-            # 根据日志显示，点击位置1就能成功进入小程序
-            grid_position = (width * 0.25, height * 0.4)
+            # 校准过的坐标，未校准时按名称定位；都没有时使用网格第二行第一列
+            grid_position = self.click_point("miniprogram_entry")
             
             self.logger.info("尝试点击小程序位置...")
             self.logger.info(f"点击位置: ({grid_position[0]}, {grid_position[1]})")
             
-            # 点击小程序位置
-            self.device.click(grid_position[0], grid_position[1])
-            
-            # 等待足够的时间让小程序加载
-            self.logger.info("等待小程序加载（5秒）...")
-            time.sleep(5)
+            # 记录点击前的活动，用于判断是否发生页面跳转
+            previous_activity = self.device.app_current().get('activity', '')
             
-            # 开始进行多种方式的检测
-            self.logger.info("开始检测是否已进入小程序...")
-            
-            # 检测方法1: 通过活动名称检测
-            current_app = self.device.app_current()
-            current_activity = current_app.get('activity')
-            
-            if self._is_miniprogram_activity(current_activity):
-                self.logger.info(f"成功进入小程序，活动变化为: {current_activity}")
-                return True
+            # 点击小程序位置
+            self.tap(grid_position[0], grid_position[1])
             
-            # 检测方法2: 通过界面元素检测
-            # 检查是否有小程序常见界面元素
+            # 检测方法1: 活动变化为小程序活动
+            # 检测方法2: 出现小程序常见界面元素
             common_elements = [
                 "首页", "分类", "购物车", "我的",  
             ]
+            entered = self.waiter.until(
+                any_of(
+                    activity_matches(
+                        self.device,
+                        lambda activity: activity != previous_activity and self._is_miniprogram_activity(activity)
+                    ),
+                    hierarchy_text_exists(self.hierarchy, *common_elements)
+                ),
+                timeout=self.launch_timeout,
+                description="进入小程序"
+            )
+            if entered:
+                self.logger.info(f"成功进入小程序，活动: {self.device.app_current().get('activity')}")
+                self.confirm_click_point("miniprogram_entry", grid_position)
+                return True
             
-            for element in common_elements:
-                if self.device(text=element).exists:
-                    self.logger.info(f"检测到小程序界面元素: '{element}'")
-                    return True
-            
-            # 检测方法3: 通过界面结构分析
-            # self.logger.info("尝试分析界面结构...")
-            # xml = self._dump_hierarchy()
-            
-            # 检测方法4: 检测文本元素数量
-            text_elements = self.device.xpath("//*[@text]").all()
-            clickable_elements = self.device.xpath("//*[@clickable='true']").all()
-            
-            self.logger.info(f"找到 {len(text_elements)} 个文本元素，{len(clickable_elements)} 个可点击元素")
+            # 校验失败：丢弃校准结果，下次在小程序列表中重新定位
+            self.click_points.forget("miniprogram_entry")
             
-            # 如果找到多个文本元素，但它们的文本内容为空，这仍然可能是小程序界面
-            # 胖东来小程序可能使用特殊渲染技术，使得文本无法被直接识别
-            if len(text_elements) > 0:
-                self.logger.info("检测到页面有文本元素，可能已进入小程序")
-                
-                # 尝试查找有意义的文本内容
-                for i in range(min(10, len(text_elements))):
-                    try:
-                        if text_elements[i].text and text_elements[i].text.strip():
-                            self.logger.info(f"找到有内容的文本元素: {text_elements[i].text}")
-                            return True
-                    except:
-                        pass
-                
-                # 即使没有找到有意义的文本，我们也假设已经进入了小程序
-                # 因为至少找到了文本元素，这表明页面不是空白的
-                self.logger.info("根据界面分析，假设已成功进入小程序")
+            # 检测方法3: 通过页面状态索引识别
+            in_store = self._screen_state_in(ScreenState.STORE_HOME, ScreenState.SEARCH_PAGE)
+            if in_store:
+                self.logger.info("根据页面状态识别，已进入小程序")
                 return True
             
-            # 如果以上所有检测都失败，但我们仍然认为进入了小程序（例如根据截图判断）
-            # 我们可以选择返回成功，而不是失败
-            self.logger.info("无法通过自动检测确认是否进入小程序，但假设已成功进入")
-            return True
+            self.logger.error("点击后未能确认进入小程序")
+            return False
             
         except Exception as e:
             self.logger.error(f"通过网格查找小程序时出错: {str(e)}")
-            # 即使发生错误，我们也返回成功，因为日志和截图表明我们已经进入了小程序
-            self.logger.info("即使发生错误，假设已成功进入小程序")
-            return True
+            return False
+
+    def _deep_link_url(self) -> Optional[str]:
+        """获取直接打开目标小程序的URL Scheme
+        
+        优先使用配置的deep_link，否则根据app_id和path拼接
+        
+        Returns:
+            Optional[str]: URL，未配置时为None
+        """
+        url = self.miniprogram_config.deep_link
+        if url:
+            return url
+        app_id = self.miniprogram_config.app_id
+        if not app_id:
+            return None
+        url = f"weixin://dl/business/?appid={app_id}"
+        path = self.miniprogram_config.path
+        if path:
+            url += f"&path={path}"
+        return url
+
+    @staticmethod
+    def _is_miniprogram_app_activity(activity: str) -> bool:
+        """检查活动是否为正在运行的小程序本身（而非小程序列表等页面）"""
+        return re.search(r'\.plugin\.appbrand\.ui\.AppBrandUI\d*$', activity or '') is not None
 
-    def launch(self) -> bool:
-        """启动小程序"""
+    @timed("deep_link")
+    def _launch_by_deep_link(self) -> bool:
+        """通过 am start 以URL Scheme直接打开目标小程序
+        
+        Returns:
+            bool: 是否成功进入小程序
+        """
+        url = self._deep_link_url()
+        package_name = self.miniprogram_config.package
+        self.logger.info(f"通过deep link打开小程序: {url}")
+        self.device.shell(['am', 'start', '-a', 'android.intent.action.VIEW', '-d', url, package_name])
+        self.hierarchy.invalidate()
+        
+        entered = self.waiter.until(
+            activity_matches(self.device, self._is_miniprogram_app_activity),
+            timeout=self.launch_timeout,
+            description="deep link进入小程序"
+        )
+        if not entered:
+            return False
+        self.waiter.until(region_settled(self.capture), timeout=self.launch_timeout, description="小程序首页渲染")
+        return True
+
+    @timed("navigation")
+    def _launch_by_navigation(self) -> bool:
+        """通过 发现 -> 小程序 -> 网格位置 的导航路径进入目标小程序
+        
+        Returns:
+            bool: 是否成功进入小程序
+        """
+        # 确保在微信主界面
+        if not self.ensure_wechat_main_interface():
+            return False
+        
+        # 点击发现按钮
+        discover_btn = self.hierarchy.snapshot().first(text="发现")
+        if discover_btn is None:
+            self.logger.error("找不到发现按钮")
+            return False
+        self.tap(*discover_btn.center)
+        self.waiter.until(hierarchy_text_exists(self.hierarchy, "小程序"), timeout=2, description="发现页面加载")
+        
+        # 找到并点击小程序入口
+        if not self._find_miniprogram_entry():
+            return False
+        
+        # 尝试验证是否真的是小程序页面
+        self.logger.info("尝试验证是否进入小程序页面...")
+        
+        # 方法1: 通过页面状态索引识别，无法识别时检查页面上是否有"小程序"相关文本
+        found_text = self._screen_state_in(ScreenState.MINIPROGRAM_LIST)
+        if found_text is None:
+            miniprogram_texts = ["小程序", "最近使用", "我的小程序", "搜索小程序"]
+            found_text = self.hierarchy.snapshot().has_any_text(miniprogram_texts)
+            if found_text:
+                self.logger.info("找到小程序页面元素")
+                
+        # 方法2: 尝试获取当前活动的应用和界面信息
+        current_app = self.device.app_current()
+        
+        # 确认是否在小程序页面
+        is_miniprogram_page = (
+            current_app.get('package') == 'com.tencent.mm' and
+            self._is_miniprogram_activity(current_app.get('activity', ''))
+        )
+        
+        if not (is_miniprogram_page or found_text):
+            self.logger.error("未能进入小程序列表页面")
+            return False
+        
+        # 尝试通过网格位置查找目标小程序
+        target_name = self.miniprogram_config.name
+        if not self._find_miniprogram_by_grid(target_name):
+            return False
+        self.logger.info(f"成功点击进入小程序: {target_name}")
+        
+        # 等待小程序完全加载（画面稳定）
+        self.waiter.until(region_settled(self.capture), timeout=self.launch_timeout, description="小程序首页渲染")
+        return True
+
+    def _retry(self, operation: str, step: Callable[[], bool]) -> bool:
+        """执行步骤，暂时性失败时按operation.retry_times退避重试，不越过deadline
+        
+        Args:
+            operation: 步骤名称，用于日志和重试统计
+            step: 返回是否成功的步骤
+        Returns:
+            bool: 步骤最终是否成功
+        """
+        return bool(call_with_retry(step, self.retry_policy, self.logger, self.device_name, operation, self.deadline))
+
+    @timed("launch")
+    def launch(self, keyword: Optional[str] = None) -> bool:
+        """启动小程序
+        
+        launch_mode为auto时优先通过deep link直接打开，失败后退回导航路径；
+        为deep_link或navigation时只使用对应的路径。实际使用的路径记录在last_launch_path中。
+        进入小程序后搜索关键词。导航和搜索失败时按operation.retry_times重试。
+        
+        Args:
+            keyword: 搜索关键词，None使用配置中的关键词
+        Returns:
+            bool: 是否进入小程序并完成搜索
+        """
+        self.last_launch_path = None
+        start = time.perf_counter()
+        launch_mode = self.miniprogram_config.launch_mode
         try:
             # 确保微信在运行
             if not self._ensure_wechat_running():
                 return False
-                
-            # 确保在微信主界面
-            if not self.ensure_wechat_main_interface():
-                return False
-            
-            # 点击发现按钮
-            discover_btn = self.device(text="发现")
-            if not discover_btn.exists:
-                self.logger.error("找不到发现按钮")
-                return False
-            discover_btn.click()
-            time.sleep(0.5)
             
-            # 找到并点击小程序入口
-            if not self._find_miniprogram_entry():
+            entered = False
+            if launch_mode in ('auto', 'deep_link') and self._deep_link_url():
+                entered = self._launch_by_deep_link()
+                if entered:
+                    self.last_launch_path = 'deep_link'
+                else:
+                    self.logger.warning("deep link打开小程序失败")
+            
+            if not entered and launch_mode in ('auto', 'navigation'):
+                entered = self._retry("navigation", self._launch_by_navigation)
+                if entered:
+                    self.last_launch_path = 'navigation'
+            
+            if not entered:
+                self.logger.error("无法进入小程序")
+                self.save_frames_on_error("launch_failed")
                 return False
             
-            
-            # 尝试验证是否真的是小程序页面
-            self.logger.info("尝试验证是否进入小程序页面...")
-            
-            # 方法1: 检查页面上是否有"小程序"相关文本
-            miniprogram_texts = ["小程序", "最近使用", "我的小程序", "搜索小程序"]
-            found_text = False
-            for text in miniprogram_texts:
-                if self.device(text=text).exists:
-                    self.logger.info(f"找到小程序页面元素: '{text}'")
-                    found_text = True
-                    
-            # 方法2: 尝试获取当前活动的应用和界面信息
-            current_app = self.device.app_current()
-            # self.logger.info(f"当前应用信息: {current_app}")
-            
-            # 确认是否在小程序页面
-            is_miniprogram_page = (
-                current_app.get('package') == 'com.tencent.mm' and
-                self._is_miniprogram_activity(current_app.get('activity', ''))
+            self.logger.info(
+                f"通过 {self.last_launch_path} 路径进入小程序，耗时 {time.perf_counter() - start:.3f}秒"
             )
             
-            # self.logger.info(f"是否在小程序页面: {is_miniprogram_page}")
-            
-            if is_miniprogram_page or found_text:
-                # 尝试通过网格位置查找目标小程序
-                target_name = self.miniprogram_config.get('name', '胖东来')
-                if self._find_miniprogram_by_grid(target_name):
-                    self.logger.info(f"成功点击进入小程序: {target_name}")
-                    
-                    # 等待小程序完全加载
-                    self.logger.info("等待小程序完全加载（10秒）...")
-                    time.sleep(10)
-                    
-                    # 在小程序首页点击搜索框
-                    keyword = self.miniprogram_config.get('search_keyword', '啤酒')
-                    if self.search_in_miniprogram(keyword):
-                        self.logger.info(f"成功在小程序中搜索关键词: {keyword}")
-                    else:
-                        self.logger.error(f"在小程序中搜索关键词失败: {keyword}")
-                    
-                    return True
-            
-            self.logger.info("页面结构分析完成")
+            # 在小程序首页点击搜索框
+            keyword = keyword or self.miniprogram_config.search_keyword
+            if not self._retry("search", lambda: self.search_in_miniprogram(keyword)):
+                self.logger.error(f"在小程序中搜索关键词失败: {keyword}")
+                return False
+            self.logger.info(f"成功在小程序中搜索关键词: {keyword}")
             return True
             
         except Exception as e:
             self.logger.error(f"启动小程序时发生错误: {str(e)}")
-            return True
+            self.save_frames_on_error("launch_error")
+            return False
 
+    @timed("search")
     def search_in_miniprogram(self, keyword: str) -> bool:
         """在小程序中查找搜索框并进行搜索
         
@@ -346,20 +653,19 @@ class MiniProgram:
             # 步骤1: 点击搜索框进入搜索页面
             if not self._click_search_box():
                 self.logger.error("无法找到或点击搜索框")
+                self.save_frames_on_error("search_box_error")
                 return False
                 
-            # 步骤2: 等待搜索页面加载
-            self.logger.info("等待搜索页面加载...")
-            time.sleep(2)
-            
-            # 步骤3: 输入搜索关键词
+            # 步骤2: 输入搜索关键词
             if not self._input_search_keyword(keyword):
                 self.logger.error(f"无法输入搜索关键词: {keyword}")
+                self.save_frames_on_error("input_error")
                 return False
                 
-            # 步骤4: 提交搜索
+            # 步骤3: 提交搜索
             if not self._submit_search():
                 self.logger.error("无法提交搜索请求")
+                self.save_frames_on_error("submit_error")
                 return False
                 
             # 成功完成搜索
@@ -368,8 +674,26 @@ class MiniProgram:
             
         except Exception as e:
             self.logger.error(f"搜索过程中发生错误: {str(e)}")
+            self.save_frames_on_error("search_error")
             return False
 
+    def search_next(self, keyword: str) -> bool:
+        """接着上一次搜索再搜索一个关键词，在搜索结果页时先返回搜索页，不在小程序中时先启动小程序
+
+        Args:
+            keyword: 要搜索的关键词
+        Returns:
+            bool: 是否成功搜索
+        """
+        if self.page_reached(SEARCH_RESULTS_PAGE, "search_next")():
+            self._press("back")
+        elif not self.page_reached(MINIPROGRAM_SEARCHABLE_PAGE, "search_next")():
+            # 还没有进入小程序（如刚连接的设备），launch进入小程序后即搜索该关键词
+            self.logger.info("当前不在小程序中，先启动小程序")
+            return self.launch(keyword)
+        return self.search_in_miniprogram(keyword)
+
+    @timed("search_box")
     def _click_search_box(self) -> bool:
         """在小程序首页找到并点击搜索框
         
@@ -379,33 +703,36 @@ class MiniProgram:
         self.logger.info("尝试查找并点击搜索框...")
         
         try:
-            # 直接点击已知可行的位置 - 位置3(270.0, 124.80)
-            width, height = self.device.window_size()
-            search_x = width * 0.5  # 270.0 为屏幕宽度的一半
-            search_y = height * 0.13  # 124.80 约为屏幕高度的13%
-            
-            self.logger.info(f"直接点击已知有效的搜索框位置: ({search_x}, {search_y})")
-            self.device.click(search_x, search_y)
-            # 增加等待时间，确保搜索页面有足够时间加载
-            self.logger.info("等待搜索页面加载...")
-            time.sleep(3)
-            
-            # 使用多种方法检查是否已进入搜索页面
-            
-            # 方法3: 保存截图并检查页面结构
-            self.logger.info("未检测到明确的搜索页面元素，获取屏幕截图...")
-            screenshot_path = self._dump_hierarchy()
-            self.logger.info(f"已保存搜索页面截图: {screenshot_path}")
-            
-            # 假设我们已经进入搜索页面
-            # 根据日志，点击位置3后实际上已经进入搜索页，但可能无法通过UI元素检测到
-            # self.logger.info("假设已成功进入搜索页面")
-            return True
+            point = self.click_point("search_box")
+            for attempt in range(2):
+                self.logger.info(f"点击搜索框位置: {point}（{'已校准' if self.click_points.get('search_box') == point else '未校准'}）")
+                self.tap(*point)
+                # 校验：出现获得焦点的输入框
+                entered = self.waiter.until(
+                    lambda: self.hierarchy.snapshot().exists(class_name="android.widget.EditText", focused=True),
+                    timeout=self.search_timeout,
+                    description="搜索页面加载"
+                )
+                if entered:
+                    self.confirm_click_point("search_box", point)
+                    return True
+                # 校验失败时在当前页面重新校准一次，定位不到新坐标则不再重试
+                point = self.recalibrate_click_point("search_box", point) if attempt == 0 else None
+                if point is None:
+                    break
+            
+            # 方法3: 通过页面状态索引识别
+            if self._screen_state_in(ScreenState.SEARCH_PAGE):
+                self.logger.info("根据页面状态识别，已进入搜索页面")
+                return True
+            self.logger.error("点击搜索框后未能确认进入搜索页面")
+            return False
             
         except Exception as e:
             self.logger.error(f"查找搜索框时发生错误: {str(e)}")
             return False
             
+    @timed("input")
     def _input_search_keyword(self, keyword: str) -> bool:
         """在搜索页面输入关键词
         
@@ -419,11 +746,11 @@ class MiniProgram:
         try:
             # 清除可能存在的文本，确保搜索框是空的
             self.device.clear_text()
-            time.sleep(0.5)
             
             # 发送输入关键词
             self.device.send_keys(keyword)
-            time.sleep(1)
+            self.hierarchy.invalidate()
+            self.waiter.until(hierarchy_text_exists(self.hierarchy, keyword), timeout=1, description="关键词输入")
             
             # 检查是否已成功输入
             # 这里不进行额外的检查，避免重复输入
@@ -434,6 +761,7 @@ class MiniProgram:
             self.logger.error(f"输入搜索关键词时发生错误: {str(e)}")
             return False
             
+    @timed("submit")
     def _submit_search(self) -> bool:
         """提交搜索请求
         Returns:
@@ -441,13 +769,15 @@ class MiniProgram:
         """
         self.logger.info("尝试提交搜索请求...")
         try:
-            # 保存并检查搜索后的截图
-            after_search_path = self._dump_hierarchy()
-            self.logger.info(f"搜索提交后截图保存至: {after_search_path}")
-            
-            # 如果以上方法都没有明确成功，我们保守地假设搜索已提交成功
-            # 微信小程序的特殊渲染方式可能导致无法通过标准UI元素检测变化
-            return True
+            # 输入法的搜索键
+            self._press("enter")
+            # 校验：到达搜索结果页
+            submitted = self.waiter.until(
+                self.page_reached(SEARCH_RESULTS_PAGE, "after_search"),
+                timeout=self.search_timeout,
+                description="搜索结果加载"
+            )
+            return bool(submitted)
             
         except Exception as e:
             self.logger.error(f"提交搜索请求时发生错误: {str(e)}")
@@ -467,20 +797,221 @@ class MiniProgram:
         """
         self.logger.info("尝试聚焦搜索框...")
         try:
-            # 获取屏幕尺寸
-            width,height = self.device.window_size()
-            # 计算底部区域的中心点 y 130
-            bottom_center_x = width / 2 # 270.0 为屏幕宽度的一半
-            bottom_center_y = 130  # 130
             # 聚焦输入框
-            self.logger.info(f"点击输入框区域: ({bottom_center_x}, {bottom_center_y})")
-            self.device.click(bottom_center_x, bottom_center_y)
-            self.logger.info(f"点击首个标签位置: x 50 y 230")
-            time.sleep(1)
-            self.device.click(50, 230)
+            input_point = self.click_point("search_input")
+            self.logger.info(f"点击输入框区域: {input_point}")
+            self.tap(*input_point)
+            tag_point = self.click_point("history_tag")
+            self.logger.info(f"点击首个标签位置: {tag_point}")
+            self.waiter.until(region_settled(self.capture), timeout=1, description="历史搜索标签出现")
+            self.tap(*tag_point)
             # crop参数 x1 左 y1 上 x2 右 y2 下
             # self.device.screenshot().crop((50, 200, 100, 250)).save('pijiu.png')
         except Exception as e:
             self.logger.error(f"聚焦输入框 - 点击历史搜索tag出错: {str(e)}")
             return False
-        return True
\ No newline at end of file
+        return True
+
+    def _configured_click_points(self, width: int, height: int) -> Dict[str, Point]:
+        """设备配置中的click_points，按实际分辨率换算
+        
+        Args:
+            width: 屏幕宽度
+            height: 屏幕高度
+        Returns:
+            Dict[str, Point]: 目标名称到屏幕坐标的映射
+        """
+        scale_x = scale_y = 1.0
+        resolution = self.config.resolution
+        if resolution:
+            res_w, res_h = resolution
+            # devices.yaml中的分辨率可能按 高x宽 书写
+            if (res_w, res_h) == (height, width) and width != height:
+                res_w, res_h = res_h, res_w
+            scale_x, scale_y = width / res_w, height / res_h
+        return {name: (int(x * scale_x), int(y * scale_y)) for name, (x, y) in self.config.click_points.items()}
+
+    @property
+    def click_points(self) -> ClickPointMap:
+        """当前分辨率下的点击坐标表，首次使用时查询屏幕尺寸并加载缓存"""
+        if self._click_points is None:
+            width, height = self.device.window_size()
+            self._click_points = ClickPointMap(
+                get_click_point_cache(os.path.join(self.project_dir, self.miniprogram_config.click_point_cache)),
+                self.config.connect_info or self.device_name,
+                (width, height),
+                self._configured_click_points(width, height)
+            )
+        return self._click_points
+
+    def _locate_click_target(self, name: str, frame: Optional[Frame] = None) -> Optional[Tuple[Point, str]]:
+        """在当前页面上定位点击目标：先查界面层级，再用同名模板匹配
+        
+        Args:
+            name: 目标名称
+            frame: 已采集的帧，模板匹配在这一帧上进行；None表示重新截图
+        Returns:
+            Optional[Tuple[Point, str]]: (屏幕坐标, 定位方式)，当前页面上找不到时为None
+        """
+        target = self.click_targets.get(name)
+        if target is not None and target.selectors:
+            snapshot = self.hierarchy.snapshot()
+            for selector in target.selectors:
+                node = snapshot.first(**selector)
+                if node is not None and node.bounds[2] > node.bounds[0] and node.bounds[3] > node.bounds[1]:
+                    return node.center, "hierarchy"
+        if name in self._template_matcher().names:
+            match = self.locate_element(name) if frame is None else self.match_in_frame(frame, name)
+            if match is not None:
+                return match.center, "template"
+        return None
+
+    def calibrate_click_point(self, name: str, frame: Optional[Frame] = None) -> Optional[Point]:
+        """在当前页面上校准一个点击目标，并写入坐标缓存
+        
+        Args:
+            name: 目标名称
+            frame: 已采集的帧，None表示需要时重新截图
+        Returns:
+            Optional[Point]: 校准得到的坐标，当前页面上找不到时为None
+        """
+        located = self._locate_click_target(name, frame)
+        if located is None:
+            return None
+        point, source = located
+        self.click_points.set(name, point, source)
+        self.logger.info(f"校准点击目标 {name}: {point}（{source}）")
+        return point
+
+    def recalibrate_click_point(self, name: str, previous: Optional[Point] = None) -> Optional[Point]:
+        """校验失败后丢弃旧坐标并重新校准
+        
+        Args:
+            name: 目标名称
+            previous: 校验失败的坐标，None表示表中已校准的坐标
+        Returns:
+            Optional[Point]: 与旧坐标不同的新坐标，定位不到或没有变化时为None
+        """
+        previous = previous or self.click_points.get(name)
+        self.click_points.forget(name)
+        point = self.calibrate_click_point(name)
+        if point is None or point == previous:
+            return None
+        return point
+
+    def calibrate(self, names: Optional[List[str]] = None) -> Dict[str, Point]:
+        """校准模式：在当前页面上定位尚未校准的目标并写入缓存
+        
+        在流程的各个页面上分别调用，即可完成该设备在当前分辨率下的校准。
+        
+        Args:
+            names: 要校准的目标，None表示所有目标
+        Returns:
+            Dict[str, Point]: 本次校准得到的坐标
+        """
+        calibrated = {}
+        for name in names or list(self.click_targets):
+            if self.click_points.source(name) == "calibrated":
+                continue
+            point = self.calibrate_click_point(name)
+            if point is not None:
+                calibrated[name] = point
+        return calibrated
+
+    def click_point(self, name: str) -> Optional[Point]:
+        """获取点击目标的坐标
+        
+        已校准时直接查表；否则在当前页面上校准，仍找不到时依次使用目标的兜底比例坐标（已验证的位置）
+        和devices.yaml中配置的坐标。未校准的坐标在点击后校验通过时记为已校准。
+        
+        Args:
+            name: 目标名称
+        Returns:
+            Optional[Point]: 屏幕坐标，无法确定时为None
+        """
+        point = self.click_points.get(name)
+        if point is not None:
+            return point
+        point = self.calibrate_click_point(name)
+        if point is not None:
+            return point
+        target = self.click_targets.get(name)
+        if target is not None and target.fallback is not None:
+            width, height = self.click_points.screen_size
+            return int(width * target.fallback[0]), int(height * target.fallback[1])
+        return self.click_points.configured(name)
+
+    def confirm_click_point(self, name: str, point: Point) -> None:
+        """点击后校验通过：未校准的坐标（配置或兜底）记为已校准，之后直接查表"""
+        if self.click_points.source(name) != "calibrated":
+            self.click_points.set(name, point, "verified")
+
+    @timed("arm")
+    def arm(self, keyword: Optional[str] = None) -> Optional[PurchasePlan]:
+        """准备阶段：导航到搜索结果页，预先计算购买流程的点击坐标并校验页面状态
+        
+        所有耗时的导航、识别工作都在此完成，fire阶段只执行点击。
+        
+        Args:
+            keyword: 搜索关键词，None使用配置中的关键词
+        Returns:
+            Optional[PurchasePlan]: 点击计划，准备失败时为None
+        """
+        self.logger.info("开始准备购买流程（arm）...")
+        if not self.launch(keyword):
+            self.logger.error("准备阶段导航失败")
+            return None
+        
+        state = self.detect_screen_state()
+        if state is not None and state not in (ScreenState.SEARCH_PAGE, ScreenState.SEARCH_RESULTS):
+            self.logger.error(f"准备阶段页面状态不符，当前页面: {state}")
+            self.save_frames_on_error("arm_state_error")
+            return None
+        
+        # fire不做任何校验，只接受已校准或点击后校验过的坐标；未校准的目标先在当前页面上定位一次，
+        # 只在后续页面出现的目标需要先通过购买流程（PurchasePipeline）或校准模式校准
+        taps = []
+        for name in PURCHASE_TARGETS:
+            if self.click_points.source(name) != "calibrated" and self.calibrate_click_point(name) is None:
+                self.logger.error(f"点击目标 {name} 尚未校准（配置坐标未经校验，不用于fire），请先运行购买流程或校准模式")
+                return None
+            point = self.click_points.get(name)
+            taps.append((name, point[0], point[1]))
+        
+        interval = self.config.operation.click_interval
+        plan = PurchasePlan(taps, interval, state)
+        self.logger.info(f"购买流程准备完成，点击计划: {taps}")
+        return plan
+
+    @timed("fire")
+    def fire(self, plan: PurchasePlan) -> bool:
+        """执行阶段：只按计划依次点击，不做任何导航或识别
+        
+        Args:
+            plan: arm阶段生成的点击计划
+        Returns:
+            bool: 是否执行完所有点击
+        """
+        start = time.perf_counter()
+        try:
+            if self.config.operation.batch_input:
+                # 整个点击序列一次发送到设备，间隔在设备端执行；每个input tap在设备端都要启动一次app_process，
+                # 只在触控后端的单次点击比这更慢时才值得开启
+                batch = InputBatch()
+                for i, (name, x, y) in enumerate(plan.taps):
+                    if i > 0:
+                        batch.delay(plan.interval)
+                    batch.tap(x, y)
+                self.run_input_batch(batch)
+            else:
+                # 默认通过触控后端（u2或minitouch的常驻连接）逐个点击
+                for i, (name, x, y) in enumerate(plan.taps):
+                    if i > 0 and plan.interval > 0:
+                        time.sleep(plan.interval)
+                    self.tap(x, y)
+        except Exception as e:
+            self.logger.error(f"执行点击计划时出错: {str(e)}")
+            self.save_frames_on_error("fire_error")
+            return False
+        self.logger.info(f"点击计划执行完成，共 {len(plan.taps)} 次点击，耗时 {time.perf_counter() - start:.3f}秒")
+        return True
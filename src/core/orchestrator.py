@@ -0,0 +1,150 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+from utils.logger import Logger
+from core.miniprogram import MiniProgram
+
+
+class CancelPolicy:
+    """批量执行的取消策略"""
+    NONE = "none"  # 等待所有设备执行完成
+    FIRST_FAILURE = "first_failure"  # 任一设备失败即取消其余设备
+    FIRST_SUCCESS = "first_success"  # 任一设备成功即取消其余设备
+
+
+class AsyncOrchestrator:
+    """基于asyncio的设备编排器
+
+    设备操作（阻塞的uiautomator2调用）在常驻线程池中执行，
+    通过信号量限制同时执行的设备数量，避免大量设备同时请求压垮adb server。
+
+    注意：超时或被取消的操作只是不再等待其结果，已经在线程中运行的阻塞调用会继续执行到结束并占用线程，
+    因此超时从操作在线程中开始执行时计算，排队等待空闲线程的时间不计入。
+    """
+
+    def __init__(self, logger: Logger, max_concurrency: int = 8):
+        """初始化编排器
+
+        Args:
+            logger: 日志记录器
+            max_concurrency: 同时执行操作的最大设备数
+        """
+        self.logger = logger
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="device")
+
+    async def run_in_executor(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在常驻线程池中执行阻塞函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def run_all(self, device_ids: Iterable[str], func: Callable[[str], bool],
+                      timeout: Optional[float] = None,
+                      cancel_policy: str = CancelPolicy.NONE) -> Dict[str, bool]:
+        """在多个设备上并发执行操作
+
+        Args:
+            device_ids: 设备ID列表
+            func: 接受设备ID、返回是否成功的阻塞函数
+            timeout: 单个设备操作的超时时间（秒），从操作开始执行时计算，None表示不限制
+            cancel_policy: 取消策略，见CancelPolicy
+        Returns:
+            Dict[str, bool]: 设备ID到操作结果的映射，超时或被取消的设备结果为False
+        """
+        device_ids = list(device_ids)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, bool] = {}
+
+        async def run_one(device_id: str) -> bool:
+            async with semaphore:
+                loop = asyncio.get_running_loop()
+                started = asyncio.Event()
+
+                def call() -> bool:
+                    loop.call_soon_threadsafe(started.set)
+                    return func(device_id)
+
+                future = None
+                try:
+                    future = loop.run_in_executor(self.executor, call)
+                    # 之前超时的调用可能仍占着线程，等到本设备的操作真正开始执行才开始计时
+                    await started.wait()
+                    return bool(await asyncio.wait_for(future, timeout))
+                except asyncio.CancelledError:
+                    # 还在排队的调用不再执行
+                    if future is not None:
+                        future.cancel()
+                    raise
+                except asyncio.TimeoutError:
+                    self.logger.warning(f"设备 {device_id} 操作超时（{timeout}秒）")
+                    return False
+                except Exception as e:
+                    self.logger.error(f"设备 {device_id} 操作出错: {str(e)}")
+                    return False
+
+        tasks = {asyncio.create_task(run_one(device_id)): device_id for device_id in device_ids}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            stop = False
+            for task in done:
+                ok = task.result()
+                results[tasks[task]] = ok
+                if (cancel_policy == CancelPolicy.FIRST_FAILURE and not ok) or \
+                        (cancel_policy == CancelPolicy.FIRST_SUCCESS and ok):
+                    stop = True
+
+            if stop and pending:
+                cancelled = [tasks[task] for task in pending]
+                self.logger.info(f"根据取消策略 {cancel_policy} 取消设备: {cancelled}")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+
+        return {device_id: results.get(device_id, False) for device_id in device_ids}
+
+    def run(self, device_ids: Iterable[str], func: Callable[[str], bool],
+            timeout: Optional[float] = None,
+            cancel_policy: str = CancelPolicy.NONE) -> Dict[str, bool]:
+        """run_all的同步版本，供非异步代码调用
+
+        每次调用创建并关闭一个事件循环，不能在正在运行的事件循环中调用（如async函数或Jupyter中），
+        此时应改为 await run_all(...)。
+
+        Raises:
+            RuntimeError: 当前线程中已有正在运行的事件循环
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.run_all(device_ids, func, timeout, cancel_policy))
+        raise RuntimeError("AsyncOrchestrator.run 不能在正在运行的事件循环中调用，请改用 await run_all(...)")
+
+    def shutdown(self) -> None:
+        """关闭线程池"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncMiniProgram:
+    """MiniProgram的协程版本，阻塞操作在编排器的线程池中执行"""
+
+    def __init__(self, miniprogram: MiniProgram, orchestrator: AsyncOrchestrator):
+        self.miniprogram = miniprogram
+        self.orchestrator = orchestrator
+
+    async def launch(self) -> bool:
+        """启动小程序"""
+        return await self.orchestrator.run_in_executor(self.miniprogram.launch)
+
+    async def ensure_wechat_main_interface(self) -> bool:
+        """确保在微信主界面"""
+        return await self.orchestrator.run_in_executor(self.miniprogram.ensure_wechat_main_interface)
+
+    async def search_in_miniprogram(self, keyword: str) -> bool:
+        """在小程序中搜索关键词"""
+        return await self.orchestrator.run_in_executor(self.miniprogram.search_in_miniprogram, keyword)
+
+    async def detect_screen_state(self) -> Optional[str]:
+        """识别当前页面状态"""
+        return await self.orchestrator.run_in_executor(self.miniprogram.detect_screen_state)
@@ -0,0 +1,319 @@
+import os
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import uiautomator2 as u2
+from utils.logger import Logger
+from utils.metrics import Histogram, metrics
+from core.config_model import DeviceConfig
+from core.miniprogram import MiniProgram, PurchasePlan
+from core.frame_buffer import FrameBuffer
+from core.match_pictures import TemplateMatcher, get_template_matcher, register_template_matcher
+from core.shared_arrays import Descriptor, SharedArrays
+from core.retry import retry_stats
+
+# 模板在共享数组库中的名称前缀
+_TEMPLATE_PREFIX = "template/"
+
+
+def is_picklable(obj: Any) -> bool:
+    """操作能否发送给工作进程（模块级函数、functools.partial、operator.methodcaller等）"""
+    try:
+        pickle.dumps(obj)
+        return True
+    except Exception:
+        return False
+
+
+# ---- 工作进程 ----
+
+# 工作进程内arm阶段生成的点击计划：设备名称 -> PurchasePlan
+_worker_plans: Dict[str, PurchasePlan] = {}
+
+
+def arm_in_worker(mp: MiniProgram) -> bool:
+    """在工作进程中执行arm，点击计划留在工作进程内供fire_in_worker使用"""
+    plan = mp.arm()
+    if plan is None:
+        _worker_plans.pop(mp.device_name, None)
+        return False
+    _worker_plans[mp.device_name] = plan
+    return True
+
+
+def fire_in_worker(mp: MiniProgram) -> bool:
+    """在工作进程中执行arm_in_worker保存的点击计划"""
+    plan = _worker_plans.get(mp.device_name)
+    if plan is None:
+        return False
+    return mp.fire(plan)
+
+
+def _install_shared_libraries(descriptor: Optional[Descriptor], template_dir: Optional[str],
+                              template_resolution: Tuple[int, int]) -> Optional[SharedArrays]:
+    """在工作进程中附加共享数组库，并注册为本进程的模板匹配引擎"""
+    if descriptor is None:
+        return None
+    shared = SharedArrays.attach(descriptor)
+    if template_dir is not None:
+        matcher = TemplateMatcher(template_dir, reference_size=template_resolution,
+                                  library=shared.subset(_TEMPLATE_PREFIX))
+        register_template_matcher(template_dir, matcher)
+    return shared
+
+
+def _worker_main(worker_id: int, devices: List[DeviceConfig], logging_config: Dict[str, Any],
+                 device_factory: Callable[[str], u2.Device], shared: Dict[str, Any], conn: Connection) -> None:
+    """工作进程入口：连接分到本进程的设备，然后循环处理控制通道上的命令
+
+    命令:
+        ("run", 任务ID, 操作, 超时) -> ("result", 任务ID, {设备名称: (是否成功, 错误信息)})
+        ("metrics",) -> ("metrics", 本进程的延迟统计)
+        ("histograms",) -> ("histograms", 本进程的延迟直方图)
+        ("retry_stats",) -> ("retry_stats", 本进程的重试统计)
+        ("stop",) -> 退出
+    """
+    libraries = _install_shared_libraries(**shared)
+    logger = Logger(logging_config)
+    miniprograms: Dict[str, MiniProgram] = {}
+    failed: Dict[str, str] = {}
+    for device_config in devices:
+        try:
+            device = device_factory(device_config.connect_info)
+            device.info
+            miniprograms[device_config.name] = MiniProgram(
+                device, device_config, logger.for_device(device_config.name)
+            )
+        except Exception as e:
+            failed[device_config.name] = str(e)
+    executor = ThreadPoolExecutor(max_workers=max(1, len(miniprograms)), thread_name_prefix=f"shard{worker_id}")
+    conn.send(("ready", worker_id, list(miniprograms), failed))
+
+    def call(action: Callable[[MiniProgram], bool], name: str) -> bool:
+        with metrics.span(name, "execute"):
+            return bool(action(miniprograms[name]))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            command = message[0]
+            if command == "run":
+                _, task_id, action, timeout = message
+                futures = {executor.submit(call, action, name): name for name in miniprograms}
+                done, _ = wait(futures, timeout=timeout)
+                results: Dict[str, Tuple[bool, Optional[str]]] = {}
+                for future, name in futures.items():
+                    if future not in done:
+                        results[name] = (False, f"操作超时（{timeout}秒）")
+                    elif future.exception() is not None:
+                        results[name] = (False, str(future.exception()))
+                    else:
+                        results[name] = (future.result(), None)
+                conn.send(("result", task_id, results))
+            elif command == "metrics":
+                conn.send(("metrics", metrics.summary()))
+            elif command == "histograms":
+                conn.send(("histograms", metrics.snapshot()))
+            elif command == "retry_stats":
+                conn.send(("retry_stats", retry_stats.summary()))
+            elif command == "stop":
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for miniprogram in miniprograms.values():
+            try:
+                miniprogram.touch.close()
+                miniprogram.frames.close()
+            except Exception:
+                pass
+        FrameBuffer.flush()
+        Logger.complete()
+        if libraries is not None:
+            libraries.close()
+
+
+# ---- 主进程 ----
+
+class ProcessShardExecutor:
+    """多进程分片执行器
+
+    将设备按轮询方式分配到多个工作进程，每个进程连接自己的设备并在线程中执行设备操作，
+    截图解码、图像识别等CPU密集的工作因此分散到多个核心，不再受单进程GIL限制。
+    主进程通过每个工作进程一条Pipe下发命令、收集结果。
+    模板库在主进程加载一次放入共享内存，工作进程只读共享，不各自加载副本。
+    """
+
+    def __init__(self, devices: Sequence[DeviceConfig], logger: Logger,
+                 workers: Optional[int] = None,
+                 logging_config: Optional[Dict[str, Any]] = None,
+                 template_dir: Optional[str] = None,
+                 template_resolution: Tuple[int, int] = (1080, 1920),
+                 device_factory: Callable[[str], u2.Device] = u2.connect,
+                 start_method: str = "spawn"):
+        """初始化执行器（start之前不创建进程）
+
+        Args:
+            devices: 参与执行的设备配置
+            logger: 日志记录器
+            workers: 工作进程数，默认取CPU核数与设备数中的较小值
+            logging_config: 工作进程的日志配置
+            template_dir: 共享的模板目录，None表示不共享模板
+            template_resolution: 模板截取时的屏幕分辨率 (宽, 高)
+            device_factory: 在工作进程中根据连接信息创建设备的函数，必须可以pickle
+            start_method: 进程启动方式，默认spawn，避免fork带来的线程和锁状态
+        """
+        self.devices = list(devices)
+        self.logger = logger
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.devices) or 1))
+        self.logging_config = logging_config or {}
+        self.template_dir = template_dir
+        self.template_resolution = tuple(template_resolution)
+        self.device_factory = device_factory
+        self.context = multiprocessing.get_context(start_method)
+        self.shards: List[List[str]] = []  # 每个工作进程中已连接的设备
+        self._processes: List[multiprocessing.Process] = []
+        self._conns: List[Connection] = []
+        self._shared: Optional[SharedArrays] = None
+        self._lock = threading.Lock()
+        self._task_id = 0
+
+    def _build_shared_libraries(self) -> Dict[str, Any]:
+        """加载模板库并放入共享内存，返回传给工作进程的参数"""
+        arrays: Dict[str, Any] = {}
+        template_dir = None
+        if self.template_dir is not None:
+            matcher = get_template_matcher(self.template_dir, reference_size=self.template_resolution)
+            template_dir = self.template_dir
+            for name, image in matcher.library.items():
+                arrays[_TEMPLATE_PREFIX + name] = image
+
+        descriptor = None
+        if arrays:
+            self._shared = SharedArrays.create(arrays)
+            descriptor = self._shared.descriptor
+            self.logger.info(f"共享图像库 {len(arrays)} 个数组，共 {self._shared.nbytes / 2 ** 20:.1f}MB")
+        return {
+            "descriptor": descriptor,
+            "template_dir": template_dir,
+            "template_resolution": self.template_resolution,
+        }
+
+    def start(self, timeout: float = 60.0) -> Tuple[List[str], Dict[str, str]]:
+        """创建共享图像库，启动工作进程并等待各进程连接完设备
+
+        Args:
+            timeout: 等待每个工作进程就绪的超时时间（秒）
+        Returns:
+            Tuple[List[str], Dict[str, str]]: (连接成功的设备, 失败设备名称到原因的映射)
+        """
+        shared = self._build_shared_libraries()
+        assignments: List[List[DeviceConfig]] = [self.devices[i::self.workers] for i in range(self.workers)]
+        for worker_id, devices in enumerate(assignments):
+            parent_conn, child_conn = self.context.Pipe()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(worker_id, devices, self.logging_config, self.device_factory, shared, child_conn),
+                name=f"device-shard-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._processes.append(process)
+            self._conns.append(parent_conn)
+
+        connected: List[str] = []
+        failed: Dict[str, str] = {}
+        for worker_id, (conn, devices) in enumerate(zip(self._conns, assignments)):
+            try:
+                if not conn.poll(timeout):
+                    raise TimeoutError(f"工作进程 {worker_id} 启动超时")
+                _, _, names, worker_failed = conn.recv()
+            except (EOFError, OSError) as e:
+                self.shards.append([])
+                failed.update({d.name: str(e) or f"工作进程 {worker_id} 异常退出" for d in devices})
+                continue
+            self.shards.append(names)
+            connected.extend(names)
+            failed.update(worker_failed)
+        self.logger.info(f"已启动 {self.workers} 个工作进程，分片: {self.shards}")
+        return connected, failed
+
+    def run(self, action: Callable[[MiniProgram], bool], timeout: Optional[float] = None) -> Dict[str, bool]:
+        """在所有工作进程的所有设备上执行操作
+
+        Args:
+            action: 接受MiniProgram、返回是否成功的操作，必须可以pickle
+            timeout: 单个设备操作的超时时间（秒），None表示不限制
+        Returns:
+            Dict[str, bool]: 设备ID到操作结果的映射
+        """
+        with self._lock:
+            self._task_id += 1
+            task_id = self._task_id
+            active = [(conn, names) for conn, names in zip(self._conns, self.shards) if names]
+            for conn, _ in active:
+                conn.send(("run", task_id, action, timeout))
+            results: Dict[str, bool] = {}
+            for conn, names in active:
+                try:
+                    _, _, worker_results = conn.recv()
+                except (EOFError, OSError) as e:
+                    self.logger.error(f"工作进程异常退出，设备 {names} 结果丢失: {str(e)}")
+                    results.update({name: False for name in names})
+                    continue
+                for name, (ok, error) in worker_results.items():
+                    if error is not None:
+                        self.logger.error(f"在设备 {name} 上执行操作时出错: {error}")
+                    results[name] = ok
+            return results
+
+    def _collect(self, command: str) -> Dict[Any, Any]:
+        """向所有工作进程发送查询命令，合并按设备分组的结果"""
+        summary: Dict[Any, Any] = {}
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send((command,))
+                    summary.update(conn.recv()[1])
+                except (EOFError, OSError):
+                    continue
+        return summary
+
+    def collect_metrics(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """收集所有工作进程的延迟统计: {设备: {步骤: 摘要}}"""
+        return self._collect("metrics")
+
+    def collect_histograms(self) -> Dict[Tuple[str, str], Histogram]:
+        """收集所有工作进程的延迟直方图: {(设备, 步骤): 直方图}"""
+        return self._collect("histograms")
+
+    def collect_retry_stats(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """收集所有工作进程的重试统计: {设备: {操作: 统计}}"""
+        return self._collect("retry_stats")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """通知工作进程退出，并释放共享内存"""
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(("stop",))
+                except (EOFError, OSError):
+                    pass
+            for process in self._processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+            for conn in self._conns:
+                conn.close()
+            self._processes.clear()
+            self._conns.clear()
+            self.shards.clear()
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
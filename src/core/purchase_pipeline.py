@@ -0,0 +1,254 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from utils.metrics import metrics
+from core.frame_buffer import Frame
+from core.miniprogram import MiniProgram, SEARCH_RESULTS_PAGE
+from core.screen_state import PageCheck, ScreenState
+from core.retry import call_with_retry
+
+
+class PurchaseStage:
+    """购买流程的阶段名称"""
+    SEARCH = "search"  # 搜索并到达结果页
+    ADD_TO_CART = "add_to_cart"  # 加入购物车并进入购物车
+    CHECKOUT = "checkout"  # 去结算
+    PAY = "pay"  # 提交订单并到达支付页
+
+    ALL = (SEARCH, ADD_TO_CART, CHECKOUT, PAY)
+
+
+# 各次点击后应到达的页面；加购不跳转页面，以加购成功的提示或购物车角标确认
+ADDED_TO_CART = PageCheck((), ("已加入购物车", "加入购物车成功", "添加成功"))
+CART_PAGE = PageCheck((ScreenState.CART,), ("去结算",))
+CHECKOUT_PAGE = PageCheck((ScreenState.CHECKOUT,), ("提交订单",))
+PAYMENT_PAGE = PageCheck((ScreenState.PAYMENT,), ("请输入支付密码", "支付成功"))
+
+
+@dataclass(frozen=True)
+class PipelineStep:
+    """阶段中的一次点击"""
+    target: str  # 点击目标（click_points中的名称）
+    expect: Optional[PageCheck] = None  # 点击后应到达的页面或出现的提示，None表示不校验，间隔click_interval后继续
+
+
+@dataclass(frozen=True)
+class StageSpec:
+    """一个阶段及其点击步骤，搜索阶段没有点击步骤"""
+    name: str
+    steps: Tuple[PipelineStep, ...] = ()
+
+
+def default_stages() -> Tuple[StageSpec, ...]:
+    """README中的四个阶段：搜索 -> 加购 -> 结算 -> 支付"""
+    return (
+        StageSpec(PurchaseStage.SEARCH),
+        StageSpec(PurchaseStage.ADD_TO_CART, (PipelineStep("add_to_cart", ADDED_TO_CART), PipelineStep("cart_button", CART_PAGE))),
+        StageSpec(PurchaseStage.CHECKOUT, (PipelineStep("checkout_button", CHECKOUT_PAGE),)),
+        StageSpec(PurchaseStage.PAY, (PipelineStep("pay_button", PAYMENT_PAGE),)),
+    )
+
+
+@dataclass
+class StageResult:
+    """一个阶段的执行结果"""
+    name: str
+    ok: bool = False
+    elapsed: float = 0.0  # 阶段耗时（秒）
+    timeout: float = 0.0  # 阶段时限（秒）
+    taps: List[Tuple[str, int, int]] = field(default_factory=list)  # (目标名称, x, y)
+    prefetched: List[str] = field(default_factory=list)  # 在校验跳转的帧上预先定位到坐标的目标
+    error: Optional[str] = None
+
+
+@dataclass
+class PipelineResult:
+    """一次购买流程的执行结果"""
+    device_name: str
+    ok: bool = False
+    stages: List[StageResult] = field(default_factory=list)
+    results_to_pay: Optional[float] = None  # 确认到达搜索结果页到点击支付的耗时（秒）
+
+    @property
+    def failed_stage(self) -> Optional[str]:
+        """失败的阶段，全部成功时为None"""
+        for stage in self.stages:
+            if not stage.ok:
+                return stage.name
+        return None
+
+    def timings(self) -> Dict[str, float]:
+        """各阶段耗时（毫秒）"""
+        return {stage.name: stage.elapsed * 1000 for stage in self.stages}
+
+
+class PurchasePipeline:
+    """在MiniProgram之上按阶段执行购买流程：搜索 -> 加购 -> 结算 -> 支付
+
+    每个阶段有独立的时限：搜索阶段为search.timeout，其余阶段为operation.stage_timeout。
+    每次点击都要校验到达了预期页面（加购为出现加购成功的提示）才继续，校验超时则本阶段失败、流程停止。
+    只有搜索阶段会重试；点击不是幂等的（重复加购、重复提交订单），点击阶段失败后不重试。
+    点击坐标从点击坐标表中查找；下一个目标还没有坐标时，在校验本次跳转的同一帧上定位，
+    跳转确认时下一次点击的坐标已经就绪，不需要再单独截图。
+    各阶段耗时按 pipeline.<阶段> 记入延迟统计，搜索结果到点击支付的耗时记为 pipeline.results_to_pay。
+    """
+
+    def __init__(self, miniprogram: MiniProgram, stages: Optional[Sequence[StageSpec]] = None,
+                 poll_interval: float = 0.0):
+        """初始化购买流程
+
+        Args:
+            miniprogram: 小程序实例
+            stages: 阶段定义，None使用default_stages()
+            poll_interval: 校验页面跳转的轮询间隔（秒），默认0：每次检查的截图或层级往返本身就是间隔
+        """
+        self.miniprogram = miniprogram
+        self.logger = miniprogram.logger
+        self.stages = tuple(stages or default_stages())
+        self.poll_interval = poll_interval
+
+    def stage_timeout(self, stage: StageSpec) -> float:
+        """阶段时限（秒）"""
+        config = self.miniprogram.config
+        if stage.name == PurchaseStage.SEARCH:
+            return config.search.timeout
+        return config.operation.stage_timeout
+
+    def run(self, keyword: Optional[str] = None) -> PipelineResult:
+        """依次执行所有阶段，任一阶段失败即停止
+
+        Args:
+            keyword: 搜索关键词，None使用配置中的关键词
+        Returns:
+            PipelineResult: 各阶段的结果和耗时
+        """
+        mp = self.miniprogram
+        result = PipelineResult(mp.device_name)
+        # 各阶段的点击目标依次排列，用于找到每一步之后的下一个目标
+        targets = [step.target for stage in self.stages for step in stage.steps]
+        position = 0
+        results_at: Optional[float] = None
+
+        self.logger.info(f"开始购买流程，阶段: {[stage.name for stage in self.stages]}")
+        for stage in self.stages:
+            stage_result = StageResult(stage.name, timeout=self.stage_timeout(stage))
+            result.stages.append(stage_result)
+            start = time.perf_counter()
+            deadline = start + stage_result.timeout
+            with metrics.span(mp.device_name, f"pipeline.{stage.name}"):
+                if stage.name == PurchaseStage.SEARCH:
+                    next_target = targets[position] if position < len(targets) else None
+                    stage_result.error = self._search(keyword, deadline, next_target, stage_result)
+                    if stage_result.error is None:
+                        results_at = time.perf_counter()
+                else:
+                    for step in stage.steps:
+                        position += 1
+                        next_target = targets[position] if position < len(targets) else None
+                        tapped_at = self._tap(step, stage_result)
+                        if tapped_at is None:
+                            break
+                        if stage.name == PurchaseStage.PAY and results_at is not None \
+                                and result.results_to_pay is None:
+                            result.results_to_pay = tapped_at - results_at
+                            metrics.record(mp.device_name, "pipeline.results_to_pay",
+                                           int(result.results_to_pay * 1e6))
+                        if not self._verify(step, deadline, next_target, stage_result):
+                            break
+            stage_result.elapsed = time.perf_counter() - start
+            stage_result.ok = stage_result.error is None
+            if not stage_result.ok:
+                self.logger.error(f"购买流程在阶段 {stage.name} 失败: {stage_result.error}"
+                                  f"（耗时 {stage_result.elapsed:.3f}秒，时限 {stage_result.timeout}秒）")
+                mp.save_frames_on_error(f"pipeline_{stage.name}")
+                return result
+
+        result.ok = True
+        timings = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result.timings().items())
+        to_pay = f"{result.results_to_pay * 1000:.0f}ms" if result.results_to_pay is not None else "未知"
+        self.logger.info(f"购买流程完成: {timings}；搜索结果到点击支付 {to_pay}")
+        return result
+
+    def _search(self, keyword: Optional[str], deadline: float, next_target: Optional[str],
+                stage_result: StageResult) -> Optional[str]:
+        """搜索阶段，返回错误信息，成功时为None"""
+        mp = self.miniprogram
+        on_results = self._prefetch_on(next_target, stage_result)
+        # 未指定关键词且已在搜索结果页时（arm或launch已经搜索过）跳过搜索
+        if keyword is None and mp.page_reached(SEARCH_RESULTS_PAGE, "pipeline_search", self._needs_frame(next_target), on_results)():
+            self.logger.info("已在搜索结果页，跳过搜索")
+            return None
+        keyword = keyword or mp.miniprogram_config.search_keyword
+        # 搜索可以安全重试，重试受阶段时限和时间窗口结束时刻中较早的一个约束
+        search_deadline = time.time() + (deadline - time.perf_counter())
+        if mp.deadline is not None:
+            search_deadline = min(search_deadline, mp.deadline)
+        searched = call_with_retry(lambda: mp.search_in_miniprogram(keyword), mp.retry_policy, self.logger,
+                                   mp.device_name, "search", search_deadline)
+        if not searched:
+            return f"搜索关键词失败: {keyword}"
+        if time.perf_counter() > deadline:
+            # 已经到达结果页，超时只影响统计，不让已完成的搜索失败
+            self.logger.warning(f"搜索阶段超过时限 {stage_result.timeout}秒")
+        # search_in_miniprogram已校验到达结果页，在结果页最近采集的帧上预先定位第一个目标
+        on_results(mp.frames.latest())
+        return None
+
+    def _tap(self, step: PipelineStep, stage_result: StageResult) -> Optional[float]:
+        """点击步骤的目标，返回点击时刻，无法确定坐标或点击出错时记录错误并返回None"""
+        mp = self.miniprogram
+        point = mp.click_point(step.target)
+        if point is None:
+            stage_result.error = f"无法确定点击目标 {step.target} 的坐标"
+            return None
+        try:
+            tapped_at = time.perf_counter()
+            mp.tap(*point)
+        except Exception as e:
+            stage_result.error = f"点击 {step.target} 时出错: {str(e)}"
+            return None
+        stage_result.taps.append((step.target, point[0], point[1]))
+        return tapped_at
+
+    def _verify(self, step: PipelineStep, deadline: float, next_target: Optional[str],
+                stage_result: StageResult) -> bool:
+        """等待点击后的页面跳转，校验失败时记录错误"""
+        mp = self.miniprogram
+        if step.expect is None:
+            # 不校验的点击，等待界面响应后继续
+            interval = min(mp.config.operation.click_interval, max(0.0, deadline - time.perf_counter()))
+            if interval > 0:
+                time.sleep(interval)
+            return True
+        reached = mp.waiter.until(
+            mp.page_reached(step.expect, f"pipeline_{step.target}", self._needs_frame(next_target),
+                            self._prefetch_on(next_target, stage_result)),
+            timeout=max(0.0, deadline - time.perf_counter()),
+            interval=self.poll_interval,
+            description=f"点击 {step.target} 后页面跳转"
+        )
+        if not reached:
+            stage_result.error = f"点击 {step.target} 后未到达预期页面"
+            return False
+        # 校验通过，配置或兜底坐标记为已校准
+        _, x, y = stage_result.taps[-1]
+        mp.confirm_click_point(step.target, (x, y))
+        return True
+
+    def _needs_frame(self, name: Optional[str]) -> bool:
+        """下一个目标还没有坐标时，校验跳转的每次检查都采集帧以便在同一帧上定位"""
+        return name is not None and self.miniprogram.click_points.get(name) is None
+
+    def _prefetch_on(self, name: Optional[str], stage_result: StageResult) -> Callable[[Optional[Frame]], None]:
+        """返回页面跳转确认时调用的回调：在确认跳转的同一帧上定位下一个目标并写入坐标表"""
+        def prefetch(frame: Optional[Frame]) -> None:
+            if name is None or self.miniprogram.click_points.get(name) is not None:
+                return
+            if self.miniprogram.calibrate_click_point(name, frame) is not None:
+                stage_result.prefetched.append(name)
+        return prefetch
+
+
+def run_purchase_pipeline(mp: MiniProgram, keyword: Optional[str] = None) -> bool:
+    """在设备上执行完整的购买流程（模块级函数，可以发送到工作进程执行）"""
+    return PurchasePipeline(mp).run(keyword).ok
@@ -0,0 +1,196 @@
+import time
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+import uiautomator2.exceptions as u2_errors
+from utils.logger import Logger
+from core.config_model import ConfigError, OperationConfig, OptionsConfig
+
+
+class FatalError(Exception):
+    """重试也无法恢复的错误，抛出后立即放弃"""
+
+
+class ErrorKind:
+    """失败的分类"""
+    TRANSIENT = "transient"  # 超时、连接断开、页面未按预期跳转等，重试可能成功
+    FATAL = "fatal"  # 配置错误、应用未安装、代码缺陷等，重试没有意义
+
+
+# 重试没有意义的异常；其余异常（设备通信、超时、adb错误等）和返回假值都视为暂时性失败
+_FATAL_ERRORS = (
+    FatalError, ConfigError,
+    u2_errors.AppNotFoundError, u2_errors.APKSignatureError, u2_errors.InjectPermissionError,
+    u2_errors.RPCInvalidError,
+    TypeError, AttributeError, NameError, KeyError, NotImplementedError, AssertionError,
+)
+
+
+def classify_error(error: BaseException) -> str:
+    """判断异常是暂时性的还是致命的
+
+    Returns:
+        str: ErrorKind.TRANSIENT 或 ErrorKind.FATAL
+    """
+    if isinstance(error, _FATAL_ERRORS):
+        return ErrorKind.FATAL
+    return ErrorKind.TRANSIENT
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """重试策略：最多重试retries次，第n次重试前等待 interval * backoff**n 秒，不超过max_interval"""
+    retries: int = 3
+    interval: float = 0.5
+    backoff: float = 2.0
+    max_interval: float = 30.0
+
+    def delay(self, retry: int) -> float:
+        """第retry次重试（从0开始）前的等待时间（秒）"""
+        return min(self.interval * self.backoff ** retry, self.max_interval)
+
+    @classmethod
+    def for_operation(cls, config: OperationConfig) -> "RetryPolicy":
+        """MiniProgram中单个步骤的重试：operation.retry_times次，等待从click_interval开始退避"""
+        return cls(config.retry_times, config.click_interval)
+
+    @classmethod
+    def for_device(cls, options: OptionsConfig) -> "RetryPolicy":
+        """DeviceManager中设备级的重试：关键词分发中失败的项最多再交给其他设备retry_count次，每次退回队列后等待从retry_interval开始退避"""
+        return cls(options.retry_count, options.retry_interval)
+
+
+@dataclass
+class RetryCounters:
+    """一个设备上一种操作的重试统计"""
+    calls: int = 0  # 调用次数
+    attempts: int = 0  # 实际执行次数（含首次）
+    retries: int = 0  # 重试次数
+    gave_up: int = 0  # 重试后仍失败、遇到致命错误或时间不足而放弃的次数
+    wasted_s: float = 0.0  # 失败的尝试和退避等待耗费的时间（秒）
+
+
+class RetryStats:
+    """按设备、操作统计的重试次数和浪费的时间"""
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, str], RetryCounters] = {}
+        self._lock = threading.Lock()
+
+    def add(self, device: str, operation: str, attempts: int, ok: bool, wasted: float) -> None:
+        """记录一次调用的结果"""
+        with self._lock:
+            counters = self._counters.get((device, operation))
+            if counters is None:
+                counters = self._counters[(device, operation)] = RetryCounters()
+            counters.calls += 1
+            counters.attempts += attempts
+            counters.retries += attempts - 1
+            counters.gave_up += 0 if ok else 1
+            counters.wasted_s += wasted
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """所有设备、操作的统计: {设备: {操作: 统计}}"""
+        with self._lock:
+            items = sorted(self._counters.items())
+            result: Dict[str, Dict[str, Dict[str, float]]] = {}
+            for (device, operation), counters in items:
+                result.setdefault(device, {})[operation] = asdict(counters)
+        return result
+
+    def reset(self) -> None:
+        """清空所有统计"""
+        with self._lock:
+            self._counters.clear()
+
+
+# 进程内默认的重试统计
+retry_stats = RetryStats()
+
+
+def call_with_retry(func: Callable[[], Any], policy: RetryPolicy, logger: Logger,
+                    device_name: str, operation: str, deadline: Optional[float] = None) -> Any:
+    """执行操作，暂时性失败（返回假值或抛出暂时性异常）时按策略退避重试
+
+    重试受deadline约束：剩余时间不够一次退避等待加一次尝试（按目前最快一次尝试的耗时估计）时不再重试，
+    迟到的重试不会越过时间窗口的结束时间。调用结果和浪费的时间记入retry_stats。
+
+    Args:
+        func: 无参数的操作，返回真值表示成功
+        policy: 重试策略
+        logger: 日志记录器
+        device_name: 设备名称，用于统计
+        operation: 操作名称，用于日志和统计
+        deadline: 截止时刻（time.time()），None表示只受重试次数限制
+    Returns:
+        Any: 最后一次尝试的返回值
+    Raises:
+        Exception: 致命错误立即抛出；最后一次尝试抛出的暂时性异常在放弃时抛出
+    """
+    attempts = 0
+    wasted = 0.0
+    fastest: Optional[float] = None
+    while True:
+        attempts += 1
+        start = time.perf_counter()
+        error: Optional[Exception] = None
+        try:
+            result = func()
+        except Exception as e:
+            error, result = e, False
+        elapsed = time.perf_counter() - start
+        if error is None and result:
+            retry_stats.add(device_name, operation, attempts, True, wasted)
+            if attempts > 1:
+                logger.info(f"{operation} 第{attempts}次尝试成功，重试浪费 {wasted:.2f}秒")
+            return result
+
+        wasted += elapsed
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+        reason = "返回失败" if error is None else f"{type(error).__name__}: {error}"
+        give_up = None
+        if error is not None and classify_error(error) == ErrorKind.FATAL:
+            give_up = "致命错误，不再重试"
+        elif attempts > policy.retries:
+            give_up = f"已重试{policy.retries}次"
+        else:
+            delay = policy.delay(attempts - 1)
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if delay + fastest > remaining:
+                    give_up = f"剩余 {max(remaining, 0.0):.1f}秒不足以再试一次（约需 {delay + fastest:.1f}秒）"
+        if give_up is not None:
+            retry_stats.add(device_name, operation, attempts, False, wasted)
+            logger.error(f"{operation} 第{attempts}次尝试失败（{reason}），{give_up}")
+            if error is not None:
+                raise error
+            return result
+
+        logger.warning(f"{operation} 第{attempts}次尝试失败（{reason}），{delay:.2f}秒后重试")
+        time.sleep(delay)
+        wasted += delay
+
+
+class WithDeadline:
+    """把截止时刻设置到MiniProgram上再执行设备操作的包装，可以pickle后发送到工作进程执行
+
+    设备操作本身不再重试：launch、arm内部的导航和搜索已经按operation.retry_times逐步重试，
+    包装只让这些步骤级重试不越过截止时刻。
+    """
+
+    def __init__(self, action: Callable[[Any], bool], deadline: Optional[float] = None):
+        """初始化包装
+
+        Args:
+            action: 接受MiniProgram、返回是否成功的操作
+            deadline: 截止时刻（time.time()），None表示只受重试次数限制
+        """
+        self.action = action
+        self.deadline = deadline
+
+    def __call__(self, mp: Any) -> bool:
+        previous, mp.deadline = mp.deadline, self.deadline
+        try:
+            return bool(self.action(mp))
+        finally:
+            mp.deadline = previous
@@ -0,0 +1,256 @@
+import time
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from utils.logger import Logger
+from utils.metrics import Metrics, metrics
+from core.config_model import TimeWindow, parse_time_of_day
+
+
+@dataclass
+class WindowRun:
+    """一个时间窗口的执行记录"""
+    start: datetime.datetime  # 窗口开始时间
+    end: datetime.datetime  # 窗口结束时间
+    intended_fire: float  # 计划触发时间（time.time()）
+    actual_fire: Optional[float] = None  # 实际触发时间（time.time()）
+    attempts: int = 0  # 窗口内触发次数
+    success: bool = False  # 是否有触发返回成功
+    prewarm_ok: Optional[bool] = None  # 预热是否成功，未预热时为None
+    results: List[Any] = field(default_factory=list)
+
+    @property
+    def drift_ms(self) -> Optional[float]:
+        """实际触发时间相对计划时间的偏差（毫秒）"""
+        if self.actual_fire is None:
+            return None
+        return (self.actual_fire - self.intended_fire) * 1000
+
+
+class TimeWindowScheduler:
+    """按config.yaml中time_windows驱动的精确定时调度器
+
+    在窗口开始前lead_time秒执行预热，在开始时刻触发关键操作，并在窗口内按interval重复触发，
+    直到操作返回成功或窗口结束。窗口之间使用可中断的sleep空闲等待，只在触发前的最后
+    spin_window秒内忙等，以单调时钟保证毫秒级精度。
+    """
+
+    def __init__(self, time_windows: List[Union[TimeWindow, Dict[str, Any]]], logger: Logger,
+                 fire: Callable[[], Any],
+                 prewarm: Optional[Callable[[], Any]] = None,
+                 on_window_end: Optional[Callable[[WindowRun], None]] = None,
+                 lead_time: float = 30.0,
+                 spin_window: float = 0.02,
+                 metrics_dir: Optional[str] = None,
+                 metrics_source: Optional[Callable[[], Metrics]] = None):
+        """初始化调度器
+
+        Args:
+            time_windows: 时间窗口，TimeWindow或包含start_time、end_time、interval的字典
+            logger: 日志记录器
+            fire: 关键操作，返回真值表示成功
+            prewarm: 预热操作（连接设备、导航到目标页面等）
+            on_window_end: 每个窗口结束后的回调
+            lead_time: 预热提前量（秒）
+            spin_window: 触发前忙等的时长（秒）
+            metrics_dir: 每个窗口结束后导出延迟统计的目录，None表示不导出
+            metrics_source: 返回要导出的延迟统计，None表示导出本进程的统计
+        """
+        self.logger = logger
+        self.fire = fire
+        self.prewarm = prewarm
+        self.on_window_end = on_window_end
+        self.lead_time = lead_time
+        self.spin_window = spin_window
+        self.metrics_dir = metrics_dir
+        self.metrics_source = metrics_source
+        self.windows: List[Tuple[datetime.time, datetime.time, float]] = [
+            (w.start, w.end, w.interval) if isinstance(w, TimeWindow) else
+            (parse_time_of_day(w['start_time']), parse_time_of_day(w['end_time']), float(w.get('interval', 1)))
+            for w in time_windows
+        ]
+        self.history: List[WindowRun] = []
+        self._stop = threading.Event()
+        self._window_end: Optional[float] = None  # 正在执行（含预热）的窗口的结束时刻（time.time()）
+
+    @classmethod
+    def from_config(cls, config_manager, logger: Logger, fire: Callable[[], Any],
+                    prewarm: Optional[Callable[[], Any]] = None,
+                    on_window_end: Optional[Callable[[WindowRun], None]] = None,
+                    metrics_source: Optional[Callable[[], Metrics]] = None) -> "TimeWindowScheduler":
+        """根据ConfigManager中已校验的time_windows和scheduler配置创建调度器"""
+        settings = config_manager.settings
+        return cls(
+            list(settings.time_windows),
+            logger,
+            fire,
+            prewarm=prewarm,
+            on_window_end=on_window_end,
+            lead_time=settings.scheduler.lead_time,
+            spin_window=settings.scheduler.spin_window,
+            metrics_dir=settings.scheduler.metrics_dir,
+            metrics_source=metrics_source
+        )
+
+    def stop(self) -> None:
+        """停止调度（可从其他线程调用）"""
+        self._stop.set()
+
+    def next_window(self, now: Optional[datetime.datetime] = None
+                    ) -> Optional[Tuple[datetime.datetime, datetime.datetime, float]]:
+        """计算下一个尚未结束的时间窗口
+
+        Returns:
+            Optional[Tuple[datetime.datetime, datetime.datetime, float]]: (开始时间, 结束时间, 间隔)，没有窗口时为None
+        """
+        now = now or datetime.datetime.now()
+        candidates = []
+        for day_offset in (-1, 0, 1):
+            day = now.date() + datetime.timedelta(days=day_offset)
+            for start_t, end_t, interval in self.windows:
+                start = datetime.datetime.combine(day, start_t)
+                end = datetime.datetime.combine(day, end_t)
+                if end <= start:
+                    # 跨越午夜的窗口
+                    end += datetime.timedelta(days=1)
+                if end > now:
+                    candidates.append((start, end, interval))
+        return min(candidates, default=None)
+
+    def _wait_until(self, target_mono: float) -> bool:
+        """等待到单调时钟的目标时刻
+
+        远离目标时用可中断的sleep空闲，最后spin_window秒忙等。
+
+        Returns:
+            bool: 是否正常到达（False表示被stop中断）
+        """
+        while True:
+            remaining = target_mono - time.monotonic()
+            if remaining <= self.spin_window:
+                break
+            if self._stop.wait(remaining - self.spin_window):
+                return False
+        while time.monotonic() < target_mono:
+            pass
+        return True
+
+    def _to_monotonic(self, when: datetime.datetime) -> float:
+        """将墙上时间换算为单调时钟时刻"""
+        return time.monotonic() + (when.timestamp() - time.time())
+
+    def current_deadline(self) -> Optional[float]:
+        """正在执行的窗口（从等待预热开始）的结束时刻（time.time()），不在窗口中时为None
+
+        供DeviceManager.deadline_source使用，使重试不越过窗口的结束时间。
+        """
+        return self._window_end
+
+    def run_window(self, start: datetime.datetime, end: datetime.datetime, interval: float) -> Optional[WindowRun]:
+        """执行单个时间窗口
+
+        Returns:
+            Optional[WindowRun]: 窗口执行记录，被stop中断时为None
+        """
+        self._window_end = end.timestamp()
+        try:
+            return self._run_window(start, end, interval)
+        finally:
+            self._window_end = None
+
+    def _run_window(self, start: datetime.datetime, end: datetime.datetime, interval: float) -> Optional[WindowRun]:
+        run = WindowRun(start=start, end=end, intended_fire=start.timestamp())
+
+        # 空闲等待到预热时刻，之后再换算开始时刻，避免长时间等待期间墙上时间被校准带来的偏差
+        prewarm_at = start - datetime.timedelta(seconds=self.lead_time)
+        if datetime.datetime.now() < prewarm_at:
+            self.logger.info(f"等待预热时刻 {prewarm_at:%Y-%m-%d %H:%M:%S}")
+            if not self._wait_until(self._to_monotonic(prewarm_at)):
+                return None
+        if self.prewarm is not None:
+            self.logger.info(f"开始预热，窗口 {start:%H:%M:%S}-{end:%H:%M:%S}")
+            try:
+                run.prewarm_ok = bool(self.prewarm())
+            except Exception as e:
+                self.logger.error(f"预热时出错: {str(e)}")
+                run.prewarm_ok = False
+
+        # 在开始时刻触发，之后按间隔重复直到成功或窗口结束
+        start_mono = self._to_monotonic(start)
+        end_mono = self._to_monotonic(end)
+        next_fire = max(start_mono, time.monotonic())
+        while next_fire < end_mono:
+            if not self._wait_until(next_fire):
+                return None
+            fired_at = time.time()
+            if run.actual_fire is None:
+                run.actual_fire = fired_at
+                self.logger.info(f"窗口 {start:%H:%M:%S} 触发，偏差 {run.drift_ms:.3f}毫秒")
+            run.attempts += 1
+            try:
+                result = self.fire()
+            except Exception as e:
+                self.logger.error(f"触发操作时出错: {str(e)}")
+                result = False
+            run.results.append(result)
+            if result:
+                run.success = True
+                break
+            next_fire = max(next_fire + interval, time.monotonic())
+
+        self.logger.info(
+            f"窗口 {start:%H:%M:%S}-{end:%H:%M:%S} 结束: 成功={run.success}，触发{run.attempts}次"
+        )
+        self.history.append(run)
+        if self.metrics_dir:
+            try:
+                registry = self.metrics_source() if self.metrics_source is not None else metrics
+                json_path, prom_path = registry.export(self.metrics_dir, f"window_{start:%Y%m%d_%H%M%S}")
+                self.logger.info(f"延迟统计已导出: {json_path}, {prom_path}")
+            except Exception as e:
+                self.logger.error(f"导出延迟统计出错: {str(e)}")
+        if self.on_window_end is not None:
+            try:
+                self.on_window_end(run)
+            except Exception as e:
+                self.logger.error(f"窗口结束回调出错: {str(e)}")
+        return run
+
+    def run(self, max_windows: Optional[int] = None) -> List[WindowRun]:
+        """依次执行后续的时间窗口，直到stop被调用或达到max_windows
+
+        Args:
+            max_windows: 最多执行的窗口数，None表示不限制
+        Returns:
+            List[WindowRun]: 本次执行的窗口记录
+        """
+        runs: List[WindowRun] = []
+        last_end: Optional[datetime.datetime] = None
+        while not self._stop.is_set() and (max_windows is None or len(runs) < max_windows):
+            # 提前成功结束的窗口不再重复执行
+            now = datetime.datetime.now()
+            window = self.next_window(max(now, last_end) if last_end else now)
+            if window is None:
+                self.logger.warning("没有配置时间窗口")
+                break
+            start, end, interval = window
+            last_end = end
+            self.logger.info(f"下一个时间窗口: {start:%Y-%m-%d %H:%M:%S} - {end:%H:%M:%S}")
+            run = self.run_window(start, end, interval)
+            if run is None:
+                break
+            runs.append(run)
+        return runs
+
+    def drift_summary(self) -> Dict[str, float]:
+        """统计已执行窗口的触发偏差（毫秒）"""
+        drifts = [run.drift_ms for run in self.history if run.drift_ms is not None]
+        if not drifts:
+            return {}
+        return {
+            "count": len(drifts),
+            "mean_ms": sum(drifts) / len(drifts),
+            "max_ms": max(drifts),
+            "min_ms": min(drifts),
+        }
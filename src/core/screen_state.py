@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+import uiautomator2 as u2
+from utils.logger import Logger
+
+# 项目根目录，命令行的默认样本目录和索引路径相对于它
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+
+
+class ScreenState:
+    """已知页面状态名称"""
+    WECHAT_MAIN = "wechat_main"  # 微信主界面
+    DISCOVER = "discover"  # 发现页
+    MINIPROGRAM_LIST = "miniprogram_list"  # 小程序列表
+    STORE_HOME = "store_home"  # 商城首页
+    SEARCH_PAGE = "search_page"  # 搜索页
+    SEARCH_RESULTS = "search_results"  # 搜索结果页
+    CART = "cart"  # 购物车
+    CHECKOUT = "checkout"  # 结算页
+    PAYMENT = "payment"  # 微信支付页
+
+    ALL = (WECHAT_MAIN, DISCOVER, MINIPROGRAM_LIST, STORE_HOME, SEARCH_PAGE, SEARCH_RESULTS, CART, CHECKOUT, PAYMENT)
+
+
+@dataclass(frozen=True)
+class PageCheck:
+    """判定是否到达某个页面
+
+    页面状态索引能识别当前画面时按states判断；无法识别（没有索引或距离过大）时，
+    界面层级中出现texts中任意一个文本即认为到达。states为空时只按texts判断（如页面不跳转、只出现提示的操作）。
+    """
+    states: Tuple[str, ...] = ()
+    texts: Tuple[str, ...] = ()
+
+
+# 每个字节中1的个数，用于计算汉明距离
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash(image: np.ndarray, hash_size: int = 8) -> int:
+    """计算图像的感知哈希（DCT低频分量与中值比较）
+
+    Args:
+        image: BGR或灰度图像
+        hash_size: 哈希边长，8对应64位哈希
+    Returns:
+        int: 感知哈希值
+    """
+    size = hash_size * 4
+    # 先隔行隔列抽样再缩小，大幅减少全分辨率帧的缩放开销
+    step = max(1, min(image.shape[0], image.shape[1]) // (size * 8))
+    small = cv2.resize(image[::step, ::step], (size, size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    low = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size]
+    # 直流分量不参与中值计算
+    median = np.median(low.flatten()[1:])
+    bits = np.packbits((low > median).flatten())
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """计算一个哈希与一组64位哈希之间的汉明距离"""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(len(hashes), 8).sum(axis=1)
+
+
+class ScreenStateIndex:
+    """页面状态索引
+
+    保存已知页面的感知哈希，对采集到的画面计算一次哈希后做最近邻查找。
+    """
+
+    def __init__(self, max_distance: int = 10):
+        """初始化页面状态索引
+
+        Args:
+            max_distance: 判定为同一页面的最大汉明距离
+        """
+        self.max_distance = max_distance
+        self._states: List[str] = []
+        self._hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def states(self) -> List[str]:
+        """索引中包含的页面状态"""
+        return sorted(set(self._states))
+
+    def add(self, state: str, image: Optional[np.ndarray] = None, hash_value: Optional[int] = None) -> int:
+        """添加一个页面样本
+
+        Args:
+            state: 页面状态名称
+            image: 页面截图（与hash_value二选一）
+            hash_value: 已计算好的哈希值
+        Returns:
+            int: 样本的哈希值
+        """
+        if hash_value is None:
+            if image is None:
+                raise ValueError("image 和 hash_value 必须提供一个")
+            hash_value = phash(image)
+        self._states.append(state)
+        self._hashes = np.append(self._hashes, np.uint64(hash_value))
+        return hash_value
+
+    def classify(self, image: np.ndarray) -> Tuple[Optional[str], int]:
+        """识别画面所属的页面状态
+
+        Args:
+            image: 页面截图
+        Returns:
+            Tuple[Optional[str], int]: (页面状态, 汉明距离)，超出max_distance时状态为None
+        """
+        if not self._states:
+            return None, 64
+        distances = hamming_distances(self._hashes, phash(image))
+        best = int(np.argmin(distances))
+        distance = int(distances[best])
+        if distance > self.max_distance:
+            return None, distance
+        return self._states[best], distance
+
+    def save(self, path: str) -> None:
+        """保存索引到JSON文件"""
+        data: Dict[str, List[str]] = {}
+        for state, value in zip(self._states, self._hashes):
+            data.setdefault(state, []).append(f"{int(value):016x}")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"max_distance": self.max_distance, "states": data}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ScreenStateIndex":
+        """从JSON文件加载索引"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data.get("max_distance", 10))
+        for state, values in data.get("states", {}).items():
+            for value in values:
+                index.add(state, hash_value=int(value, 16))
+        return index
+
+    @classmethod
+    def from_dir(cls, directory: str, max_distance: int = 10) -> "ScreenStateIndex":
+        """从样本目录构建索引，目录结构为 <directory>/<状态名>/*.png"""
+        index = cls(max_distance)
+        for state_dir in sorted(Path(directory).iterdir()):
+            if not state_dir.is_dir():
+                continue
+            for path in sorted(state_dir.iterdir()):
+                if path.suffix.lower() not in (".png", ".jpg", ".jpeg"):
+                    continue
+                image = cv2.imread(str(path))
+                if image is None:
+                    raise ValueError(f"无法读取图像: {path}")
+                index.add(state_dir.name, image)
+        return index
+
+
+_indexes: Dict[str, Optional[ScreenStateIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_screen_index(path: str, logger: Optional[Logger] = None) -> Optional[ScreenStateIndex]:
+    """获取进程内共享的页面状态索引，文件不存在时返回None
+
+    索引不随项目提供，需要用 python -m core.screen_state capture/build 在实际设备上采集样本后生成；
+    文件不存在时只在第一次加载时警告，页面判定退回到界面层级中的文本。
+    """
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ScreenStateIndex.load(key) if os.path.exists(key) else None
+            if _indexes[key] is None and logger is not None:
+                logger.warning(f"页面状态索引 {key} 不存在，页面判定只使用界面文本；"
+                               f"可通过 python -m core.screen_state capture/build 生成")
+        return _indexes[key]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="采集页面样本并构建页面状态索引")
+    commands = parser.add_subparsers(dest="command", required=True)
+    capture = commands.add_parser("capture", help="截取设备当前画面，作为某个页面状态的样本")
+    capture.add_argument("state", choices=ScreenState.ALL, help="当前画面的页面状态")
+    capture.add_argument("--serial", help="设备序列号，不指定时使用唯一连接的设备")
+    capture.add_argument("--samples", default=str(PROJECT_DIR / "screen_samples"), help="样本目录")
+    build = commands.add_parser("build", help="从样本目录（<目录>/<页面状态>/*.png）构建索引")
+    build.add_argument("--samples", default=str(PROJECT_DIR / "screen_samples"), help="样本目录")
+    build.add_argument("--output", default=str(PROJECT_DIR / "config" / "screen_states.json"), help="索引文件")
+    build.add_argument("--max-distance", type=int, default=10, help="判定为同一页面的最大汉明距离")
+    args = parser.parse_args(argv)
+
+    if args.command == "capture":
+        image = u2.connect(args.serial).screenshot(format="opencv")
+        path = os.path.join(args.samples, args.state, time.strftime("%Y%m%d_%H%M%S") + ".png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, image)
+        print(f"已保存样本: {path}")
+        return 0
+
+    if not os.path.isdir(args.samples):
+        print(f"样本目录 {args.samples} 不存在")
+        return 1
+    index = ScreenStateIndex.from_dir(args.samples, args.max_distance)
+    if not len(index):
+        print(f"样本目录 {args.samples} 中没有样本")
+        return 1
+    missing = [state for state in ScreenState.ALL if state not in index.states]
+    if missing:
+        print(f"以下页面状态没有样本，识别时退回到界面文本: {missing}")
+    index.save(args.output)
+    print(f"已保存索引: {args.output}（{len(index)} 个样本，页面状态 {index.states}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
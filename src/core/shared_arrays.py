@@ -0,0 +1,76 @@
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# 每个数组在共享内存块中的起始位置按此对齐
+_ALIGN = 64
+
+# 共享数组库的描述: (共享内存名称, [(数组名, 偏移, 形状, dtype), ...])，可以跨进程传递
+Descriptor = Tuple[str, List[Tuple[str, int, Tuple[int, ...], str]]]
+
+
+class SharedArrays:
+    """放在一块共享内存中的一组只读numpy数组
+
+    主进程用create打包一次，将descriptor传给工作进程，工作进程用attach得到只读视图，
+    不复制数据。共享内存由创建方负责unlink。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, descriptor: Descriptor, owner: bool):
+        self._shm = shm
+        self.descriptor = descriptor
+        self.owner = owner
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, offset, shape, dtype in descriptor[1]:
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> "SharedArrays":
+        """将数组复制到新建的共享内存中
+
+        Args:
+            arrays: 名称到数组的映射
+        Returns:
+            SharedArrays: 创建方持有的共享数组库
+        """
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            size = (size + _ALIGN - 1) // _ALIGN * _ALIGN
+            layout.append((name, size, tuple(array.shape), array.dtype.str))
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (name, offset, shape, dtype), array in zip(layout, arrays.values()):
+            target = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            target[...] = array
+        return cls(shm, (shm.name, layout), owner=True)
+
+    @classmethod
+    def attach(cls, descriptor: Descriptor) -> "SharedArrays":
+        """在其他进程中按描述附加到已有的共享内存"""
+        return cls(shared_memory.SharedMemory(name=descriptor[0]), descriptor, owner=False)
+
+    def subset(self, prefix: str) -> Dict[str, np.ndarray]:
+        """取出名称以 prefix 开头的数组，返回的名称去掉前缀"""
+        return {name[len(prefix):]: array for name, array in self.arrays.items() if name.startswith(prefix)}
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def close(self, unlink: Optional[bool] = None) -> None:
+        """释放共享内存映射，创建方默认同时删除共享内存"""
+        self.arrays.clear()
+        try:
+            self._shm.close()
+        except BufferError:
+            # 仍有数组视图在使用映射，交给进程退出时释放
+            pass
+        if self.owner if unlink is None else unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,214 @@
+import time
+import socket
+import threading
+from typing import Optional, Tuple
+import adbutils
+import uiautomator2 as u2
+from utils.logger import Logger
+from core.config_model import DeviceConfig
+
+
+class TouchBackend:
+    """触控后端基类"""
+    name = "base"
+
+    def tap(self, x: float, y: float) -> None:
+        """点击屏幕坐标"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """释放后端占用的资源"""
+
+
+class U2TouchBackend(TouchBackend):
+    """通过uiautomator2的HTTP JSON-RPC点击（默认后端）"""
+    name = "u2"
+
+    def __init__(self, device: u2.Device):
+        self.device = device
+
+    def tap(self, x: float, y: float) -> None:
+        self.device.click(x, y)
+
+
+class MinitouchBackend(TouchBackend):
+    """通过minitouch的常驻socket直接写入触摸事件
+
+    需要设备上已部署minitouch可执行文件（默认 /data/local/tmp/minitouch）。
+    连接建立后每次点击只是一次本地socket写入，不经过HTTP。
+    """
+    name = "minitouch"
+
+    def __init__(self, serial: str, binary: str = "/data/local/tmp/minitouch",
+                 screen_size: Optional[Tuple[int, int]] = None, pressure: int = 50,
+                 startup_timeout: float = 3.0):
+        """启动minitouch并建立连接
+
+        Args:
+            serial: 设备序列号
+            binary: 设备上minitouch的路径
+            screen_size: 屏幕尺寸 (宽, 高)，用于将屏幕坐标换算为触摸坐标
+            pressure: 触摸压力
+            startup_timeout: 等待minitouch就绪的超时时间（秒）
+        """
+        self.adb_device = adbutils.adb.device(serial)
+        self.pressure = pressure
+        self.screen_size = screen_size or self.adb_device.window_size()
+        self._lock = threading.Lock()
+        self._process = self.adb_device.shell(binary, stream=True)
+
+        # 转发到本地空闲端口
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.local_port = probe.getsockname()[1]
+        self.adb_device.forward(f"tcp:{self.local_port}", "localabstract:minitouch")
+
+        try:
+            self._sock, (self.max_x, self.max_y, self.max_pressure) = self._handshake(startup_timeout)
+        except Exception:
+            self._release()
+            raise
+        self.pressure = min(self.pressure, self.max_pressure)
+
+    def _handshake(self, timeout: float) -> Tuple[socket.socket, Tuple[int, int, int]]:
+        """连接minitouch并读取握手信息，直到成功或超时
+
+        minitouch还没有监听时，adb forward也会先接受本地连接，随后立即关闭，读到的是空数据；
+        因此连接和读取握手信息作为一个整体重试，而不是连接成功就认为minitouch已就绪。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = None
+            try:
+                remaining = max(deadline - time.monotonic(), 0.05)
+                sock = socket.create_connection(("127.0.0.1", self.local_port), timeout=remaining)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                header = self._read_header(sock)
+                sock.settimeout(None)
+                return sock, header
+            except OSError:
+                if sock is not None:
+                    sock.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    @staticmethod
+    def _read_header(sock: socket.socket) -> Tuple[int, int, int]:
+        """读取minitouch的握手信息: 'v <版本>'、'^ <最大触点> <max_x> <max_y> <最大压力>'、'$ <pid>'"""
+        buffer = b""
+        while buffer.count(b"\n") < 3:
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("minitouch连接已关闭")
+            buffer += chunk
+        for line in buffer.decode().splitlines():
+            if line.startswith("^"):
+                _, _, max_x, max_y, max_pressure = line.split()
+                return int(max_x), int(max_y), int(max_pressure)
+        raise ConnectionError(f"无法解析minitouch握手信息: {buffer!r}")
+
+    def tap(self, x: float, y: float) -> None:
+        width, height = self.screen_size
+        tx = int(x * self.max_x / width)
+        ty = int(y * self.max_y / height)
+        command = f"d 0 {tx} {ty} {self.pressure}\nc\nu 0\nc\n".encode()
+        with self._lock:
+            self._ensure_alive()
+            self._sock.sendall(command)
+
+    def _ensure_alive(self) -> None:
+        """写入前检查连接是否仍然有效（持有锁时调用）
+
+        minitouch进程退出后adb会关闭转发的连接，但之后的sendall仍可能写入本地缓冲区而不报错，点击被静默丢弃；
+        握手之后minitouch不再发送数据，非阻塞地窥探一次：读到EOF说明对端已关闭，抛出异常让调用方切换后端。
+        """
+        self._sock.setblocking(False)
+        try:
+            data = self._sock.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return
+        finally:
+            self._sock.setblocking(True)
+        if not data:
+            raise ConnectionError("minitouch连接已关闭")
+
+    def close(self) -> None:
+        try:
+            self._sock.close()
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """移除端口转发并结束minitouch进程，每个后端占用的本地端口都要归还"""
+        try:
+            self.adb_device.forward_remove(f"tcp:{self.local_port}", raise_non_found=False)
+        except Exception:
+            pass
+        finally:
+            self._process.close()
+
+
+class FallbackTouchBackend(TouchBackend):
+    """优先使用主后端，主后端出错（包括检测到minitouch连接已关闭）时永久切换到备用后端，本次点击由备用后端完成"""
+
+    def __init__(self, primary: TouchBackend, fallback: TouchBackend, logger: Logger):
+        self.primary = primary
+        self.fallback = fallback
+        self.logger = logger
+        self._active = primary
+
+    @property
+    def name(self) -> str:
+        return self._active.name
+
+    def tap(self, x: float, y: float) -> None:
+        if self._active is self.primary:
+            try:
+                self.primary.tap(x, y)
+                return
+            except Exception as e:
+                self.logger.error(f"触控后端 {self.primary.name} 出错，切换到 {self.fallback.name}: {str(e)}")
+                self._active = self.fallback
+                try:
+                    self.primary.close()
+                except Exception:
+                    pass
+        self.fallback.tap(x, y)
+
+    def close(self) -> None:
+        self.primary.close()
+        self.fallback.close()
+
+
+def create_touch_backend(device: u2.Device, config: DeviceConfig, logger: Logger) -> TouchBackend:
+    """根据设备配置创建触控后端
+
+    配置项（devices.yaml中每个设备）:
+        touch_backend: u2 / minitouch，默认u2
+        minitouch_path: 设备上minitouch的路径
+
+    Args:
+        device: 设备实例
+        config: 设备配置
+        logger: 日志记录器
+    Returns:
+        TouchBackend: 触控后端，minitouch不可用时退回u2
+    """
+    u2_backend = U2TouchBackend(device)
+    if config.touch_backend != 'minitouch':
+        return u2_backend
+
+    serial = getattr(device, 'serial', None) or config.connect_info
+    try:
+        width, height = device.window_size()
+        minitouch = MinitouchBackend(
+            serial,
+            binary=config.minitouch_path,
+            screen_size=(width, height)
+        )
+    except Exception as e:
+        logger.warning(f"minitouch不可用，使用u2点击: {str(e)}")
+        return u2_backend
+
+    return FallbackTouchBackend(minitouch, u2_backend, logger)
@@ -0,0 +1,145 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+import numpy as np
+import uiautomator2 as u2
+from utils.logger import Logger
+from core.capture import CaptureBackend
+
+# 等待条件：无参数、返回bool的可调用对象
+Condition = Callable[[], bool]
+
+
+@dataclass
+class WaitResult:
+    """一次等待的结果"""
+    ok: bool  # 条件是否在截止时间前满足
+    elapsed: float  # 实际等待时间（秒）
+    polls: int  # 轮询次数
+    description: str = ""
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+
+def activity_matches(device: u2.Device, predicate: Callable[[str], bool]) -> Condition:
+    """当前活动名称满足predicate时成立"""
+    def condition() -> bool:
+        return predicate(device.app_current().get('activity', '') or '')
+    return condition
+
+
+def package_is(device: u2.Device, package: str) -> Condition:
+    """当前前台应用为指定包名时成立"""
+    def condition() -> bool:
+        return device.app_current().get('package') == package
+    return condition
+
+
+def region_settled(source: Union[CaptureBackend, u2.Device],
+                   region: Optional[Tuple[int, int, int, int]] = None,
+                   threshold: float = 2.0,
+                   stable_polls: int = 2,
+                   step: int = 4) -> Condition:
+    """屏幕区域画面稳定（连续stable_polls次变化低于阈值）时成立
+
+    Args:
+        source: 截图后端（支持区域截图时只传输区域内的画面），或设备实例
+        region: 区域 (x1, y1, x2, y2)，None表示整个屏幕
+        threshold: 相邻两帧灰度平均绝对差的阈值
+        stable_polls: 需要连续稳定的次数
+        step: 降采样步长，越大越快但越不敏感
+    """
+    state = {'prev': None, 'stable': 0}
+
+    def condition() -> bool:
+        if isinstance(source, CaptureBackend):
+            frame = source.capture(region).image
+        else:
+            frame = source.screenshot(format='opencv')
+            if region is not None:
+                x1, y1, x2, y2 = region
+                frame = frame[y1:y2, x1:x2]
+        current = frame[::step, ::step].mean(axis=2, dtype=np.float32)
+        prev = state['prev']
+        state['prev'] = current
+        if prev is None or prev.shape != current.shape:
+            state['stable'] = 0
+            return False
+        if float(np.abs(current - prev).mean()) < threshold:
+            state['stable'] += 1
+        else:
+            state['stable'] = 0
+        return state['stable'] >= stable_polls
+    return condition
+
+
+def any_of(*conditions: Condition) -> Condition:
+    """任意一个条件成立时成立"""
+    def condition() -> bool:
+        return any(cond() for cond in conditions)
+    return condition
+
+
+class Waiter:
+    """条件驱动的等待器，替代固定时长的sleep
+
+    按poll_interval轮询条件，条件成立立即返回，超过timeout则放弃。
+    """
+
+    def __init__(self, logger: Logger, poll_interval: float = 0.2, default_timeout: float = 10.0,
+                 on_poll: Optional[Callable[[], None]] = None):
+        """初始化等待器
+
+        Args:
+            logger: 日志记录器
+            poll_interval: 默认轮询间隔（秒）
+            default_timeout: 默认超时时间（秒）
+            on_poll: 每次轮询前调用的回调，例如使界面快照失效
+        """
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.default_timeout = default_timeout
+        self.on_poll = on_poll
+
+    def until(self, condition: Condition, timeout: Optional[float] = None,
+              interval: Optional[float] = None, description: str = "") -> WaitResult:
+        """等待条件成立
+
+        Args:
+            condition: 等待条件
+            timeout: 超时时间（秒），None使用默认值
+            interval: 轮询间隔（秒），None使用默认值
+            description: 条件描述，用于日志
+        Returns:
+            WaitResult: 等待结果，包含实际等待时长
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        interval = self.poll_interval if interval is None else interval
+        start = time.monotonic()
+        deadline = start + timeout
+        polls = 0
+
+        while True:
+            polls += 1
+            if self.on_poll is not None:
+                self.on_poll()
+            try:
+                ok = bool(condition())
+            except Exception as e:
+                self.logger.debug(f"等待条件 '{description}' 检查出错: {str(e)}")
+                ok = False
+
+            now = time.monotonic()
+            if ok:
+                result = WaitResult(True, now - start, polls, description)
+                self.logger.info(f"等待 '{description}' 完成，耗时 {result.elapsed:.3f}秒（轮询{polls}次）")
+                return result
+
+            remaining = deadline - now
+            if remaining <= 0:
+                result = WaitResult(False, now - start, polls, description)
+                self.logger.warning(f"等待 '{description}' 超时，耗时 {result.elapsed:.3f}秒（轮询{polls}次）")
+                return result
+
+            time.sleep(min(interval, remaining))
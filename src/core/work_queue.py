@@ -0,0 +1,201 @@
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set
+
+
+@dataclass
+class WorkItem:
+    """工作队列中的一项：一个关键词的一份副本"""
+    keyword: str
+    replica: int  # 副本序号，同一关键词的各副本由不同设备执行
+    owner: str  # 初始分配到的设备
+    tried: Set[str] = field(default_factory=set)  # 执行过或正在执行的设备
+    running: Set[str] = field(default_factory=set)  # 正在执行的设备
+    started_at: Optional[float] = None  # 第一次开始执行的时刻（time.perf_counter()）
+    ready_at: float = 0.0  # 失败退回队列后最早可以再次执行的时刻（time.perf_counter()）
+    done_by: Optional[str] = None  # 最先完成的设备
+    failed: bool = False  # 所有可用的设备都失败或尝试次数用尽
+    attempts: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.done_by is not None or self.failed
+
+
+class KeywordWorkQueue:
+    """按设备分配、可窃取的关键词工作队列
+
+    每个关键词按replication生成多份副本，副本按轮询方式预先分到各设备的双端队列，
+    同一关键词的不同副本落在不同设备上。设备从自己队列的头部取下一项；
+    自己的队列空了就从剩余最多的设备队列尾部窃取，窃取不会让一台设备执行同一关键词的两份副本。
+    所有队列都空了而其他设备还在执行时，空闲设备为最早开始的未完成项做一次备份执行，
+    先完成的结果生效，慢设备手上的最后一项不会拖住整体的覆盖时间。
+    执行失败的项放回队列头部，等待retry_delay后由还没有尝试过它的设备接手，最多尝试max_attempts次。
+    """
+
+    def __init__(self, keywords: Sequence[str], devices: Sequence[str], replication: int = 1,
+                 max_attempts: int = 1, speculative: bool = True,
+                 retry_delay: Optional[Callable[[int], float]] = None):
+        """初始化工作队列
+
+        Args:
+            keywords: 关键词，按顺序分发
+            devices: 参与执行的设备
+            replication: 每个关键词需要多少台不同的设备完成，超过设备数时按设备数计
+            max_attempts: 每一项最多尝试的次数（不含备份执行）
+            speculative: 队列空了以后是否为其他设备正在执行的项做备份执行
+            retry_delay: 第n次失败（从0开始）的项退回队列后等待的时间（秒），None表示立即可以执行
+        """
+        self.devices = list(devices)
+        self.replication = max(1, min(replication, len(self.devices)))
+        self.max_attempts = max(1, max_attempts)
+        self.speculative = speculative
+        self.retry_delay = retry_delay
+        self.items: List[WorkItem] = []
+        self._queues: Dict[str, Deque[WorkItem]] = {device: deque() for device in self.devices}
+        self._covered: Dict[str, Set[str]] = {}  # 关键词 -> 执行过它任一副本的设备
+        self._condition = threading.Condition()
+        self._started = time.perf_counter()
+        self.finished_at: Optional[float] = None  # 所有项完成的时刻（time.perf_counter()）
+        self.stolen = 0  # 从其他设备队列窃取的次数
+        self.speculated = 0  # 备份执行的次数
+        slot = 0
+        for keyword in keywords:
+            self._covered.setdefault(keyword, set())
+            for replica in range(self.replication):
+                if not self.devices:
+                    break
+                owner = self.devices[slot % len(self.devices)]
+                slot += 1
+                item = WorkItem(keyword, replica, owner)
+                self.items.append(item)
+                self._queues[owner].append(item)
+        if not self.items:
+            self.finished_at = self._started
+
+    def take(self, device: str, timeout: Optional[float] = None) -> Optional[WorkItem]:
+        """取设备的下一项，没有可做的项但其他设备的项可能失败退回时等待
+
+        Args:
+            device: 设备ID
+            timeout: 最长等待时间（秒），None表示一直等到有项可做或全部完成
+        Returns:
+            Optional[WorkItem]: 下一项，全部完成、超时或该设备已无可做的项时为None
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                item = self._next(device)
+                if item is not None:
+                    self._covered[item.keyword].add(device)
+                    item.tried.add(device)
+                    item.running.add(device)
+                    if item.started_at is None:
+                        item.started_at = time.perf_counter()
+                    return item
+                # 只有退回后还在等待重试、或别的设备正在执行且失败后可能退回给本设备的项时才值得等待
+                now = time.perf_counter()
+                delays = [item.ready_at - now for item in self.items
+                          if self._delayed(item, now) and self._can_run(item, device)]
+                if not delays and not any(self._may_return(item, device) for item in self.items):
+                    return None
+                remaining = None if end is None else end - now
+                if remaining is not None and remaining <= 0:
+                    return None
+                if delays and (remaining is None or min(delays) < remaining):
+                    remaining = min(delays)
+                self._condition.wait(remaining)
+
+    def complete(self, item: WorkItem, device: str, ok: bool) -> None:
+        """记录设备执行一项的结果
+
+        Args:
+            item: take返回的项
+            device: 设备ID
+            ok: 是否成功
+        """
+        with self._condition:
+            item.running.discard(device)
+            if item.finished:
+                pass
+            elif ok:
+                item.done_by = device
+            elif not item.running:
+                # 备份执行还在进行时等它的结果，否则退回队列或放弃
+                item.attempts += 1
+                if item.attempts < self.max_attempts and self._has_candidate(item):
+                    if self.retry_delay is not None:
+                        item.ready_at = time.perf_counter() + self.retry_delay(item.attempts - 1)
+                    self._queues[item.owner].appendleft(item)
+                else:
+                    item.failed = True
+            if self.finished_at is None and all(item.finished for item in self.items):
+                self.finished_at = time.perf_counter()
+            self._condition.notify_all()
+
+    def coverage(self) -> Dict[str, List[str]]:
+        """各关键词由哪些设备完成"""
+        with self._condition:
+            result: Dict[str, List[str]] = {keyword: [] for keyword in self._covered}
+            for item in self.items:
+                if item.done_by is not None:
+                    result[item.keyword].append(item.done_by)
+            return result
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        """从创建队列到所有项完成的时间（秒），还有未完成的项时为None"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self._started
+
+    def _next(self, device: str) -> Optional[WorkItem]:
+        """按自己的队列、窃取、备份执行的顺序选出下一项（持有锁时调用）"""
+        own = self._pop(self._queues.get(device, deque()), device, from_left=True)
+        if own is not None:
+            return own
+        victims = sorted((queue for owner, queue in self._queues.items() if owner != device),
+                         key=len, reverse=True)
+        for queue in victims:
+            stolen = self._pop(queue, device, from_left=False)
+            if stolen is not None:
+                self.stolen += 1
+                return stolen
+        if not self.speculative:
+            return None
+        # 每项最多一个备份，选最早开始的
+        candidates = [item for item in self.items
+                      if not item.finished and len(item.running) == 1 and self._can_run(item, device)]
+        if not candidates:
+            return None
+        self.speculated += 1
+        return min(candidates, key=lambda item: item.started_at)
+
+    def _pop(self, queue: Deque[WorkItem], device: str, from_left: bool) -> Optional[WorkItem]:
+        """从队列一端取出第一项设备可以执行、且不在重试等待中的项"""
+        now = time.perf_counter()
+        order = range(len(queue)) if from_left else range(len(queue) - 1, -1, -1)
+        for index in order:
+            item = queue[index]
+            if item.ready_at <= now and self._can_run(item, device):
+                del queue[index]
+                return item
+        return None
+
+    def _can_run(self, item: WorkItem, device: str) -> bool:
+        """设备没有执行过这一项，也没有执行过同一关键词的其他副本"""
+        return device not in item.tried and device not in self._covered[item.keyword]
+
+    def _has_candidate(self, item: WorkItem) -> bool:
+        """还有设备可以接手失败的项"""
+        return any(self._can_run(item, device) for device in self.devices)
+
+    def _delayed(self, item: WorkItem, now: float) -> bool:
+        """失败退回队列、还在等待重试的项"""
+        return not item.finished and not item.running and item.ready_at > now
+
+    def _may_return(self, item: WorkItem, device: str) -> bool:
+        """别的设备正在执行的项失败后可能退回给本设备"""
+        return not item.finished and bool(item.running) and self._can_run(item, device)
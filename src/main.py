@@ -0,0 +1,76 @@
+"""按config.yaml中的时间窗口运行抢购
+
+连接所有设备后交给TimeWindowScheduler：窗口开始前lead_time秒在所有设备上执行arm（导航到搜索结果页、
+准备点击计划），开始时刻执行fire，在窗口内按interval重复直到成功或窗口结束。
+
+    python main.py [--config-dir ../config] [--max-windows N]
+"""
+import os
+import sys
+import argparse
+from typing import List, Optional
+from utils.logger import Logger
+from core.config_manager import ConfigManager
+from core.device_manager import DeviceManager
+from core.scheduler import TimeWindowScheduler, WindowRun
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_scheduler(config_manager: ConfigManager, manager: DeviceManager, logger: Logger) -> TimeWindowScheduler:
+    """创建驱动arm和fire的调度器，并把窗口的结束时刻作为设备操作重试的截止时刻"""
+    def prewarm() -> bool:
+        results = manager.arm_all_devices()
+        logger.info(f"预热结果: {results}")
+        return any(results.values())
+
+    def fire() -> bool:
+        # 点击不是幂等的，只要有设备执行完点击计划就不再重复触发
+        results = manager.fire_all_devices()
+        logger.info(f"触发结果: {results}")
+        return any(results.values())
+
+    def on_window_end(run: WindowRun) -> None:
+        manager.log_retry_report()
+
+    # process_workers大于0时，操作在工作进程中执行，导出时合并各进程的延迟统计
+    scheduler = TimeWindowScheduler.from_config(config_manager, logger, fire, prewarm=prewarm,
+                                                on_window_end=on_window_end,
+                                                metrics_source=manager.collect_metrics)
+    # 设备操作的重试不越过当前窗口的结束时刻
+    manager.deadline_source = scheduler.current_deadline
+    return scheduler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="按时间窗口在所有设备上执行抢购")
+    parser.add_argument("--config-dir", default=os.path.join(PROJECT_DIR, "config"), help="配置目录")
+    parser.add_argument("--max-windows", type=int, help="最多执行的窗口数，默认不限制")
+    args = parser.parse_args(argv)
+
+    config_manager = ConfigManager(args.config_dir)
+    settings = config_manager.settings
+    logger = Logger(config_manager.get_logging_config())
+    manager = DeviceManager(settings, logger)
+    manager.connect_devices()
+    if manager.get_connected_device_count() == 0:
+        logger.error("没有已连接的设备，退出")
+        return 1
+    # process_workers大于0时，connect_devices已经启动了多进程分片
+
+    scheduler = build_scheduler(config_manager, manager, logger)
+    try:
+        runs = scheduler.run(args.max_windows)
+    except KeyboardInterrupt:
+        logger.warning("收到中断，停止调度")
+        scheduler.stop()
+        runs = []
+    finally:
+        manager.disconnect_devices()
+        logger.info(f"触发偏差统计: {scheduler.drift_summary()}")
+        Logger.complete()
+    return 0 if all(run.success for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
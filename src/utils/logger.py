@@ -1,71 +1,139 @@
 import os
 import sys
+import threading
 from loguru import logger
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+# 配置日志格式
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+    "<level>{level: <8}</level> | "
+    "<magenta>{extra[device]}</magenta> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
+    "<level>{message}</level>"
+)
+
+# 未绑定设备的日志记录的设备字段
+MAIN_CONTEXT = "main"
+
 
 class Logger:
-    def __init__(self, config: Dict[str, Any]):
-        self.config = config
-        self._setup_logger()
-
-    def _setup_logger(self) -> None:
-        """配置日志系统"""
-        # 移除默认的处理器
-        logger.remove()
-
-        # 确保日志目录存在
-        log_dir = "logs"
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        # 配置日志格式
-        log_format = (
-            "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
-            "<level>{level: <8}</level> | "
-            "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
-            "<level>{message}</level>"
-        )
-
-        # 添加控制台输出
-        logger.add(
-            sys.stderr,
-            format=log_format,
-            level=self.config.get('level', 'INFO'),
-            colorize=True
-        )
-
-        # 添加文件输出
-        logger.add(
-            os.path.join(log_dir, "bot_{time}.log"),
-            format=log_format,
-            level=self.config.get('level', 'INFO'),
-            rotation=self.config.get('rotation', "1 day"),
-            retention=self.config.get('retention', "7 days"),
-            compression="zip",
-            encoding="utf-8"
-        )
+    """日志记录器
+
+    日志处理器在进程内只配置一次，所有处理器都使用 enqueue=True，
+    写盘、轮转和压缩都在后台线程完成，调用日志方法时不会阻塞在磁盘I/O上。
+    通过for_device获取绑定了设备名称的记录器，每个设备的日志同时写入单独的文件。
+    """
+
+    _lock = threading.Lock()
+    _config: Optional[Dict[str, Any]] = None
+    _device_sinks: Dict[str, int] = {}
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, device: str = MAIN_CONTEXT):
+        """初始化日志记录器
+
+        Args:
+            config: 日志配置，只有进程内第一次提供时生效
+            device: 日志记录的设备字段
+        """
+        self._setup_logger(config or {})
+        self.config = Logger._config
+        self.device = device
+        # depth=1 使日志中的函数名和行号指向调用方而不是本类
+        self._logger = logger.bind(device=device).opt(depth=1)
+
+    @classmethod
+    def _setup_logger(cls, config: Dict[str, Any]) -> None:
+        """配置日志系统（进程内只执行一次）"""
+        with cls._lock:
+            if cls._config is not None:
+                return
+            cls._config = config
+
+            # 移除默认的处理器
+            logger.remove()
+            logger.configure(extra={"device": MAIN_CONTEXT})
+
+            # 确保日志目录存在
+            log_dir = config.get('dir', "logs")
+            os.makedirs(log_dir, exist_ok=True)
+
+            # 添加控制台输出
+            logger.add(
+                sys.stderr,
+                format=LOG_FORMAT,
+                level=config.get('level', 'INFO'),
+                colorize=True,
+                enqueue=True
+            )
+
+            # 添加文件输出
+            logger.add(
+                os.path.join(log_dir, "bot_{time}.log"),
+                format=LOG_FORMAT,
+                level=config.get('level', 'INFO'),
+                rotation=config.get('rotation', "1 day"),
+                retention=config.get('retention', "7 days"),
+                compression="zip",
+                encoding="utf-8",
+                enqueue=True
+            )
+
+    @classmethod
+    def _add_device_sink(cls, device: str) -> None:
+        """为设备添加单独的日志文件（每个设备只添加一次）"""
+        config = cls._config
+        if not config.get('per_device_files', True):
+            return
+        with cls._lock:
+            if device in cls._device_sinks:
+                return
+            device_dir = os.path.join(config.get('dir', "logs"), "devices")
+            os.makedirs(device_dir, exist_ok=True)
+            cls._device_sinks[device] = logger.add(
+                os.path.join(device_dir, f"{device}_{{time}}.log"),
+                format=LOG_FORMAT,
+                level=config.get('level', 'INFO'),
+                rotation=config.get('rotation', "1 day"),
+                retention=config.get('retention', "7 days"),
+                compression="zip",
+                encoding="utf-8",
+                enqueue=True,
+                filter=lambda record: record["extra"].get("device") == device
+            )
+
+    def for_device(self, device: str) -> "Logger":
+        """获取绑定了设备名称的记录器，不会重新配置日志处理器
+
+        Args:
+            device: 设备名称
+        Returns:
+            Logger: 日志记录中带有设备名称、并同时写入该设备日志文件的记录器
+        """
+        self._add_device_sink(device)
+        return Logger(device=device)
 
     @staticmethod
-    def debug(message: str) -> None:
+    def complete() -> None:
+        """等待后台队列中的日志全部写出（程序退出前调用）"""
+        logger.complete()
+
+    def debug(self, message: str) -> None:
         """输出调试日志"""
-        logger.debug(message)
+        self._logger.debug(message)
 
-    @staticmethod
-    def info(message: str) -> None:
+    def info(self, message: str) -> None:
         """输出信息日志"""
-        logger.info(message)
+        self._logger.info(message)
 
-    @staticmethod
-    def warning(message: str) -> None:
+    def warning(self, message: str) -> None:
         """输出警告日志"""
-        logger.warning(message)
+        self._logger.warning(message)
 
-    @staticmethod
-    def error(message: str) -> None:
+    def error(self, message: str) -> None:
         """输出错误日志"""
-        logger.error(message)
+        self._logger.error(message)
 
-    @staticmethod
-    def critical(message: str) -> None:
+    def critical(self, message: str) -> None:
         """输出严重错误日志"""
-        logger.critical(message)
+        self._logger.critical(message)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# 每个2的幂区间再细分为 2**_SUB_BITS 个桶，相对误差不超过 1/2**_SUB_BITS
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+
+
+def _bucket_index(value: int) -> int:
+    """微秒值到桶序号（对数-线性分桶）"""
+    if value < _SUB_COUNT:
+        return max(value, 0)
+    shift = value.bit_length() - _SUB_BITS - 1
+    return ((shift + 1) << _SUB_BITS) + ((value >> shift) - _SUB_COUNT)
+
+
+def _bucket_value(index: int) -> float:
+    """桶序号到桶中点的微秒值"""
+    if index < _SUB_COUNT:
+        return float(index)
+    shift = (index >> _SUB_BITS) - 1
+    lower = ((index & (_SUB_COUNT - 1)) + _SUB_COUNT) << shift
+    return lower + (1 << shift) / 2
+
+
+class Histogram:
+    """固定内存的延迟直方图（微秒）"""
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, micros: int) -> None:
+        index = _bucket_index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        if self.count == 0 or micros < self.min:
+            self.min = micros
+        if micros > self.max:
+            self.max = micros
+        self.count += 1
+        self.total += micros
+
+    def merge(self, other: "Histogram") -> None:
+        """合并另一个直方图（例如来自工作进程）"""
+        if other.count == 0:
+            return
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        if self.count == 0 or other.min < self.min:
+            self.min = other.min
+        if other.max > self.max:
+            self.max = other.max
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q: float) -> float:
+        """分位数（微秒），q取值0~1"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(_bucket_value(index), self.min), self.max)
+        return float(self.max)
+
+    def summary(self) -> Dict[str, float]:
+        """统计摘要（毫秒）"""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            "min_ms": self.min / 1000,
+            "p50_ms": self.percentile(0.50) / 1000,
+            "p95_ms": self.percentile(0.95) / 1000,
+            "p99_ms": self.percentile(0.99) / 1000,
+            "max_ms": self.max / 1000,
+        }
+
+
+class Metrics:
+    """按设备、步骤统计延迟的指标注册表"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, device: str, step: str, micros: int) -> None:
+        """记录一次耗时（微秒）"""
+        key = (device, step)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(micros)
+
+    @contextmanager
+    def span(self, device: str, step: str) -> Iterator[None]:
+        """统计代码块耗时，异常时同样记录"""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(device, step, (time.perf_counter_ns() - start) // 1000)
+
+    def snapshot(self) -> Dict[Tuple[str, str], Histogram]:
+        """所有直方图的副本: {(设备, 步骤): 直方图}，可跨进程传递"""
+        snapshot: Dict[Tuple[str, str], Histogram] = {}
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                copy = snapshot[key] = Histogram()
+                copy.merge(histogram)
+        return snapshot
+
+    def merge(self, histograms: Dict[Tuple[str, str], Histogram]) -> None:
+        """合并snapshot()的结果"""
+        with self._lock:
+            for key, histogram in histograms.items():
+                target = self._histograms.get(key)
+                if target is None:
+                    target = self._histograms[key] = Histogram()
+                target.merge(histogram)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """所有设备、步骤的统计摘要: {设备: {步骤: 摘要}}"""
+        with self._lock:
+            items = list(self._histograms.items())
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (device, step), histogram in sorted(items):
+            result.setdefault(device, {})[step] = histogram.summary()
+        return result
+
+    def to_prometheus(self, metric: str = "mini_bot_step_latency_seconds") -> str:
+        """导出为Prometheus文本格式（summary类型）"""
+        lines = [
+            f"# HELP {metric} Latency of automation steps per device.",
+            f"# TYPE {metric} summary",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+        for (device, step), histogram in items:
+            labels = f'device="{device}",step="{step}"'
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'{metric}{{{labels},quantile="{q}"}} {histogram.percentile(q) / 1e6:.6f}')
+            lines.append(f"{metric}_sum{{{labels}}} {histogram.total / 1e6:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str, name: Optional[str] = None) -> Tuple[str, str]:
+        """将统计结果写入JSON文件和Prometheus文本文件
+
+        Args:
+            directory: 输出目录
+            name: 文件名前缀，默认使用当前时间
+        Returns:
+            Tuple[str, str]: (JSON文件路径, Prometheus文件路径)
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = name or time.strftime("metrics_%Y%m%d_%H%M%S")
+        json_path = os.path.join(directory, f"{name}.json")
+        prom_path = os.path.join(directory, f"{name}.prom")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+    def reset(self) -> None:
+        """清空所有统计"""
+        with self._lock:
+            self._histograms.clear()
+
+
+# 进程内默认的指标注册表
+metrics = Metrics()
+
+
+def timed(step: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """方法装饰器：按 self.device_name 和步骤名统计耗时"""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with metrics.span(self.device_name, step):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与在src目录下运行main.py一致，模块按 core.xxx / utils.xxx 导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
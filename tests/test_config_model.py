@@ -0,0 +1,104 @@
+import os
+import datetime
+import pytest
+import yaml
+from core.config_model import ConfigError, compile_config
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+
+def compile_error(**kwargs) -> str:
+    with pytest.raises(ConfigError) as info:
+        compile_config(**kwargs)
+    return str(info.value)
+
+
+def test_project_config_compiles():
+    with open(os.path.join(CONFIG_DIR, "config.yaml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    with open(os.path.join(CONFIG_DIR, "devices.yaml"), encoding="utf-8") as f:
+        devices = yaml.safe_load(f)["devices"]
+    settings = compile_config(config, devices)
+    assert settings.devices
+    assert settings.device(settings.devices[0].name) is settings.devices[0]
+
+
+def test_defaults():
+    settings = compile_config()
+    assert settings.devices == ()
+    assert settings.search.keywords == ("啤酒",)
+    assert settings.operation.batch_input is False
+
+
+def test_time_window():
+    settings = compile_config({"time_windows": [{"start_time": "09:59:50", "end_time": "10:00:30", "interval": 0.5}]})
+    window = settings.time_windows[0]
+    assert window.start == datetime.time(9, 59, 50)
+    assert window.interval == 0.5
+
+
+@pytest.mark.parametrize("config, path", [
+    ({"time_windows": {"start_time": "10:00:00"}}, "config.yaml:time_windows"),
+    ({"time_windows": [{"start_time": "10:00", "end_time": "10:01:00"}]}, "config.yaml:time_windows[0].start_time"),
+    ({"time_windows": [{"start_time": "10:00:00", "end_time": "10:01:00", "interval": 0}]},
+     "config.yaml:time_windows[0].interval"),
+    ({"search": {"keywords": []}}, "config.yaml:search.keywords"),
+    ({"search": {"timeout": "5"}}, "config.yaml:search.timeout"),
+    ({"search": {"replication": 1.5}}, "config.yaml:search.replication"),
+    ({"operation": {"retry_times": -1}}, "config.yaml:operation.retry_times"),
+    ({"operation": {"batch_input": "yes"}}, "config.yaml:operation.batch_input"),
+    ({"operation": {"click_interval": True}}, "config.yaml:operation.click_interval"),
+    ({"search": ["啤酒"]}, "config.yaml:search"),
+])
+def test_invalid_config_fields(config, path):
+    assert compile_error(config=config).startswith(path + ":")
+
+
+@pytest.mark.parametrize("device, path", [
+    ({"name": "d1", "touch_backend": "adb"}, "devices.yaml:devices[0].touch_backend"),
+    ({"name": "d1", "capture_mode": "png"}, "devices.yaml:devices[0].capture_mode"),
+    ({"name": "d1", "resolution": [1080]}, "devices.yaml:devices[0].resolution"),
+    ({"name": "d1", "click_points": {"search_box": [-1, 10]}}, "devices.yaml:devices[0].click_points.search_box"),
+    ({"name": "d1", "port": 0}, "devices.yaml:devices[0].port"),
+    ({"port": 5554}, "devices.yaml:devices[0].name"),
+])
+def test_invalid_device_fields(device, path):
+    assert compile_error(devices=[device]).startswith(path + ":")
+
+
+def test_devices_must_be_list():
+    assert compile_error(devices={"name": "d1"}).startswith("devices.yaml:devices:")
+
+
+def test_duplicate_device_name():
+    message = compile_error(devices=[{"name": "d1", "port": 5554}, {"name": "d1", "port": 5556}])
+    assert message.startswith("devices.yaml:devices[1].name:")
+
+
+def test_duplicate_connect_info():
+    message = compile_error(devices=[{"name": "d1", "port": 5554}, {"name": "d2", "connect_info": "emulator-5554"}])
+    assert message.startswith("devices.yaml:devices[1].connect_info:")
+
+
+def test_invalid_options():
+    message = compile_error(multi_device={"options": {"max_concurrency": 0}})
+    assert message.startswith("multi_device_config.json:options.max_concurrency:")
+
+
+def test_multi_device_merged_by_connect_info():
+    settings = compile_config(
+        devices=[{"name": "d1", "port": 5554}],
+        multi_device={"devices": {"emu": {"connect_info": "emulator-5554", "capture_mode": "raw"}}},
+    )
+    assert len(settings.devices) == 1
+    assert settings.device("emu") is settings.device("d1")
+    assert settings.device("d1").capture_mode == "raw"
+    assert settings.device_by_serial("emulator-5554").name == "d1"
+
+
+def test_device_inherits_global_sections():
+    settings = compile_config({"search": {"keywords": ["牛奶"]}, "operation": {"retry_times": 1}},
+                              [{"name": "d1", "port": 5554}])
+    device = settings.device("d1")
+    assert device.operation.retry_times == 1
+    assert device.miniprogram.search_keyword == "牛奶"
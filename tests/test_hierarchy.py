@@ -0,0 +1,98 @@
+import time
+from core.hierarchy import HierarchyCache, HierarchySnapshot, hierarchy_text_exists
+
+XML = """<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<hierarchy rotation="0">
+  <node text="" class="android.widget.FrameLayout" package="com.tencent.mm" bounds="[0,0][1080,1920]">
+    <node text="" resource-id="com.tencent.mm:id/search" class="android.widget.EditText"
+          clickable="true" focused="true" bounds="[100,200][980,280]" />
+    <node text="加入购物车" class="android.widget.TextView" clickable="true" bounds="[600,600][900,660]" />
+    <node text="加入购物车" class="android.widget.TextView" clickable="false" bounds="[600,900][900,960]" />
+    <node text="购物车" class="android.widget.TextView" clickable="true" enabled="false" bounds="[0,1800][300,1920]" />
+  </node>
+</hierarchy>
+"""
+
+
+class CountingDevice:
+    """只实现dump_hierarchy的设备，记录dump次数"""
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.dumps = 0
+
+    def dump_hierarchy(self):
+        self.dumps += 1
+        return self.xml
+
+
+def test_node_attributes():
+    node = HierarchySnapshot(XML).first(resource_id="com.tencent.mm:id/search")
+    assert node.class_name == "android.widget.EditText"
+    assert node.clickable and node.focused and node.enabled
+    assert node.bounds == (100, 200, 980, 280)
+    assert node.center == (540, 240)
+
+
+def test_find_by_text_in_document_order():
+    nodes = HierarchySnapshot(XML).find(text="加入购物车")
+    assert [node.bounds[1] for node in nodes] == [600, 900]
+
+
+def test_find_combines_conditions():
+    snapshot = HierarchySnapshot(XML)
+    assert [node.bounds[1] for node in snapshot.find(text="加入购物车", clickable=False)] == [900]
+    assert len(snapshot.find(class_name="android.widget.TextView")) == 3
+    assert snapshot.find(class_name="android.widget.TextView", focused=True) == []
+    assert snapshot.first(text="购物车").enabled is False
+
+
+def test_missing_nodes():
+    snapshot = HierarchySnapshot(XML)
+    assert snapshot.first(text="去结算") is None
+    assert not snapshot.exists(resource_id="missing")
+    assert snapshot.exists(text="购物车")
+
+
+def test_text_checks():
+    snapshot = HierarchySnapshot(XML)
+    assert snapshot.has_any_text(["去结算", "购物车"])
+    assert not snapshot.has_any_text(["去结算"])
+    assert snapshot.has_all_texts(["购物车", "加入购物车"])
+    assert not snapshot.has_all_texts(["购物车", "去结算"])
+    # 空文本不进入文本索引
+    assert not snapshot.has_any_text([""])
+
+
+def test_find_without_selector_returns_all_nodes():
+    assert len(HierarchySnapshot(XML).find()) == 5
+
+
+def test_cache_reuses_snapshot_until_invalidated():
+    device = CountingDevice(XML)
+    cache = HierarchyCache(device, ttl=60)
+    first = cache.snapshot()
+    assert cache.snapshot() is first
+    assert device.dumps == 1
+    cache.invalidate()
+    assert cache.snapshot() is not first
+    assert device.dumps == 2
+    cache.refresh()
+    assert device.dumps == 3
+
+
+def test_cache_expires_after_ttl():
+    device = CountingDevice(XML)
+    cache = HierarchyCache(device, ttl=0.01)
+    cache.snapshot()
+    time.sleep(0.02)
+    cache.snapshot()
+    assert device.dumps == 2
+
+
+def test_text_exists_condition():
+    device = CountingDevice(XML)
+    cache = HierarchyCache(device, ttl=60)
+    assert hierarchy_text_exists(cache, "去结算", "购物车")()
+    assert not hierarchy_text_exists(cache, "去结算")()
+    assert device.dumps == 1
@@ -0,0 +1,107 @@
+import pickle
+import pytest
+from utils.metrics import Histogram, Metrics
+
+
+def test_empty_histogram():
+    histogram = Histogram()
+    assert histogram.percentile(0.5) == 0.0
+    assert histogram.summary()["count"] == 0
+    assert histogram.summary()["mean_ms"] == 0.0
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for micros in range(1, 11):
+        histogram.record(micros)
+    assert histogram.percentile(0.5) == 5
+    assert histogram.percentile(1.0) == 10
+    assert histogram.min == 1 and histogram.max == 10
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.95, 0.99])
+def test_percentile_relative_error(q):
+    # 对数-线性分桶，每个2的幂区间16个桶，相对误差不超过1/16
+    histogram = Histogram()
+    values = list(range(100, 100_001, 100))
+    for micros in values:
+        histogram.record(micros)
+    expected = values[int(q * len(values)) - 1]
+    assert abs(histogram.percentile(q) - expected) / expected <= 1 / 16
+
+
+def test_percentile_clamped_to_observed_range():
+    histogram = Histogram()
+    histogram.record(1000)
+    assert histogram.percentile(0.01) == 1000
+    assert histogram.percentile(0.99) == 1000
+
+
+def test_summary_in_milliseconds():
+    histogram = Histogram()
+    for micros in (1000, 2000, 3000):
+        histogram.record(micros)
+    summary = histogram.summary()
+    assert summary["count"] == 3
+    assert summary["mean_ms"] == pytest.approx(2.0)
+    assert summary["min_ms"] == 1.0
+    assert summary["max_ms"] == 3.0
+
+
+def test_summary_groups_by_device_and_step():
+    registry = Metrics()
+    registry.record("dev1", "launch", 1000)
+    registry.record("dev1", "search", 2000)
+    registry.record("dev2", "launch", 3000)
+    summary = registry.summary()
+    assert set(summary) == {"dev1", "dev2"}
+    assert set(summary["dev1"]) == {"launch", "search"}
+    assert summary["dev2"]["launch"]["max_ms"] == 3.0
+
+
+def test_prometheus_output():
+    registry = Metrics()
+    registry.record("dev1", "launch", 1500)
+    registry.record("dev1", "launch", 2500)
+    lines = registry.to_prometheus("latency").splitlines()
+    assert lines[0].startswith("# HELP latency ")
+    assert lines[1] == "# TYPE latency summary"
+    labels = 'device="dev1",step="launch"'
+    quantiles = [line for line in lines if "quantile=" in line]
+    assert [line.split("quantile=")[1].split("}")[0] for line in quantiles] == ['"0.5"', '"0.95"', '"0.99"']
+    assert f"latency_sum{{{labels}}} 0.004000" in lines
+    assert f"latency_count{{{labels}}} 2" in lines
+    for line in quantiles:
+        assert 0.0015 <= float(line.rsplit(" ", 1)[1]) <= 0.0025
+
+
+def test_span_records_on_exception():
+    registry = Metrics()
+    with pytest.raises(ValueError):
+        with registry.span("dev1", "step"):
+            raise ValueError()
+    assert registry.summary()["dev1"]["step"]["count"] == 1
+
+
+def test_reset():
+    registry = Metrics()
+    registry.record("dev1", "launch", 1000)
+    registry.reset()
+    assert registry.summary() == {}
+
+
+def test_merge_snapshot():
+    worker = Metrics()
+    worker.record("dev2", "execute", 3000)
+    worker.record("dev1", "launch", 500)
+    snapshot = pickle.loads(pickle.dumps(worker.snapshot()))
+    registry = Metrics()
+    registry.record("dev1", "launch", 1500)
+    registry.merge(snapshot)
+    summary = registry.summary()
+    assert summary["dev1"]["launch"]["count"] == 2
+    assert summary["dev1"]["launch"]["min_ms"] == 0.5
+    assert summary["dev1"]["launch"]["max_ms"] == 1.5
+    assert summary["dev2"]["execute"]["count"] == 1
+    # 快照是副本，合并不影响原注册表
+    assert worker.summary()["dev1"]["launch"]["count"] == 1
@@ -0,0 +1,25 @@
+import time
+from core.orchestrator import AsyncOrchestrator
+
+
+class RecordingLogger:
+    """记录各级别日志的记录器"""
+
+    def __init__(self):
+        self.messages = []
+
+    def __getattr__(self, level):
+        return lambda message: self.messages.append((level, message))
+
+
+def test_timeout_starts_when_call_runs():
+    orchestrator = AsyncOrchestrator(RecordingLogger(), max_concurrency=1)
+    durations = {"slow": 0.5, "fast": 0.1}
+    try:
+        # slow超时后仍占着唯一的线程，fast排队期间不计时，开始执行后在时限内完成
+        results = orchestrator.run(["slow", "fast"], lambda device_id: time.sleep(durations[device_id]) or True,
+                                   timeout=0.25)
+    finally:
+        orchestrator.shutdown()
+    assert results == {"slow": False, "fast": True}
+
@@ -0,0 +1,138 @@
+import time
+import pickle
+import pytest
+from core.config_model import ConfigError, OperationConfig, OptionsConfig
+from core.retry import (ErrorKind, FatalError, RetryPolicy, WithDeadline, call_with_retry, classify_error,
+                        retry_stats)
+
+
+class RecordingLogger:
+    """记录各级别日志的记录器"""
+
+    def __init__(self):
+        self.messages = []
+
+    def __getattr__(self, level):
+        return lambda message: self.messages.append((level, message))
+
+
+class Flaky:
+    """前failures次失败（返回假值或抛出异常），之后返回True"""
+
+    def __init__(self, failures, error=None):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.error is not None:
+                raise self.error
+            return False
+        return True
+
+
+class Target:
+    deadline = None
+
+
+def take_deadline(target):
+    return target.deadline
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    retry_stats.reset()
+    yield
+    retry_stats.reset()
+
+
+def test_delay_backoff_and_cap():
+    policy = RetryPolicy(retries=5, interval=0.5, backoff=2.0, max_interval=3.0)
+    assert [policy.delay(n) for n in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_policies_from_config():
+    assert RetryPolicy.for_operation(OperationConfig(click_interval=0.2, retry_times=4)) == RetryPolicy(4, 0.2)
+    assert RetryPolicy.for_device(OptionsConfig(retry_count=1, retry_interval=2.0)) == RetryPolicy(1, 2.0)
+
+
+def test_classify_error():
+    assert classify_error(TimeoutError()) == ErrorKind.TRANSIENT
+    assert classify_error(ConnectionError()) == ErrorKind.TRANSIENT
+    assert classify_error(FatalError()) == ErrorKind.FATAL
+    assert classify_error(ConfigError("x")) == ErrorKind.FATAL
+    assert classify_error(KeyError("x")) == ErrorKind.FATAL
+
+
+def test_succeeds_after_retries():
+    func = Flaky(2)
+    assert call_with_retry(func, RetryPolicy(3, 0.001), RecordingLogger(), "dev1", "search") is True
+    assert func.calls == 3
+    counters = retry_stats.summary()["dev1"]["search"]
+    assert (counters["calls"], counters["attempts"], counters["retries"], counters["gave_up"]) == (1, 3, 2, 0)
+
+
+def test_gives_up_after_retries():
+    func = Flaky(10)
+    logger = RecordingLogger()
+    assert call_with_retry(func, RetryPolicy(2, 0.001), logger, "dev1", "search") is False
+    assert func.calls == 3
+    assert retry_stats.summary()["dev1"]["search"]["gave_up"] == 1
+    assert logger.messages[-1][0] == "error"
+
+
+def test_transient_error_retried_and_reraised():
+    func = Flaky(1, TimeoutError("slow"))
+    assert call_with_retry(func, RetryPolicy(1, 0.001), RecordingLogger(), "dev1", "launch") is True
+
+    func = Flaky(10, TimeoutError("slow"))
+    with pytest.raises(TimeoutError):
+        call_with_retry(func, RetryPolicy(1, 0.001), RecordingLogger(), "dev1", "launch")
+    assert func.calls == 2
+
+
+def test_fatal_error_not_retried():
+    func = Flaky(10, FatalError("not installed"))
+    with pytest.raises(FatalError):
+        call_with_retry(func, RetryPolicy(5, 0.001), RecordingLogger(), "dev1", "launch")
+    assert func.calls == 1
+
+
+def test_zero_retries_is_single_shot():
+    func = Flaky(1)
+    assert call_with_retry(func, RetryPolicy(0, 0.001), RecordingLogger(), "dev1", "search") is False
+    assert func.calls == 1
+
+
+def test_deadline_stops_retries_that_cannot_finish():
+    # 退避等待1秒，但只剩0.2秒：不再重试
+    func = Flaky(10)
+    start = time.monotonic()
+    result = call_with_retry(func, RetryPolicy(5, 1.0), RecordingLogger(), "dev1", "search", time.time() + 0.2)
+    assert result is False
+    assert func.calls == 1
+    assert time.monotonic() - start < 0.5
+
+
+def test_deadline_allows_retries_that_fit():
+    func = Flaky(2)
+    result = call_with_retry(func, RetryPolicy(5, 0.01), RecordingLogger(), "dev1", "search", time.time() + 5)
+    assert result is True
+    assert func.calls == 3
+
+
+def test_expired_deadline_single_attempt():
+    func = Flaky(10)
+    assert call_with_retry(func, RetryPolicy(5, 0.0), RecordingLogger(), "dev1", "search", time.time() - 1) is False
+    assert func.calls == 1
+
+
+def test_with_deadline_sets_and_restores():
+    target = Target()
+    wrapped = WithDeadline(take_deadline, 123.0)
+    assert wrapped(target) is True
+    assert target.deadline is None
+    # 可以pickle后发送到工作进程
+    assert pickle.loads(pickle.dumps(wrapped)).deadline == 123.0
@@ -0,0 +1,146 @@
+import time
+import threading
+from core.work_queue import KeywordWorkQueue
+
+
+def drain(queue, device, ok=True):
+    """设备依次完成能取到的所有项，返回完成的关键词"""
+    done = []
+    while True:
+        item = queue.take(device, timeout=0)
+        if item is None:
+            return done
+        queue.complete(item, device, ok)
+        done.append(item.keyword)
+
+
+def test_round_robin_assignment():
+    queue = KeywordWorkQueue(["a", "b", "c", "d"], ["d1", "d2"])
+    assert [item.owner for item in queue.items] == ["d1", "d2", "d1", "d2"]
+    assert queue.take("d1").keyword == "a"
+    assert queue.take("d2").keyword == "b"
+
+
+def test_idle_device_steals_from_tail_of_longest_queue():
+    queue = KeywordWorkQueue(["a", "b", "c", "d", "e", "f"], ["d1", "d2", "d3"])
+    # 各设备分到 d1: a d / d2: b e / d3: c f；d1做完自己的两项后，每次从剩余最多的队列尾部窃取
+    assert drain(queue, "d1") == ["a", "d", "e", "f", "b", "c"]
+    assert queue.stolen == 4
+
+
+def test_single_device_covers_everything():
+    queue = KeywordWorkQueue(["a", "b", "c"], ["d1", "d2"], speculative=False)
+    assert sorted(drain(queue, "d1")) == ["a", "b", "c"]
+    assert queue.elapsed is not None
+    assert drain(queue, "d2") == []
+
+
+def test_replicas_run_on_distinct_devices():
+    queue = KeywordWorkQueue(["a", "b"], ["d1", "d2", "d3"], replication=2, speculative=False)
+    for device in ("d1", "d2", "d3"):
+        drain(queue, device)
+    coverage = queue.coverage()
+    for keyword in ("a", "b"):
+        assert len(coverage[keyword]) == 2
+        assert len(set(coverage[keyword])) == 2
+
+
+def test_replication_capped_by_device_count():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"], replication=5)
+    assert queue.replication == 2
+    assert len(queue.items) == 2
+
+
+def test_failed_item_goes_to_another_device():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"], max_attempts=2, speculative=False)
+    item = queue.take("d1")
+    queue.complete(item, "d1", False)
+    assert not item.finished
+    # 执行过的设备不会再拿到它
+    assert queue.take("d1", timeout=0) is None
+    retried = queue.take("d2", timeout=0)
+    assert retried is item
+    queue.complete(retried, "d2", True)
+    assert queue.coverage() == {"a": ["d2"]}
+    assert item.attempts == 1
+
+
+def test_max_attempts_exhausted():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2", "d3"], max_attempts=2, speculative=False)
+    queue.complete(queue.take("d1"), "d1", False)
+    item = queue.take("d2")
+    queue.complete(item, "d2", False)
+    assert item.failed
+    assert queue.take("d3", timeout=0) is None
+    assert queue.coverage() == {"a": []}
+    assert queue.elapsed is not None
+
+
+def test_failed_item_waits_retry_delay():
+    delays = []
+
+    def retry_delay(retry):
+        delays.append(retry)
+        return 0.05
+
+    queue = KeywordWorkQueue(["a"], ["d1", "d2", "d3"], max_attempts=3, speculative=False, retry_delay=retry_delay)
+    queue.complete(queue.take("d1"), "d1", False)
+    # 等待期间不能立即取到，但值得等待
+    assert queue.take("d2", timeout=0) is None
+    start = time.perf_counter()
+    item = queue.take("d2", timeout=5)
+    assert item is not None and item.keyword == "a"
+    assert time.perf_counter() - start >= 0.03
+    queue.complete(item, "d2", False)
+    assert queue.take("d3", timeout=5) is item
+    assert delays == [0, 1]
+
+
+def test_single_attempt_by_default():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"], speculative=False)
+    item = queue.take("d1")
+    queue.complete(item, "d1", False)
+    assert item.failed
+
+
+def test_speculative_backup_first_result_wins():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"])
+    slow = queue.take("d1")
+    backup = queue.take("d2", timeout=0)
+    assert backup is slow
+    assert queue.speculated == 1
+    queue.complete(backup, "d2", True)
+    queue.complete(slow, "d1", False)
+    assert slow.done_by == "d2"
+    assert not slow.failed
+
+
+def test_backup_failure_waits_for_original():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"])
+    original = queue.take("d1")
+    backup = queue.take("d2", timeout=0)
+    queue.complete(backup, "d2", False)
+    assert not original.finished
+    queue.complete(original, "d1", True)
+    assert original.done_by == "d1"
+
+
+def test_take_waits_for_item_that_may_return():
+    queue = KeywordWorkQueue(["a"], ["d1", "d2"], max_attempts=2, speculative=False)
+    item = queue.take("d1")
+    result = {}
+
+    def waiter():
+        result["item"] = queue.take("d2", timeout=5)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    queue.complete(item, "d1", False)
+    thread.join(5)
+    assert result["item"] is item
+
+
+def test_empty_queue():
+    queue = KeywordWorkQueue([], ["d1"])
+    assert queue.take("d1", timeout=0) is None
+    assert queue.elapsed is not None